@@ -0,0 +1,51 @@
+# WinPKR index deployment
+# Run at deploy time to bring MongoDB indexes in line with services/index_service.INDEXES
+#
+#   python apply_indexes.py            create missing indexes, report drift
+#   python apply_indexes.py --check    report drift only
+#   python apply_indexes.py --prune    also drop indexes that are not in the spec
+
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.index_service import apply_indexes, index_drift
+
+load_dotenv(Path(__file__).parent / '.env')
+
+
+async def main(check_only: bool, prune: bool):
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+    print("\n=== WinPKR Index Deployment ===")
+
+    if not check_only:
+        result = await apply_indexes(db, drop_unexpected=prune)
+        for name in result["created"]:
+            print(f"  + created {name}")
+        for name in result["dropped"]:
+            print(f"  - dropped {name}")
+
+    drift = await index_drift(db)
+    for item in drift["missing"]:
+        print(f"  ! missing {item['collection']}.{item['name']} ({item['purpose']})")
+    for item in drift["conflicting"]:
+        print(f"  ! conflicting {item['collection']}.{item['name']}: {'; '.join(item['differences'])}")
+    for item in drift["unexpected"]:
+        print(f"  ? not in spec {item['collection']}.{item['name']}")
+
+    print("\n✓ Indexes in sync" if drift["in_sync"] else "\n⚠️  Index drift remains (see above)")
+    client.close()
+    return 0 if not (drift["missing"] or drift["conflicting"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main("--check" in sys.argv, "--prune" in sys.argv)))
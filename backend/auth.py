@@ -1,10 +1,17 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import asyncio
+import hashlib
 import os
+import time
+
+from services.user_cache_service import user_state_cache
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -27,6 +34,60 @@ def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
+class PasswordHasherPool:
+    """Runs bcrypt off the event loop on a bounded thread pool.
+
+    Calls beyond `workers + max_queue` in flight are rejected immediately with 503
+    instead of piling up behind a login storm.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"},
+            )
+        self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+            self.completed += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queue_depth": max(0, self._in_flight - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+password_pool = PasswordHasherPool(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32")),
+)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the hashing pool"""
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the hashing pool"""
+    return await password_pool.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
@@ -51,16 +112,135 @@ def verify_token(token: str) -> dict:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
-    """Get current user from JWT token"""
+class VerifiedTokenCache:
+    """LRU of decoded token payloads keyed by the token's SHA-256 digest.
+
+    An entry lives until the token's `exp` or `ttl_seconds`, whichever comes first.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self._by_user: Dict[str, Set[bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.revocations = 0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._digest(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[0])
+
+    def put(self, token: str, payload: dict) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if isinstance(payload.get("exp"), (int, float)):
+            expires_at = min(expires_at, float(payload["exp"]))
+        key = self._digest(token)
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (dict(payload), expires_at)
+        user_id = payload.get("user_id")
+        if user_id:
+            self._by_user.setdefault(user_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def revoke_user(self, user_id: str) -> None:
+        for key in self._by_user.pop(user_id, set()):
+            self._entries.pop(key, None)
+        self.revocations += 1
+
+    def _drop(self, key: bytes) -> None:
+        payload, _ = self._entries.pop(key)
+        user_id = payload.get("user_id")
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "revocations": self.revocations,
+        }
+
+
+token_cache = VerifiedTokenCache(
+    max_entries=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300")),
+)
+
+def revoke_user_tokens(user_id: str) -> None:
+    """Evict a user's cached tokens so their next request is verified from scratch (freeze/suspend).
+
+    Their JWTs stay valid; get_current_user's account check is what turns them away.
+    """
+    token_cache.revoke_user(user_id)
+
+def _get_db():
+    from server import db
+
+    return db
+
+def check_account(user: Optional[dict]) -> None:
+    """Reject a deleted, suspended or frozen account."""
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials"
+        )
+    if not user.get("is_active", True):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Account is suspended"
+        )
+    if user.get("is_frozen"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Account is frozen. Contact support."
+        )
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db=Depends(_get_db),
+) -> dict:
+    """Get current user from JWT token
+
+    The account itself is checked on every request against the user state cache, so a
+    suspend or freeze locks out existing tokens within the cache TTL on every worker.
+    """
     token = credentials.credentials
-    payload = verify_token(token)
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = verify_token(token)
+        token_cache.put(token, payload)
     user_id = payload.get("user_id")
     if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials"
         )
+    check_account(await user_state_cache.get(db, user_id))
     return payload
 
 async def get_current_admin(current_user: dict = Depends(get_current_user)) -> dict:
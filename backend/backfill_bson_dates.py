@@ -0,0 +1,147 @@
+# WinPKR timestamp backfill: ISO-8601 strings -> native BSON dates
+# Run right after deploying the date-based backend; safe to interrupt and re-run
+#
+#   python backfill_bson_dates.py                    resume from the last checkpoint
+#   python backfill_bson_dates.py --batch-size 500   smaller batches (default 1000)
+#   python backfill_bson_dates.py --pause-ms 50      sleep between batches to limit load
+#   python backfill_bson_dates.py --restart          ignore the checkpoint and rescan
+#
+# Each collection is walked in _id order, one batch at a time, so memory stays bounded
+# by the batch size. Every update is guarded on the original string value, so a document
+# rewritten by the application in the meantime is left alone. The last _id processed per
+# collection is checkpointed in the `migrations` collection after every batch.
+
+import argparse
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+from datetime import datetime, timezone
+
+load_dotenv(Path(__file__).parent / '.env')
+
+MIGRATION_ID = "bson_dates"
+
+TIMESTAMP_FIELDS = {
+    "users": ["created_at", "updated_at", "frozen_at", "download_bonus_at"],
+    "transactions": ["created_at", "updated_at"],
+    "deposits": ["created_at", "updated_at", "approved_at"],
+    "withdrawals": ["created_at", "updated_at", "approved_at"],
+    "bets": ["created_at", "settled_at"],
+    "wagering": ["created_at", "updated_at", "completed_at"],
+    "bonus_claims": ["created_at"],
+    "referrals": ["created_at", "updated_at", "system_decision_timestamp"],
+    "notifications": ["created_at", "expires_at"],
+    "security_events": ["created_at"],
+    "crash_rounds": ["started_at", "crashed_at"],
+    "crash_seed_chains": ["created_at", "retired_at", "exhausted_at"],
+    "ledger_entries": ["at"],
+    "ledger_snapshots": ["at"],
+    "system_settings": ["updated_at"],
+    "settings_versions": ["updated_at"],
+    "promotion_configs": ["updated_at"],
+    "game_settings": ["created_at", "updated_at"],
+}
+
+
+def parse_timestamp(value):
+    """ISO-8601 string -> aware UTC datetime; None when the string is not a timestamp."""
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        # Legacy writes always used UTC
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+async def backfill_collection(db, collection, fields, state, batch_size, pause_ms):
+    coll = db[collection]
+    total = await coll.estimated_document_count()
+    legacy = {"$or": [{f: {"$type": "string"}} for f in fields]}
+    projection = {f: 1 for f in fields}
+    state.setdefault("scanned", 0)
+    state.setdefault("converted", 0)
+    state.setdefault("unparseable", 0)
+
+    while True:
+        query = dict(legacy)
+        if state.get("last_id") is not None:
+            query["_id"] = {"$gt": state["last_id"]}
+        batch = await coll.find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            for f in fields:
+                raw = doc.get(f)
+                if not isinstance(raw, str):
+                    continue
+                parsed = parse_timestamp(raw)
+                if parsed is None:
+                    state["unparseable"] += 1
+                    continue
+                ops.append(UpdateOne({"_id": doc["_id"], f: raw}, {"$set": {f: parsed}}))
+        if ops:
+            result = await coll.bulk_write(ops, ordered=False)
+            state["converted"] += result.modified_count
+
+        state["scanned"] += len(batch)
+        state["last_id"] = batch[-1]["_id"]
+        await db.migrations.update_one(
+            {"id": MIGRATION_ID},
+            {"$set": {f"collections.{collection}": state, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        print(f"  {collection}: {state['scanned']} legacy docs scanned (~{total} total), {state['converted']} fields converted")
+        if pause_ms:
+            await asyncio.sleep(pause_ms / 1000)
+
+    state["done"] = True
+    await db.migrations.update_one(
+        {"id": MIGRATION_ID},
+        {"$set": {f"collections.{collection}": state, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def backfill(batch_size, pause_ms, restart):
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    print("\n=== WinPKR Timestamp Backfill (ISO strings -> BSON dates) ===")
+
+    checkpoint = None if restart else await db.migrations.find_one({"id": MIGRATION_ID})
+    progress = (checkpoint or {}).get("collections", {})
+
+    for collection, fields in TIMESTAMP_FIELDS.items():
+        state = progress.get(collection, {})
+        if state.get("done"):
+            print(f"  {collection}: already done ({state.get('converted', 0)} fields converted)")
+            continue
+        await backfill_collection(db, collection, fields, state, batch_size, pause_ms)
+        if state.get("unparseable"):
+            print(f"  ⚠️  {collection}: {state['unparseable']} values were not ISO timestamps and were left as-is")
+
+    await db.migrations.update_one(
+        {"id": MIGRATION_ID},
+        {"$set": {"completed_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    print("\n✓ Timestamp backfill complete")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause-ms", type=int, default=0)
+    parser.add_argument("--restart", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size, args.pause_ms, args.restart))
@@ -0,0 +1,93 @@
+# WinPKR user search backfill: normalized search fields + tokens for existing users
+# Run after deploying the token-based admin user search; safe to interrupt and re-run
+#
+#   python backfill_user_search.py                    resume from the last checkpoint
+#   python backfill_user_search.py --batch-size 500   smaller batches (default 1000)
+#   python backfill_user_search.py --pause-ms 50      sleep between batches to limit load
+#   python backfill_user_search.py --restart          ignore the checkpoint and rescan
+#
+# Users are walked in _id order, one batch at a time, picking only those whose `search`
+# sub-document is missing or built by an older SEARCH_VERSION, so re-running after a
+# token format change rebuilds exactly what is stale. Every update is guarded on the
+# source fields read, so a profile edited in the meantime (which rebuilds its own
+# tokens) is left alone. The last _id processed is checkpointed in `migrations`.
+
+import argparse
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+from datetime import datetime, timezone
+
+from services.user_search_service import SEARCH_VERSION, search_fields
+
+load_dotenv(Path(__file__).parent / '.env')
+
+MIGRATION_ID = "user_search"
+
+SOURCE_FIELDS = ["email", "full_name", "phone", "referral_code"]
+
+
+async def backfill(batch_size, pause_ms, restart):
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    print("\n=== WinPKR User Search Backfill (search fields + tokens) ===")
+
+    checkpoint = None if restart else await db.migrations.find_one({"id": MIGRATION_ID})
+    state = {} if checkpoint is None or checkpoint.get("version") != SEARCH_VERSION else checkpoint.get("state", {})
+    state.setdefault("scanned", 0)
+    state.setdefault("updated", 0)
+    total = await db.users.estimated_document_count()
+    stale = {"search.v": {"$ne": SEARCH_VERSION}}
+    projection = {f: 1 for f in SOURCE_FIELDS}
+
+    while True:
+        query = dict(stale)
+        if state.get("last_id") is not None:
+            query["_id"] = {"$gt": state["last_id"]}
+        batch = await db.users.find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        ops = [
+            UpdateOne(
+                {"_id": doc["_id"], **{f: doc.get(f) for f in SOURCE_FIELDS}},
+                {"$set": search_fields(doc)},
+            )
+            for doc in batch
+        ]
+        result = await db.users.bulk_write(ops, ordered=False)
+        state["updated"] += result.modified_count
+
+        state["scanned"] += len(batch)
+        state["last_id"] = batch[-1]["_id"]
+        await db.migrations.update_one(
+            {"id": MIGRATION_ID},
+            {"$set": {"version": SEARCH_VERSION, "state": state, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        print(f"  users: {state['scanned']} stale docs scanned (~{total} total), {state['updated']} indexed")
+        if pause_ms:
+            await asyncio.sleep(pause_ms / 1000)
+
+    await db.migrations.update_one(
+        {"id": MIGRATION_ID},
+        {"$set": {"version": SEARCH_VERSION, "state": state, "completed_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    print("\n✓ User search backfill complete")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause-ms", type=int, default=0)
+    parser.add_argument("--restart", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size, args.pause_ms, args.restart))
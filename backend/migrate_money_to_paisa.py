@@ -0,0 +1,168 @@
+# WinPKR money migration: rupees -> integer paisa
+# Run once, to completion, before deploying the paisa-based backend; safe to interrupt and re-run
+#
+#   python migrate_money_to_paisa.py                    resume from the last checkpoint
+#   python migrate_money_to_paisa.py --batch-size 500   smaller batches (default 1000)
+#   python migrate_money_to_paisa.py --pause-ms 50      sleep between batches to limit load
+#
+# Every amount written by the legacy backend is rupees, whatever its BSON type: floats
+# from the models, but also integers set by hand or through an integer $inc. So the
+# type says nothing about the unit; a per-document marker does. Each document is
+# converted in one update that multiplies all its money fields by 100 and sets
+# money_unit: "paisa", guarded on the marker being absent, so an interrupted run
+# resumes without converting anything twice.
+#
+# Once the migration has completed it refuses to run again: documents written by the
+# paisa backend carry no marker and must not be converted. The backend reads the
+# completion record at startup and from then on rejects float amounts read back.
+
+import argparse
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from dotenv import load_dotenv
+from pathlib import Path
+from datetime import datetime, timezone
+
+from money import MONEY_MIGRATION_ID, to_paisa
+
+load_dotenv(Path(__file__).parent / '.env')
+
+MIGRATION_ID = MONEY_MIGRATION_ID
+MARKER = {"money_unit": "paisa"}
+
+# collection -> scalar money fields (dotted paths allowed)
+SCALAR_FIELDS = {
+    "users": [
+        "wallet_balance", "locked_balance", "bonus_balance", "download_bonus_amount",
+        "total_deposits", "total_withdrawals", "total_bets", "total_wins",
+    ],
+    "transactions": ["amount", "balance_before", "balance_after", "metadata.bonus_amount"],
+    "deposits": ["amount"],
+    "withdrawals": ["amount"],
+    "bets": ["bet_amount", "payout"],
+    "wagering": ["principal_amount", "target_amount", "wagered_amount"],
+    "bonus_claims": ["amount"],
+    "referrals": ["total_deposit_commission_earned", "total_rebate_earned"],
+    "crash_rounds": ["total_wagered", "total_payout"],
+    "bet_counters": ["total"],
+    "security_events": ["detail.attempt_amount", "detail.daily_total", "detail.daily_limit"],
+}
+
+# collection -> fields holding a {key: amount} map
+MAP_FIELDS = {
+    "bet_counters": ["hours"],
+    "ledger_entries": ["delta", "balances_after"],
+    "ledger_snapshots": ["balances"],
+}
+
+
+def _is_amount(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _get(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def converted_fields(doc, scalars, maps):
+    """$set for one legacy document: every rupee amount it holds, in paisa."""
+    update = {}
+    for path in scalars:
+        value = _get(doc, path)
+        if _is_amount(value):
+            update[path] = to_paisa(value)
+    for path in maps:
+        value = _get(doc, path)
+        if isinstance(value, dict):
+            update[path] = {k: to_paisa(v) if _is_amount(v) else v for k, v in value.items()}
+    return update
+
+
+async def migrate_collection(db, collection, scalars, maps, state, batch_size, pause_ms):
+    coll = db[collection]
+    total = await coll.estimated_document_count()
+    legacy = {"money_unit": {"$ne": "paisa"}}
+    projection = {f: 1 for f in scalars + maps}
+    state.setdefault("scanned", 0)
+    state.setdefault("converted", 0)
+
+    while True:
+        query = dict(legacy)
+        if state.get("last_id") is not None:
+            query["_id"] = {"$gt": state["last_id"]}
+        batch = await coll.find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        ops = [
+            UpdateOne({"_id": doc["_id"], **legacy}, {"$set": {**converted_fields(doc, scalars, maps), **MARKER}})
+            for doc in batch
+        ]
+        result = await coll.bulk_write(ops, ordered=False)
+        state["converted"] += result.modified_count
+
+        state["scanned"] += len(batch)
+        state["last_id"] = batch[-1]["_id"]
+        await db.migrations.update_one(
+            {"id": MIGRATION_ID},
+            {"$set": {f"collections.{collection}": state, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        print(f"  {collection}: {state['scanned']} docs scanned (~{total} total), {state['converted']} converted")
+        if pause_ms:
+            await asyncio.sleep(pause_ms / 1000)
+
+    state["done"] = True
+    await db.migrations.update_one(
+        {"id": MIGRATION_ID},
+        {"$set": {f"collections.{collection}": state, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def migrate(batch_size, pause_ms):
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    print("\n=== WinPKR Money Migration (rupees -> paisa) ===")
+
+    checkpoint = await db.migrations.find_one({"id": MIGRATION_ID})
+    if checkpoint and checkpoint.get("completed_at"):
+        print(f"  already completed at {checkpoint['completed_at']}; nothing to do")
+        client.close()
+        return
+    progress = (checkpoint or {}).get("collections", {})
+
+    for collection in dict.fromkeys([*SCALAR_FIELDS, *MAP_FIELDS]):
+        state = progress.get(collection, {})
+        if state.get("done"):
+            print(f"  {collection}: already done ({state.get('converted', 0)} converted)")
+            continue
+        await migrate_collection(
+            db, collection, SCALAR_FIELDS.get(collection, []), MAP_FIELDS.get(collection, []),
+            state, batch_size, pause_ms,
+        )
+
+    await db.migrations.update_one(
+        {"id": MIGRATION_ID},
+        {"$set": {"completed_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    print("\n✓ Money migration complete")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause-ms", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(migrate(args.batch_size, args.pause_ms))
@@ -4,6 +4,8 @@ from datetime import datetime, timezone
 from enum import Enum
 import uuid
 
+from money import Paisa, RupeeAmount
+
 # Enums
 class UserRole(str, Enum):
     USER = "user"
@@ -20,6 +22,7 @@ class TransactionType(str, Enum):
 
 class TransactionStatus(str, Enum):
     PENDING = "pending"
+    PROCESSING = "processing"  # withdrawal an admin is paying out right now
     APPROVED = "approved"
     REJECTED = "rejected"
     COMPLETED = "completed"
@@ -67,10 +70,10 @@ class User(UserBase):
     is_verified: bool = False
     kyc_status: KYCStatus = KYCStatus.NOT_SUBMITTED
 
-    # Wallet (PKR)
-    wallet_balance: float = 0.0  # visible single wallet balance
-    locked_balance: float = 0.0  # internal: locked deposit amount for wagering/withdraw gating
-    bonus_balance: float = 0.0  # internal: locked bonus amount for wagering
+    # Wallet (paisa; PKR in API responses)
+    wallet_balance: Paisa = 0  # visible single wallet balance
+    locked_balance: Paisa = 0  # internal: locked deposit amount for wagering/withdraw gating
+    bonus_balance: Paisa = 0  # internal: locked bonus amount for wagering
 
     # Promotions / eligibility flags
     first_deposit_108_eligible: bool = True
@@ -79,7 +82,7 @@ class User(UserBase):
     daily_first_deposit_bonus_last_date: Optional[str] = None  # PK date YYYY-MM-DD
 
     has_download_bonus: bool = False
-    download_bonus_amount: float = 0.0
+    download_bonus_amount: Paisa = 0
     download_bonus_at: Optional[datetime] = None
 
     # Device identifiers (web/pwa)
@@ -87,10 +90,10 @@ class User(UserBase):
     app_install_id: Optional[str] = None
 
     # Totals
-    total_deposits: float = 0.0
-    total_withdrawals: float = 0.0
-    total_bets: float = 0.0
-    total_wins: float = 0.0
+    total_deposits: Paisa = 0
+    total_withdrawals: Paisa = 0
+    total_bets: Paisa = 0
+    total_wins: Paisa = 0
 
     # Trust/safeguards
     is_frozen: bool = False
@@ -130,17 +133,17 @@ class Transaction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     type: TransactionType
-    amount: float
+    amount: Paisa
     status: TransactionStatus
     description: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
-    balance_before: float
-    balance_after: float
+    balance_before: Paisa
+    balance_after: Paisa
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class DepositRequest(BaseModel):
-    amount: float
+    amount: RupeeAmount
     jazzcash_number: str
     # Optional promotion identifier selected by user during deposit
     promotion_key: Optional[str] = None
@@ -150,7 +153,7 @@ class Deposit(BaseModel):
 
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    amount: float
+    amount: Paisa
     jazzcash_number: str
     promotion_key: Optional[str] = None
     deposit_wagering_multiplier: Optional[float] = None
@@ -160,8 +163,11 @@ class Deposit(BaseModel):
     approved_at: Optional[datetime] = None
     approved_by: Optional[str] = None
 
+class DepositBatchApproval(BaseModel):
+    deposit_ids: List[str] = Field(..., min_length=1, max_length=500)
+
 class WithdrawalRequest(BaseModel):
-    amount: float
+    amount: RupeeAmount
     jazzcash_number: str
 
 class Withdrawal(BaseModel):
@@ -169,7 +175,7 @@ class Withdrawal(BaseModel):
     
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    amount: float
+    amount: Paisa
     jazzcash_number: str
     status: TransactionStatus = TransactionStatus.PENDING
     rejection_reason: Optional[str] = None
@@ -203,10 +209,10 @@ class Bet(BaseModel):
     user_id: str
     game_id: str
     game_name: str
-    bet_amount: float
+    bet_amount: Paisa
     bet_data: Dict[str, Any]  # Game-specific bet details
     multiplier: float = 0.0
-    payout: float = 0.0
+    payout: Paisa = 0
     status: BetStatus = BetStatus.PENDING
     result_data: Optional[Dict[str, Any]] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -244,7 +250,7 @@ class Bonus(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     type: str  # "welcome", "deposit", "referral", "rebate", "daily"
-    amount: float
+    amount: Paisa
     description: str
     is_claimed: bool = False
     claimed_at: Optional[datetime] = None
@@ -0,0 +1,90 @@
+"""Money representation.
+
+Amounts are stored and computed as integer paisa (1 PKR = 100 paisa). The API speaks
+rupees: request models convert rupees to paisa on input and every money field is
+serialized back to rupees in JSON responses. Configuration values (system settings,
+promotion tables) stay in rupees and are converted where they are compared.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Annotated, Any, Dict, Iterable, Optional
+
+from pydantic import BeforeValidator, PlainSerializer
+
+PAISA_PER_RUPEE = 100
+
+# `migrations` record of migrate_money_to_paisa.py; once it has completed every stored
+# amount is integer paisa, and a float read back is an error rather than a legacy value
+MONEY_MIGRATION_ID = "money_to_paisa"
+_strict_stored_paisa = False
+
+
+def set_strict_stored_paisa(enabled: bool) -> None:
+    """Reject float amounts read from the database (set at startup once the migration has run)."""
+    global _strict_stored_paisa
+    _strict_stored_paisa = enabled
+
+
+def to_paisa(rupees: Any) -> int:
+    """Rupees (int, float, str or Decimal) -> paisa, rounding half up."""
+    if isinstance(rupees, bool):
+        raise ValueError("amount must be a number")
+    try:
+        value = Decimal(str(rupees))
+    except Exception:
+        raise ValueError("amount must be a number")
+    if not value.is_finite():
+        raise ValueError("amount must be a number")
+    return int((value * PAISA_PER_RUPEE).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def to_rupees(paisa: Optional[int]) -> float:
+    """Paisa -> rupees for API responses."""
+    return (paisa or 0) / PAISA_PER_RUPEE
+
+
+def percent_of(paisa: int, percent: Any) -> int:
+    """`percent`% of an amount in paisa, rounded half up."""
+    return int((Decimal(paisa) * Decimal(str(percent)) / 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def scale(paisa: int, factor: Any) -> int:
+    """Amount in paisa times a multiplier (payout, wagering target), rounded half up."""
+    return int((Decimal(paisa) * Decimal(str(factor))).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def rupees_fields(doc: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    """Copy of a stored document with the given paisa fields converted to rupees."""
+    out = dict(doc)
+    for f in fields:
+        if f in out and out[f] is not None:
+            out[f] = to_rupees(out[f])
+    return out
+
+
+def _stored_paisa(value: Any) -> Any:
+    # Stored documents and internal code hold integer paisa; a float is an unmigrated rupee
+    # amount (or a bug), and rounding it would silently turn it into a wrong paisa value
+    if isinstance(value, float):
+        if _strict_stored_paisa:
+            raise ValueError(f"money amount {value!r} is not integer paisa")
+        return int(round(value))
+    return value
+
+
+def _input_paisa(value: Any) -> Any:
+    return to_paisa(value)
+
+
+# Field stored in paisa, rendered in rupees in JSON
+Paisa = Annotated[
+    int,
+    BeforeValidator(_stored_paisa),
+    PlainSerializer(to_rupees, return_type=float, when_used="json"),
+]
+
+# Amount submitted by a client in rupees, held in paisa
+RupeeAmount = Annotated[
+    int,
+    BeforeValidator(_input_paisa),
+    PlainSerializer(to_rupees, return_type=float, when_used="json"),
+]
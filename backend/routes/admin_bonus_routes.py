@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from auth import get_current_admin
+from money import rupees_fields
+from services.pagination_service import fetch_page, set_next_cursor
+from services.wagering_service import MONEY_FIELDS as WAGERING_MONEY_FIELDS
 
 router = APIRouter(prefix="/admin/bonuses", tags=["Admin Bonuses"])
 
@@ -13,9 +16,11 @@ def get_db() -> AsyncIOMotorDatabase:
 
 @router.get("/app-download")
 async def list_app_download_bonus_claims(
-    skip: int = 0,
+    response: Response,
     limit: int = 100,
     phone: str | None = None,
+    cursor: str | None = None,
+    skip: int = Query(0, deprecated=True),
     current_admin: dict = Depends(get_current_admin),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
@@ -23,16 +28,22 @@ async def list_app_download_bonus_claims(
     if phone:
         query["phone"] = phone
 
-    claims = await db.bonus_claims.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    return claims
+    try:
+        claims, next_cursor = await fetch_page(db.bonus_claims, query, {"_id": 0}, limit, cursor=cursor, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
+    return [rupees_fields(c, ("amount",)) for c in claims]
 
 
 @router.get("/wagering")
 async def list_wagering_records(
-    skip: int = 0,
+    response: Response,
     limit: int = 200,
     user_id: str | None = None,
     status: str | None = None,
+    cursor: str | None = None,
+    skip: int = Query(0, deprecated=True),
     current_admin: dict = Depends(get_current_admin),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
@@ -42,5 +53,9 @@ async def list_wagering_records(
     if status:
         query["status"] = status
 
-    records = await db.wagering.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    return records
+    try:
+        records, next_cursor = await fetch_page(db.wagering, query, {"_id": 0}, limit, cursor=cursor, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
+    return [rupees_fields(r, WAGERING_MONEY_FIELDS) for r in records]
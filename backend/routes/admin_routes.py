@@ -1,13 +1,28 @@
-from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks, Query, Request, Response, UploadFile, File
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import (
     User, Deposit, Withdrawal, GameSettings, SystemSettings,
-    NotificationCreate, Notification, TransactionType, TransactionStatus, Transaction
+    NotificationCreate, Notification, TransactionType, TransactionStatus, Transaction, Bet, DepositBatchApproval
 )
-from auth import get_current_admin
+from auth import get_current_admin, password_pool, revoke_user_tokens, token_cache
 from email_service import email_service
+from money import rupees_fields, to_rupees
+from services.approval_queue_service import QUEUES, approval_queues, lease_free_filter
+from services.approval_recovery_service import approval_recovery
+from services.ledger_service import ledger_replay
+from services.pagination_service import fetch_page, set_next_cursor
+from services.stats_service import dashboard_cache, record_daily
+from services.user_cache_service import user_state_cache
+from services.write_behind_service import journal
 from typing import List, Optional
 from datetime import datetime, timezone, timedelta
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -21,7 +36,8 @@ async def admin_db_health(
     current_admin: dict = Depends(get_current_admin),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    """Deployment health check: verifies DB connection, key collections, and indexes exist."""
+    """Deployment health check: verifies DB connection, key collections, and index drift against the spec."""
+    from services.index_service import index_drift, unused_indexes
 
     collection_names = await db.list_collection_names()
 
@@ -59,6 +75,27 @@ async def admin_db_health(
             "users_email_unique": users_has_email_unique,
             "system_settings_setting_key_unique": system_settings_has_setting_key_unique,
         },
+        "index_drift": await index_drift(db),
+        "index_usage": await unused_indexes(db),
+    }
+
+@router.get("/health/runtime")
+async def admin_runtime_health(current_admin: dict = Depends(get_current_admin)):
+    """In-process pools, queues and caches of this API worker."""
+    from services.archive_service import history_archiver
+    from services.throttle_service import auth_throttle
+
+    return {
+        "password_hashing": password_pool.metrics(),
+        "write_behind": journal.metrics(),
+        "ledger_replay": ledger_replay.metrics(),
+        "auth_throttle": auth_throttle.metrics(),
+        "token_cache": token_cache.metrics(),
+        "user_cache": user_state_cache.metrics(),
+        "archiver": history_archiver.metrics(),
+        "approval_queues": approval_queues.metrics(),
+        "approval_recovery": approval_recovery.metrics(),
+        "dashboard_cache": dashboard_cache.metrics(),
     }
 
 # Dashboard Stats
@@ -67,86 +104,93 @@ async def get_dashboard_stats(
     current_admin: dict = Depends(get_current_admin),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    """Get admin dashboard statistics"""
-    # Get today's date range
-    today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = today_start + timedelta(days=1)
-    
-    # Total users
-    total_users = await db.users.count_documents({"role": "user"})
-    active_users = await db.users.count_documents({"role": "user", "is_active": True})
-    
-    # Pending approvals
-    pending_deposits = await db.deposits.count_documents({"status": "pending"})
-    pending_withdrawals = await db.withdrawals.count_documents({"status": "pending"})
-    pending_kyc = await db.users.count_documents({"kyc_status": "pending"})
-    
-    # Today's transactions
-    deposits_pipeline = [
-        {"$match": {"status": "approved", "approved_at": {"$gte": today_start.isoformat(), "$lt": today_end.isoformat()}}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    deposits_result = await db.deposits.aggregate(deposits_pipeline).to_list(1)
-    today_deposits = deposits_result[0]["total"] if deposits_result else 0.0
-    
-    withdrawals_pipeline = [
-        {"$match": {"status": "approved", "approved_at": {"$gte": today_start.isoformat(), "$lt": today_end.isoformat()}}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    withdrawals_result = await db.withdrawals.aggregate(withdrawals_pipeline).to_list(1)
-    today_withdrawals = withdrawals_result[0]["total"] if withdrawals_result else 0.0
-    
-    # Calculate winning ratio
-    winning_ratio = (today_withdrawals / today_deposits * 100) if today_deposits > 0 else 0.0
-    
-    # Total bets today
-    bets_pipeline = [
-        {"$match": {"created_at": {"$gte": today_start.isoformat(), "$lt": today_end.isoformat()}}},
-        {"$group": {"_id": None, "total": {"$sum": "$bet_amount"}, "count": {"$sum": 1}}}
-    ]
-    bets_result = await db.bets.aggregate(bets_pipeline).to_list(1)
-    today_bets = bets_result[0]["total"] if bets_result else 0.0
-    today_bets_count = bets_result[0]["count"] if bets_result else 0
-    
-    return {
-        "users": {
-            "total": total_users,
-            "active": active_users
-        },
-        "pending_approvals": {
-            "deposits": pending_deposits,
-            "withdrawals": pending_withdrawals,
-            "kyc": pending_kyc
-        },
-        "today": {
-            "deposits": today_deposits,
-            "withdrawals": today_withdrawals,
-            "winning_ratio": round(winning_ratio, 2),
-            "total_bets": today_bets,
-            "bets_count": today_bets_count
-        }
-    }
+    """Get admin dashboard statistics (cached for a few seconds per worker)"""
+    return await dashboard_cache.get(db)
 
 # User Management
 @router.get("/users", response_model=List[User])
 async def get_all_users(
-    skip: int = 0,
+    response: Response,
     limit: int = 100,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True),
     current_admin: dict = Depends(get_current_admin),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    """Get all users"""
+    """Get all users, newest first.
+
+    With `search`, returns up to `limit` (max 100) users matching email, name, phone or
+    referral code, ranked exact > prefix > substring; search results are not paginated.
+    """
     query = {"role": "user"}
     if search:
-        query["$or"] = [
-            {"email": {"$regex": search, "$options": "i"}},
-            {"full_name": {"$regex": search, "$options": "i"}}
-        ]
-    
-    users = await db.users.find(query, {"_id": 0, "password_hash": 0}).skip(skip).limit(limit).to_list(limit)
+        from services.user_search_service import search_users
+
+        users = await search_users(db, search, limit, base_filter=query)
+        return [User(**u) for u in users]
+    
+    try:
+        users, next_cursor = await fetch_page(
+            db.users, query, {"_id": 0, "password_hash": 0, "search": 0}, limit, cursor=cursor, skip=skip
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
     return [User(**u) for u in users]
 
+@router.get("/archive/{collection}")
+async def get_archived_history(
+    collection: str,
+    user_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 200,
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """A user's archived bets or transactions (older than the hot window), newest first, for disputes"""
+    from services.archive_service import ARCHIVED_COLLECTIONS, read_archive
+
+    models = {"bets": Bet, "transactions": Transaction}
+    if collection not in ARCHIVED_COLLECTIONS:
+        raise HTTPException(status_code=404, detail="Unknown archive")
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=365)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    docs = await read_archive(db, collection, user_id, start, end, max(1, min(limit, 1000)))
+    return [models[collection](**d).model_dump(mode="json") for d in docs]
+
+@router.get("/users/{user_id}/balance-at")
+async def get_user_balance_at(
+    user_id: str,
+    at: str,
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """User's balances at a point in time, rebuilt from the ledger (naive times are Pakistan time)"""
+    from services.ledger_service import balance_at
+    from services.time_service import PK_TZ
+
+    try:
+        when = datetime.fromisoformat(at)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="at must be an ISO date-time")
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=PK_TZ)
+
+    result = await balance_at(db, user_id, when)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No ledger history for this user at that time")
+    result["balances"] = rupees_fields(result["balances"], result["balances"].keys())
+    return result
+
 @router.put("/users/{user_id}/suspend")
 async def suspend_user(
     user_id: str,
@@ -156,12 +200,14 @@ async def suspend_user(
     """Suspend user account"""
     result = await db.users.update_one(
         {"id": user_id, "role": "user"},
-        {"$set": {"is_active": False, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"is_active": False, "updated_at": datetime.now(timezone.utc)}}
     )
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
+    revoke_user_tokens(user_id)
+    user_state_cache.invalidate(db, user_id)
     return {"message": "User suspended successfully"}
 
 @router.put("/users/{user_id}/activate")
@@ -173,12 +219,13 @@ async def activate_user(
     """Activate user account"""
     result = await db.users.update_one(
         {"id": user_id, "role": "user"},
-        {"$set": {"is_active": True, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"is_active": True, "updated_at": datetime.now(timezone.utc)}}
     )
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
 
+    user_state_cache.invalidate(db, user_id)
     return {"message": "User activated successfully"}
 
 
@@ -196,8 +243,8 @@ async def freeze_user(
             "$set": {
                 "is_frozen": True,
                 "frozen_reason": reason,
-                "frozen_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "frozen_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc),
             }
         },
     )
@@ -205,6 +252,8 @@ async def freeze_user(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
 
+    revoke_user_tokens(user_id)
+    user_state_cache.invalidate(db, user_id)
     return {"message": "User frozen"}
 
 
@@ -222,7 +271,7 @@ async def unfreeze_user(
                 "is_frozen": False,
                 "frozen_reason": None,
                 "frozen_at": None,
-                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "updated_at": datetime.now(timezone.utc),
             }
         },
     )
@@ -230,16 +279,139 @@ async def unfreeze_user(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
 
+    user_state_cache.invalidate(db, user_id)
     return {"message": "User unfrozen"}
 
+# Approval Queues
+def _queue_item_rupees(item: dict) -> dict:
+    return rupees_fields(item, ("amount",))
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+async def _raise_unavailable(db, queue: str, item_id: str, admin_id: str, label: str) -> None:
+    if await approval_queues.held_by_other(db, queue, item_id, admin_id):
+        raise HTTPException(status_code=409, detail=f"{label} is claimed by another admin")
+    raise HTTPException(status_code=404, detail=f"{label} not found or already processed")
+
+def _check_queue(queue: str) -> None:
+    if queue not in QUEUES:
+        raise HTTPException(status_code=404, detail="Unknown queue")
+
+@router.get("/queues/stream")
+async def stream_approval_queues(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Server-sent events: a `snapshot` of every queue, then a `delta` per change.
+
+    A `resync` event means this stream fell behind and was closed; reconnect for a fresh snapshot.
+    """
+    from services.approval_queue_service import HEARTBEAT_SECONDS
+
+    # Subscribe before reading the snapshot so no change falls in between
+    sub = approval_queues.subscribe()
+    try:
+        snapshot = {
+            name: [_queue_item_rupees(i) for i in await approval_queues.ranked(db, name, limit)] for name in QUEUES
+        }
+    except Exception:
+        approval_queues.unsubscribe(sub)
+        raise
+
+    async def events():
+        try:
+            yield _sse("snapshot", snapshot)
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(sub.events.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    yield _sse("resync", {})
+                    return
+                if "item" in event:
+                    event = {**event, "item": _queue_item_rupees(event["item"])}
+                yield _sse("delta", event)
+        finally:
+            approval_queues.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/queues/{queue}")
+async def get_approval_queue(
+    queue: str,
+    limit: int = Query(50, ge=1, le=500),
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Pending items of a queue (deposits, withdrawals, kyc) in priority order, with their leases"""
+    _check_queue(queue)
+    return [_queue_item_rupees(i) for i in await approval_queues.ranked(db, queue, limit)]
+
+@router.post("/queues/{queue}/claim")
+async def claim_queue_item(
+    queue: str,
+    item_id: Optional[str] = None,
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Lease an item (the given one, or the next by priority) so no other admin processes it"""
+    _check_queue(queue)
+    item = await approval_queues.claim(db, queue, current_admin["user_id"], item_id)
+    if item is None:
+        if item_id is None:
+            raise HTTPException(status_code=404, detail="No unclaimed items in this queue")
+        await _raise_unavailable(db, queue, item_id, current_admin["user_id"], "Item")
+    return _queue_item_rupees(item)
+
+@router.post("/queues/{queue}/{item_id}/release")
+async def release_queue_item(
+    queue: str,
+    item_id: str,
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Give back a leased item"""
+    _check_queue(queue)
+    if not await approval_queues.release(db, queue, item_id, current_admin["user_id"]):
+        raise HTTPException(status_code=404, detail="You do not hold this item")
+    return {"message": "Item released"}
+
 # Deposit Management
+def _batch_result_rupees(result: dict) -> dict:
+    return rupees_fields(result, ("amount", "bonus_amount")) if result["status"] == "approved" else result
+
+async def _notify_deposits_approved(db, background_tasks: BackgroundTasks, approved: List[dict]) -> None:
+    """Queue approval emails for batch-approved deposits (one user lookup for the batch)"""
+    if not approved:
+        return
+    users = await db.users.find(
+        {"id": {"$in": list({r["user_id"] for r in approved})}}, {"_id": 0, "id": 1, "email": 1}
+    ).to_list(None)
+    emails = {u["id"]: u["email"] for u in users}
+    for r in approved:
+        if r["user_id"] in emails:
+            background_tasks.add_task(
+                email_service.send_deposit_approved_email,
+                user_email=emails[r["user_id"]],
+                amount=to_rupees(r["amount"])
+            )
+
 @router.get("/deposits/pending", response_model=List[Deposit])
 async def get_pending_deposits(
     current_admin: dict = Depends(get_current_admin),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get all pending deposits"""
-    deposits = await db.deposits.find({"status": "pending"}, {"_id": 0}).sort("created_at", -1).to_list(100)
+    deposits = await approval_queues.pending(db, "deposits", 100)
     return [Deposit(**d) for d in deposits]
 
 @router.put("/deposits/{deposit_id}/approve")
@@ -250,44 +422,90 @@ async def approve_deposit(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Approve deposit request"""
-    # Get deposit
-    deposit = await db.deposits.find_one({"id": deposit_id, "status": "pending"}, {"_id": 0})
+    from services.deposit_approval_service import (
+        approve_deposit_apply_promotions,
+        claim_deposit,
+        mark_deposits_approved,
+        release_deposit_claim,
+    )
+
+    # Claim the deposit before crediting: fails while a batch is settling it or another admin holds it
+    deposit, claim_token = await claim_deposit(db, deposit_id, current_admin["user_id"])
     if not deposit:
-        raise HTTPException(status_code=404, detail="Deposit not found or already processed")
+        await _raise_unavailable(db, "deposits", deposit_id, current_admin["user_id"], "Deposit")
     
     # Get user
     user = await db.users.find_one({"id": deposit["user_id"]}, {"_id": 0})
     if not user:
+        await release_deposit_claim(db, deposit_id, claim_token)
         raise HTTPException(status_code=404, detail="User not found")
     
     # Apply promotions + wagering (Phase 2)
-    from services.deposit_approval_service import approve_deposit_apply_promotions
-
-    await approve_deposit_apply_promotions(db, deposit, current_admin["user_id"])
+    try:
+        await approve_deposit_apply_promotions(db, deposit, current_admin["user_id"])
+    except ValueError as e:
+        await release_deposit_claim(db, deposit_id, claim_token)
+        raise HTTPException(status_code=404, detail=str(e))
     
-    # Update deposit status
-    await db.deposits.update_one(
-        {"id": deposit_id},
-        {
-            "$set": {
-                "status": "approved",
-                "approved_at": datetime.now(timezone.utc).isoformat(),
-                "approved_by": current_admin["user_id"]
-            }
-        }
-    )
+    # Update deposit status (still processing under our claim, unless the recovery sweep settled it)
+    if not await mark_deposits_approved(db, [deposit_id], claim_token, current_admin["user_id"]):
+        logger.error("Deposit %s was credited but its claim lapsed; the approval recovery sweep settles it", deposit_id)
     
     # Transactions (deposit + bonus) are created in approve_deposit_apply_promotions
+    await approval_queues.notify(db, "deposits", [deposit_id])
+    await record_daily(db, datetime.now(timezone.utc), {"deposits_amount": deposit["amount"], "deposits_count": 1})
     
     # Send email notification to user
     background_tasks.add_task(
         email_service.send_deposit_approved_email,
         user_email=user["email"],
-        amount=deposit["amount"]
+        amount=to_rupees(deposit["amount"])
     )
     
     return {"message": "Deposit approved successfully"}
 
+@router.post("/deposits/approve-batch")
+async def approve_deposits_batch(
+    payload: DepositBatchApproval,
+    background_tasks: BackgroundTasks,
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Approve many pending deposits at once; one result per id (approved, skipped or failed)"""
+    from services.deposit_approval_service import approve_deposits_batch as approve_batch
+
+    results = await approve_batch(db, payload.deposit_ids, current_admin["user_id"])
+    approved = [r for r in results if r["status"] == "approved"]
+    await _notify_deposits_approved(db, background_tasks, approved)
+
+    return {"approved": len(approved), "results": [_batch_result_rupees(r) for r in results]}
+
+@router.post("/deposits/statement-match")
+async def match_deposit_statement(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False),
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Auto-match a JazzCash statement (CSV) to pending deposits and approve the matches"""
+    from services.settings_service import settings_registry
+    from services.statement_match_service import iter_chunks, match_statement
+
+    settings = await settings_registry.snapshot(db)
+    window = timedelta(minutes=settings["statement_match_window_minutes"])
+    try:
+        report = await match_statement(
+            db, iter_chunks(file), current_admin["user_id"], window, approve=not dry_run
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    approved = [r for r in report["results"] if r["status"] == "approved"]
+    await _notify_deposits_approved(db, background_tasks, approved)
+    report["results"] = [_batch_result_rupees(r) for r in report["results"]]
+    return report
+
 @router.put("/deposits/{deposit_id}/reject")
 async def reject_deposit(
     deposit_id: str,
@@ -296,20 +514,27 @@ async def reject_deposit(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Reject deposit request"""
+    from services.deposit_approval_service import unclaimed_filter
+
     result = await db.deposits.update_one(
-        {"id": deposit_id, "status": "pending"},
+        {
+            "id": deposit_id,
+            "status": "pending",
+            "$and": [unclaimed_filter(), lease_free_filter(current_admin["user_id"])],
+        },
         {
             "$set": {
                 "status": "rejected",
                 "rejection_reason": reason,
-                "approved_at": datetime.now(timezone.utc).isoformat(),
+                "approved_at": datetime.now(timezone.utc),
                 "approved_by": current_admin["user_id"]
             }
         }
     )
     
     if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Deposit not found or already processed")
+        await _raise_unavailable(db, "deposits", deposit_id, current_admin["user_id"], "Deposit")
+    await approval_queues.notify(db, "deposits", [deposit_id])
     
     return {"message": "Deposit rejected successfully"}
 
@@ -320,7 +545,7 @@ async def get_pending_withdrawals(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get all pending withdrawals"""
-    withdrawals = await db.withdrawals.find({"status": "pending"}, {"_id": 0}).sort("created_at", -1).to_list(100)
+    withdrawals = await approval_queues.pending(db, "withdrawals", 100)
     return [Withdrawal(**w) for w in withdrawals]
 
 @router.put("/withdrawals/{withdrawal_id}/approve")
@@ -331,50 +556,49 @@ async def approve_withdrawal(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Approve withdrawal request"""
-    # Get withdrawal
-    withdrawal = await db.withdrawals.find_one({"id": withdrawal_id, "status": "pending"}, {"_id": 0})
+    from services.wallet_service import was_applied
+    from services.withdrawal_approval_service import (
+        claim_withdrawal,
+        mark_withdrawal_approved,
+        pay_withdrawal,
+        payout_key,
+        release_withdrawal_claim,
+    )
+
+    admin_id = current_admin["user_id"]
+    # Take the withdrawal pending -> processing before any money moves; only one admin can
+    # win this update, and a lapsed one is settled by the approval recovery sweep
+    withdrawal, claim_token = await claim_withdrawal(db, withdrawal_id, admin_id)
     if not withdrawal:
-        raise HTTPException(status_code=404, detail="Withdrawal not found or already processed")
+        await _raise_unavailable(db, "withdrawals", withdrawal_id, admin_id, "Withdrawal")
+
+    async def back_to_pending(status_code: int, detail: str) -> None:
+        await release_withdrawal_claim(db, withdrawal_id, claim_token)
+        raise HTTPException(status_code=status_code, detail=detail)
     
     # Get user
     user = await db.users.find_one({"id": withdrawal["user_id"]}, {"_id": 0})
     if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+        await back_to_pending(404, "User not found")
     
     # Check balance again
-    if user.get("wallet_balance", 0.0) < withdrawal["amount"]:
-        raise HTTPException(status_code=400, detail="Insufficient user balance")
+    if user.get("wallet_balance", 0) < withdrawal["amount"]:
+        await back_to_pending(400, "Insufficient user balance")
     
     # Update user balance (Phase 2 trust model: approved withdrawal releases locked funds)
-    locked = user.get("locked_balance", 0.0)
-    if locked < withdrawal["amount"]:
-        raise HTTPException(status_code=400, detail="User does not have enough locked funds")
-
-    new_locked = locked - withdrawal["amount"]
-    new_total_withdrawals = user.get("total_withdrawals", 0.0) + withdrawal["amount"]
-
-    await db.users.update_one(
-        {"id": withdrawal["user_id"]},
-        {
-            "$set": {
-                "locked_balance": new_locked,
-                "total_withdrawals": new_total_withdrawals,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }
-        }
-    )
+    balances = await pay_withdrawal(db, withdrawal)
+    if not balances:
+        if not await was_applied(db, withdrawal["user_id"], payout_key(withdrawal_id)):
+            await back_to_pending(400, "User does not have enough locked funds")
+        # Paid out by an earlier approval that died; finish it without paying again
+        logger.warning("Withdrawal %s was already paid out; marking it approved", withdrawal_id)
+        balances = await db.users.find_one({"id": withdrawal["user_id"]}, {"_id": 0, "locked_balance": 1})
+    # The payout leaves locked_balance (the wallet was debited when the request was made)
+    locked_after = int(balances["locked_balance"])
     
     # Update withdrawal status
-    await db.withdrawals.update_one(
-        {"id": withdrawal_id},
-        {
-            "$set": {
-                "status": "approved",
-                "approved_at": datetime.now(timezone.utc).isoformat(),
-                "approved_by": current_admin["user_id"]
-            }
-        }
-    )
+    if not await mark_withdrawal_approved(db, withdrawal_id, claim_token, admin_id):
+        logger.error("Withdrawal %s was paid out but its claim lapsed; the approval recovery sweep settles it", withdrawal_id)
     
     # Create transaction record
     transaction = Transaction(
@@ -383,21 +607,24 @@ async def approve_withdrawal(
         amount=withdrawal["amount"],
         status=TransactionStatus.COMPLETED,
         description=f"Withdrawal approved (secure processing) - JazzCash {withdrawal['jazzcash_number']}",
-        balance_before=user.get("wallet_balance", 0.0),
-        balance_after=user.get("wallet_balance", 0.0)
+        metadata={"withdrawal_id": withdrawal_id, "balance_field": "locked_balance"},
+        balance_before=locked_after + int(withdrawal["amount"]),
+        balance_after=locked_after
     )
     
     transaction_dict = transaction.model_dump()
-    transaction_dict["created_at"] = transaction_dict["created_at"].isoformat()
-    transaction_dict["updated_at"] = transaction_dict["updated_at"].isoformat()
     
-    await db.transactions.insert_one(transaction_dict)
+    await journal.write(db, "transactions", [transaction_dict])
+    await approval_queues.notify(db, "withdrawals", [withdrawal_id])
+    await record_daily(
+        db, datetime.now(timezone.utc), {"withdrawals_amount": withdrawal["amount"], "withdrawals_count": 1}
+    )
     
     # Send email notification to user
     background_tasks.add_task(
         email_service.send_withdrawal_approved_email,
         user_email=user["email"],
-        amount=withdrawal["amount"],
+        amount=to_rupees(withdrawal["amount"]),
         jazzcash_number=withdrawal["jazzcash_number"]
     )
     
@@ -412,22 +639,55 @@ async def reject_withdrawal(
 ):
     """Reject withdrawal request"""
     result = await db.withdrawals.update_one(
-        {"id": withdrawal_id, "status": "pending"},
+        {"id": withdrawal_id, "status": "pending", **lease_free_filter(current_admin["user_id"])},
         {
             "$set": {
                 "status": "rejected",
                 "rejection_reason": reason,
-                "approved_at": datetime.now(timezone.utc).isoformat(),
+                "approved_at": datetime.now(timezone.utc),
                 "approved_by": current_admin["user_id"]
             }
         }
     )
     
     if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Withdrawal not found or already processed")
+        await _raise_unavailable(db, "withdrawals", withdrawal_id, current_admin["user_id"], "Withdrawal")
+    await approval_queues.notify(db, "withdrawals", [withdrawal_id])
     
     return {"message": "Withdrawal rejected successfully"}
 
+# KYC Management
+async def _review_kyc(db, user_id: str, admin_id: str, fields: dict) -> None:
+    result = await db.users.update_one(
+        {"id": user_id, "kyc_status": "pending", **lease_free_filter(admin_id)},
+        {"$set": {**fields, "kyc_reviewed_at": datetime.now(timezone.utc), "kyc_reviewed_by": admin_id}},
+    )
+    if result.matched_count == 0:
+        await _raise_unavailable(db, "kyc", user_id, admin_id, "KYC request")
+    user_state_cache.invalidate(db, user_id)
+    await approval_queues.notify(db, "kyc", [user_id])
+
+@router.put("/kyc/{user_id}/approve")
+async def approve_kyc(
+    user_id: str,
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Approve a user's pending KYC verification"""
+    await _review_kyc(db, user_id, current_admin["user_id"], {"kyc_status": "approved", "kyc_rejection_reason": None})
+    return {"message": "KYC approved successfully"}
+
+@router.put("/kyc/{user_id}/reject")
+async def reject_kyc(
+    user_id: str,
+    reason: str,
+    current_admin: dict = Depends(get_current_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Reject a user's pending KYC verification"""
+    await _review_kyc(db, user_id, current_admin["user_id"], {"kyc_status": "rejected", "kyc_rejection_reason": reason})
+    return {"message": "KYC rejected successfully"}
+
 # Game Settings Management
 @router.get("/games", response_model=List[GameSettings])
 async def get_all_game_settings(
@@ -447,7 +707,7 @@ async def update_game_settings(
 ):
     """Update game settings"""
     settings_dict = settings.model_dump()
-    settings_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
+    settings_dict["updated_at"] = datetime.now(timezone.utc)
     
     await db.game_settings.update_one(
         {"game_id": game_id},
@@ -471,9 +731,6 @@ async def create_notification(
     )
     
     notification_dict = notification.model_dump()
-    notification_dict["created_at"] = notification_dict["created_at"].isoformat()
-    if notification_dict.get("expires_at"):
-        notification_dict["expires_at"] = notification_dict["expires_at"].isoformat()
     
     await db.notifications.insert_one(notification_dict)
     
@@ -481,17 +738,27 @@ async def create_notification(
 
 @router.get("/notifications", response_model=List[Notification])
 async def get_all_notifications(
-    skip: int = 0,
+    response: Response,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True),
     current_admin: dict = Depends(get_current_admin),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get all notifications (1 year history)"""
     one_year_ago = datetime.now(timezone.utc) - timedelta(days=365)
     
-    notifications = await db.notifications.find(
-        {"created_at": {"$gte": one_year_ago.isoformat()}},
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    try:
+        notifications, next_cursor = await fetch_page(
+            db.notifications,
+            {"created_at": {"$gte": one_year_ago}},
+            {"_id": 0},
+            limit,
+            cursor=cursor,
+            skip=skip,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
     
     return [Notification(**n) for n in notifications]
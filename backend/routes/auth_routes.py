@@ -1,7 +1,7 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Request, status, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import UserCreate, UserLogin, TokenResponse, User, UserRole
-from auth import get_password_hash, verify_password, create_access_token
+from auth import check_account, get_password_hash_async, verify_password_async, create_access_token
 import os
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -10,9 +10,22 @@ def get_db() -> AsyncIOMotorDatabase:
     from server import db
     return db
 
+async def enforce_throttle(db: AsyncIOMotorDatabase, request: Request, route: str, email: str) -> None:
+    from services.throttle_service import check_auth_throttle, client_ip
+
+    ip = client_ip(request.headers, request.client.host if request.client else None)
+    if not await check_auth_throttle(db, route, ip, email):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please try again later",
+            headers={"Retry-After": "60"},
+        )
+
 @router.post("/register", response_model=TokenResponse)
-async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get_db)):
+async def register(user_data: UserCreate, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Register a new user"""
+    await enforce_throttle(db, request, "register", user_data.email)
+
     # Check if user already exists
     existing_user = await db.users.find_one({"email": user_data.email}, {"_id": 0})
     if existing_user:
@@ -22,14 +35,12 @@ async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get
         )
     
     # Hash password
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     
     # Create user object
     user = User(**user_data.model_dump(exclude={"password", "referral_code"}))
     user_dict = user.model_dump()
     user_dict["password_hash"] = hashed_password
-    user_dict["created_at"] = user_dict["created_at"].isoformat()
-    user_dict["updated_at"] = user_dict["updated_at"].isoformat()
     
     # Handle referral (apply only at signup)
     if user_data.referral_code:
@@ -52,7 +63,10 @@ async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get
                 },
             )
     
-    # Insert user
+    # Insert user (with the normalized fields/tokens admin search runs on)
+    from services.user_search_service import search_fields
+
+    user_dict.update(search_fields(user_dict))
     await db.users.insert_one(user_dict)
     
     # Create access token
@@ -65,8 +79,10 @@ async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get
     return TokenResponse(access_token=access_token, user=user)
 
 @router.post("/login", response_model=TokenResponse)
-async def login(credentials: UserLogin, db: AsyncIOMotorDatabase = Depends(get_db)):
+async def login(credentials: UserLogin, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Login user"""
+    await enforce_throttle(db, request, "login", credentials.email)
+
     # Find user
     user_dict = await db.users.find_one({"email": credentials.email}, {"_id": 0})
     if not user_dict:
@@ -76,18 +92,14 @@ async def login(credentials: UserLogin, db: AsyncIOMotorDatabase = Depends(get_d
         )
     
     # Verify password
-    if not verify_password(credentials.password, user_dict.get("password_hash", "")):
+    if not await verify_password_async(credentials.password, user_dict.get("password_hash", "")):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
     
-    # Check if user is active
-    if not user_dict.get("is_active", True):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Account is suspended"
-        )
+    # Check if the account is usable (same check every authenticated request makes)
+    check_account(user_dict)
     
     # Remove password hash from response
     user_dict.pop("password_hash", None)
@@ -103,8 +115,10 @@ async def login(credentials: UserLogin, db: AsyncIOMotorDatabase = Depends(get_d
     return TokenResponse(access_token=access_token, user=user)
 
 @router.post("/admin/login", response_model=TokenResponse)
-async def admin_login(credentials: UserLogin, db: AsyncIOMotorDatabase = Depends(get_db)):
+async def admin_login(credentials: UserLogin, request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Admin login"""
+    await enforce_throttle(db, request, "admin_login", credentials.email)
+
     # Find user
     user_dict = await db.users.find_one({"email": credentials.email, "role": "admin"}, {"_id": 0})
     if not user_dict:
@@ -114,7 +128,7 @@ async def admin_login(credentials: UserLogin, db: AsyncIOMotorDatabase = Depends
         )
     
     # Verify password
-    if not verify_password(credentials.password, user_dict.get("password_hash", "")):
+    if not await verify_password_async(credentials.password, user_dict.get("password_hash", "")):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid admin credentials"
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from auth import get_current_user
 from services.download_bonus_service import try_grant_download_bonus
+from services.user_cache_service import user_state_cache
+from money import rupees_fields
 
 router = APIRouter(prefix="/bonus", tags=["Bonus"])
 
@@ -17,7 +19,11 @@ async def claim_app_download_bonus(
     current_user: dict = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    user = await user_state_cache.get(db, current_user["user_id"])
+    if not user:
+        return {"granted": False, "data": None}
     res = await try_grant_download_bonus(db, user)
+    if res:
+        res = rupees_fields(res, ("amount", "new_balance"))
     # Silent failure: always return ok, UI can just refresh balance
     return {"granted": bool(res), "data": res}
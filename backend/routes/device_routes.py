@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from auth import get_current_user
 from datetime import datetime, timezone
+from services.user_cache_service import user_state_cache
 
 router = APIRouter(prefix="/device", tags=["Device"])
 
@@ -22,12 +23,13 @@ async def register_device(
     app_install_id = payload.get("app_install_id")
     device_fingerprint = payload.get("device_fingerprint")
 
-    update = {"updated_at": datetime.now(timezone.utc).isoformat()}
+    update = {"updated_at": datetime.now(timezone.utc)}
     if app_install_id:
         update["app_install_id"] = str(app_install_id)
     if device_fingerprint:
         update["device_fingerprint"] = str(device_fingerprint)
 
     await db.users.update_one({"id": current_user["user_id"]}, {"$set": update})
+    user_state_cache.invalidate(db, current_user["user_id"])
 
     return {"message": "Device registered"}
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks, Query, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import (
     DepositRequest, Deposit, WithdrawalRequest, Withdrawal,
@@ -6,16 +6,17 @@ from models import (
 )
 from auth import get_current_user
 from email_service import email_service
-from typing import List, Any
+from money import to_paisa, to_rupees
+from services.pagination_service import fetch_page, set_next_cursor
+from services.approval_queue_service import approval_queues
+from services.settings_service import settings_registry
+from services.user_cache_service import user_state_cache
+from services.write_behind_service import journal
+from typing import List, Optional
+import asyncio
 from datetime import datetime, timezone, timedelta
 
 
-async def _get_setting(db: AsyncIOMotorDatabase, key: str, default: Any) -> Any:
-    doc = await db.system_settings.find_one({"setting_key": key}, {"_id": 0})
-    if doc and "setting_value" in doc:
-        return doc["setting_value"]
-    return default
-
 router = APIRouter(prefix="/payment", tags=["Payment"])
 
 def get_db() -> AsyncIOMotorDatabase:
@@ -30,25 +31,26 @@ async def create_deposit_request(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Create deposit request"""
-    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    user = await user_state_cache.get(db, current_user["user_id"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.get("is_active", True) or user.get("is_frozen"):
         raise HTTPException(status_code=403, detail="Account is not eligible for transactions")
 
     # Deposit minimum can be lowered to PKR 100 ONLY when first-deposit-108 promo is eligible and selected.
-    deposit_min = float(await _get_setting(db, "deposit_min", 300))
-    deposit_max = float(await _get_setting(db, "deposit_max", 50000))
+    settings = await settings_registry.snapshot(db)
+    deposit_min = settings["deposit_min"]
+    deposit_max = settings["deposit_max"]
 
     promo_key = getattr(deposit_data, "promotion_key", None)
     first_deposit_eligible = bool(user.get("first_deposit_108_eligible", True))
     if promo_key == "first_deposit_108" and first_deposit_eligible:
-        deposit_min = float(await _get_setting(db, "first_deposit_108_min_deposit", 100))
+        deposit_min = settings["first_deposit_108_min_deposit"]
 
-    if deposit_data.amount < deposit_min:
+    if deposit_data.amount < to_paisa(deposit_min):
         raise HTTPException(status_code=400, detail=f"Minimum deposit amount is PKR {int(deposit_min)}")
 
-    if deposit_data.amount > deposit_max:
+    if deposit_data.amount > to_paisa(deposit_max):
         raise HTTPException(status_code=400, detail=f"Maximum deposit amount is PKR {int(deposit_max)}")
     
     # User already loaded above
@@ -67,9 +69,9 @@ async def create_deposit_request(
     )
     
     deposit_dict = deposit.model_dump()
-    deposit_dict["created_at"] = deposit_dict["created_at"].isoformat()
     
-    await db.deposits.insert_one(deposit_dict)
+    await journal.write(db, "deposits", [deposit_dict])
+    await approval_queues.notify(db, "deposits", [deposit.id])
 
     # First-deposit-108: eligibility is consumed on FIRST deposit request (claimed/skipped/rejected => never show again)
     deposit_count = await db.deposits.count_documents({"user_id": current_user["user_id"]})
@@ -80,17 +82,18 @@ async def create_deposit_request(
                 "$set": {
                     "first_deposit_108_eligible": False,
                     "first_deposit_108_used": True,
-                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                    "updated_at": datetime.now(timezone.utc),
                 }
             },
         )
+        user_state_cache.invalidate(db, current_user["user_id"])
     
     # Send email notification to admin
     background_tasks.add_task(
         email_service.send_deposit_notification,
         user_email=user["email"],
         user_name=user.get("full_name", ""),
-        amount=deposit_data.amount,
+        amount=to_rupees(deposit_data.amount),
         jazzcash_number=deposit_data.jazzcash_number,
         deposit_id=deposit.id
     )
@@ -105,21 +108,31 @@ async def create_deposit_request(
 
 @router.get("/deposits", response_model=List[Deposit])
 async def get_deposits(
-    skip: int = 0,
+    response: Response,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True),
     current_user: dict = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    """Get user deposit history (last 3 months)"""
+    """Get user deposit history (last 3 months). Pass the X-Next-Cursor header back as `cursor` for the next page."""
     three_months_ago = datetime.now(timezone.utc) - timedelta(days=90)
     
-    deposits = await db.deposits.find(
-        {
-            "user_id": current_user["user_id"],
-            "created_at": {"$gte": three_months_ago.isoformat()}
-        },
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    try:
+        deposits, next_cursor = await fetch_page(
+            db.deposits,
+            {
+                "user_id": current_user["user_id"],
+                "created_at": {"$gte": three_months_ago}
+            },
+            {"_id": 0},
+            limit,
+            cursor=cursor,
+            skip=skip,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
     
     return [Deposit(**d) for d in deposits]
 
@@ -132,7 +145,7 @@ async def create_withdrawal_request(
 ):
     """Create withdrawal request"""
     # Get user
-    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    user = await user_state_cache.get(db, current_user["user_id"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.get("is_active", True) or user.get("is_frozen"):
@@ -145,8 +158,9 @@ async def create_withdrawal_request(
             detail="KYC verification required before withdrawal"
         )
     
-    withdraw_min = float(await _get_setting(db, "withdraw_min", 300))
-    withdraw_max = float(await _get_setting(db, "withdraw_max", 30000))
+    settings = await settings_registry.snapshot(db)
+    withdraw_min = settings["withdraw_min"]
+    withdraw_max = settings["withdraw_max"]
 
     # Block withdrawal if any wagering is active
     from services.wagering_service import wagering_status
@@ -158,41 +172,30 @@ async def create_withdrawal_request(
     if user.get("wallet_balance", 0) < withdrawal_data.amount:
         raise HTTPException(status_code=400, detail="Insufficient balance")
 
-    if withdrawal_data.amount < withdraw_min:
+    if withdrawal_data.amount < to_paisa(withdraw_min):
         raise HTTPException(status_code=400, detail=f"Minimum withdrawal amount is PKR {int(withdraw_min)}")
 
-    if withdrawal_data.amount > withdraw_max:
+    if withdrawal_data.amount > to_paisa(withdraw_max):
         raise HTTPException(status_code=400, detail=f"Maximum withdrawal amount is PKR {int(withdraw_max)}")
     
     # Lock funds for withdrawal (Phase 2 trust model)
-    available = float(user.get("wallet_balance", 0.0))
-    locked = float(user.get("locked_balance", 0.0))
-
-    new_available = available - float(withdrawal_data.amount)
-    new_locked = locked + float(withdrawal_data.amount)
-
-    await db.users.update_one(
-        {"id": current_user["user_id"]},
-        {
-            "$set": {
-                "wallet_balance": new_available,
-                "locked_balance": new_locked,
-                "updated_at": datetime.now(timezone.utc).isoformat(),
-            }
-        },
-    )
+    from services.wallet_service import lock_funds
 
-    # Create withdrawal record
     withdrawal = Withdrawal(
         user_id=current_user["user_id"],
         amount=withdrawal_data.amount,
         jazzcash_number=withdrawal_data.jazzcash_number,
     )
 
-    withdrawal_dict = withdrawal.model_dump()
-    withdrawal_dict["created_at"] = withdrawal_dict["created_at"].isoformat()
+    balances = await lock_funds(db, current_user["user_id"], withdrawal_data.amount, ref_id=withdrawal.id)
+    if not balances:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+    new_available = int(balances["wallet_balance"])
+    available = new_available + withdrawal_data.amount
 
-    await db.withdrawals.insert_one(withdrawal_dict)
+    # Create withdrawal record
+
+    withdrawal_dict = withdrawal.model_dump()
 
     # Create transaction record (pending)
     txn = Transaction(
@@ -207,16 +210,20 @@ async def create_withdrawal_request(
     )
 
     txn_dict = txn.model_dump()
-    txn_dict["created_at"] = txn_dict["created_at"].isoformat()
-    txn_dict["updated_at"] = txn_dict["updated_at"].isoformat()
-    await db.transactions.insert_one(txn_dict)
+
+    # Both records share one write-behind flush
+    await asyncio.gather(
+        journal.write(db, "withdrawals", [withdrawal_dict]),
+        journal.write(db, "transactions", [txn_dict]),
+    )
+    await approval_queues.notify(db, "withdrawals", [withdrawal.id])
     
     # Send email notification to admin
     background_tasks.add_task(
         email_service.send_withdrawal_notification,
         user_email=user["email"],
         user_name=user.get("full_name", ""),
-        amount=withdrawal_data.amount,
+        amount=to_rupees(withdrawal_data.amount),
         jazzcash_number=withdrawal_data.jazzcash_number,
         withdrawal_id=withdrawal.id
     )
@@ -230,20 +237,30 @@ async def create_withdrawal_request(
 
 @router.get("/withdrawals", response_model=List[Withdrawal])
 async def get_withdrawals(
-    skip: int = 0,
+    response: Response,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True),
     current_user: dict = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
-    """Get user withdrawal history (last 3 months)"""
+    """Get user withdrawal history (last 3 months). Pass the X-Next-Cursor header back as `cursor` for the next page."""
     three_months_ago = datetime.now(timezone.utc) - timedelta(days=90)
     
-    withdrawals = await db.withdrawals.find(
-        {
-            "user_id": current_user["user_id"],
-            "created_at": {"$gte": three_months_ago.isoformat()}
-        },
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    try:
+        withdrawals, next_cursor = await fetch_page(
+            db.withdrawals,
+            {
+                "user_id": current_user["user_id"],
+                "created_at": {"$gte": three_months_ago}
+            },
+            {"_id": 0},
+            limit,
+            cursor=cursor,
+            skip=skip,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
     
     return [Withdrawal(**w) for w in withdrawals]
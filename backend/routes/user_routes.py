@@ -1,9 +1,14 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import User, UserUpdate, Transaction, Bet
 from auth import get_current_user
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timezone, timedelta
+from money import to_rupees
+from services.pagination_service import fetch_page, set_next_cursor
+from services.timeline_service import parse_timeline_cursor, timeline_page
+from services.user_cache_service import user_state_cache
+from services.user_search_service import search_fields
 
 router = APIRouter(prefix="/user", tags=["User"])
 
@@ -14,7 +19,7 @@ def get_db() -> AsyncIOMotorDatabase:
 @router.get("/profile", response_model=User)
 async def get_profile(current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get current user profile"""
-    user_dict = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0, "password_hash": 0})
+    user_dict = await user_state_cache.get(db, current_user["user_id"])
     if not user_dict:
         raise HTTPException(status_code=404, detail="User not found")
     return User(**user_dict)
@@ -26,24 +31,31 @@ async def update_profile(update_data: UserUpdate, current_user: dict = Depends(g
     if not update_dict:
         raise HTTPException(status_code=400, detail="No data to update")
     
-    update_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
+    update_dict["updated_at"] = datetime.now(timezone.utc)
+
+    # Name/phone feed the admin search tokens; email and referral code never change
+    current = await user_state_cache.get(db, current_user["user_id"])
+    if not current:
+        raise HTTPException(status_code=404, detail="User not found")
+    update_dict.update(search_fields({**current, **update_dict}))
     
     await db.users.update_one(
         {"id": current_user["user_id"]},
         {"$set": update_dict}
     )
+    user_state_cache.invalidate(db, current_user["user_id"])
     
-    user_dict = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0, "password_hash": 0})
+    user_dict = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0, "password_hash": 0, "search": 0})
     return User(**user_dict)
 
 @router.get("/wallet/balance")
 async def get_wallet_balance(current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get wallet balance"""
-    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0, "wallet_balance": 1})
+    user = await user_state_cache.get(db, current_user["user_id"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    balance = float(user.get("wallet_balance", 0.0))
+    balance = to_rupees(user.get("wallet_balance", 0))
 
     return {
         "currency": "PKR",
@@ -53,47 +65,94 @@ async def get_wallet_balance(current_user: dict = Depends(get_current_user), db:
     }
 
 @router.get("/transactions", response_model=List[Transaction])
-async def get_transactions(skip: int = 0, limit: int = 50, current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db)):
-    """Get user transaction history (last 3 months)"""
+async def get_transactions(
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get user transaction history (last 3 months). Pass the X-Next-Cursor header back as `cursor` for the next page."""
     three_months_ago = datetime.now(timezone.utc) - timedelta(days=90)
     
-    transactions = await db.transactions.find(
-        {
-            "user_id": current_user["user_id"],
-            "created_at": {"$gte": three_months_ago.isoformat()}
-        },
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    try:
+        transactions, next_cursor = await fetch_page(
+            db.transactions,
+            {
+                "user_id": current_user["user_id"],
+                "created_at": {"$gte": three_months_ago}
+            },
+            {"_id": 0},
+            limit,
+            cursor=cursor,
+            skip=skip,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
     
     return [Transaction(**t) for t in transactions]
 
 @router.get("/bets", response_model=List[Bet])
-async def get_betting_history(skip: int = 0, limit: int = 50, current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db)):
-    """Get user betting history (last 3 months)"""
+async def get_betting_history(
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, deprecated=True),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get user betting history (last 3 months). Pass the X-Next-Cursor header back as `cursor` for the next page."""
     three_months_ago = datetime.now(timezone.utc) - timedelta(days=90)
     
-    bets = await db.bets.find(
-        {
-            "user_id": current_user["user_id"],
-            "created_at": {"$gte": three_months_ago.isoformat()}
-        },
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    try:
+        bets, next_cursor = await fetch_page(
+            db.bets,
+            {
+                "user_id": current_user["user_id"],
+                "created_at": {"$gte": three_months_ago}
+            },
+            {"_id": 0},
+            limit,
+            cursor=cursor,
+            skip=skip,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, next_cursor)
     
     return [Bet(**b) for b in bets]
 
+@router.get("/timeline")
+async def get_timeline(
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Bets, deposits, withdrawals and transactions (last 3 months) merged newest first, with one cursor"""
+    try:
+        position = parse_timeline_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items, next_cursor = await timeline_page(db, current_user["user_id"], limit, position)
+    set_next_cursor(response, next_cursor)
+    return {"items": items, "next_cursor": next_cursor}
+
 @router.get("/stats")
 async def get_user_stats(current_user: dict = Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_db)):
     """Get user statistics"""
-    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
+    user = await user_state_cache.get(db, current_user["user_id"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     return {
-        "total_deposits": user.get("total_deposits", 0.0),
-        "total_withdrawals": user.get("total_withdrawals", 0.0),
-        "total_bets": user.get("total_bets", 0.0),
-        "total_wins": user.get("total_wins", 0.0),
-        "profit_loss": user.get("total_wins", 0.0) - user.get("total_bets", 0.0),
+        "total_deposits": to_rupees(user.get("total_deposits", 0)),
+        "total_withdrawals": to_rupees(user.get("total_withdrawals", 0)),
+        "total_bets": to_rupees(user.get("total_bets", 0)),
+        "total_wins": to_rupees(user.get("total_wins", 0)),
+        "profit_loss": to_rupees(user.get("total_wins", 0) - user.get("total_bets", 0)),
         "vip_level": user.get("vip_level", 0)
     }
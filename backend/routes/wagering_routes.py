@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from auth import get_current_user
-from services.wagering_service import wagering_status
+from services.wagering_service import wagering_status, wagering_status_rupees
 
 router = APIRouter(prefix="/wagering", tags=["Wagering"])
 
@@ -14,7 +14,9 @@ def get_db() -> AsyncIOMotorDatabase:
 
 @router.get("/status")
 async def get_wagering_status(
+    include_records: bool = False,
     current_user: dict = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    return await wagering_status(db, current_user["user_id"])
+    """Summary of active wagering requirements; `include_records` also lists the records."""
+    return wagering_status_rupees(await wagering_status(db, current_user["user_id"], include_records))
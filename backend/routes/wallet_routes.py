@@ -1,7 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from auth import get_current_user
-from datetime import datetime, timezone
 
 router = APIRouter(prefix="/wallet", tags=["Wallet"])
 
@@ -19,31 +18,28 @@ async def unlock_funds(
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
     """Move funds from locked_balance -> wallet_balance (Phase 2 trust step)."""
-    amount = float(payload.get("amount", 0))
+    from money import to_paisa, to_rupees
+
+    try:
+        amount = to_paisa(payload.get("amount", 0))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid amount")
     if amount <= 0:
         raise HTTPException(status_code=400, detail="Invalid amount")
 
-    user = await db.users.find_one({"id": current_user["user_id"]}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    from services.wallet_service import unlock_funds as move_locked_to_wallet
+
+    balances = await move_locked_to_wallet(db, current_user["user_id"], amount)
+    if not balances:
+        from services.user_cache_service import user_state_cache
 
-    locked = float(user.get("locked_balance", 0.0))
-    if locked < amount:
+        user = await user_state_cache.get(db, current_user["user_id"])
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
         raise HTTPException(status_code=400, detail="Insufficient locked balance")
 
-    new_locked = locked - amount
-    new_wallet = float(user.get("wallet_balance", 0.0)) + amount
-
-    await db.users.update_one(
-        {"id": current_user["user_id"]},
-        {
-            "$set": {
-                "locked_balance": new_locked,
-                "wallet_balance": new_wallet,
-                "updated_at": datetime.now(timezone.utc).isoformat(),
-            }
-        },
-    )
+    new_locked = to_rupees(balances["locked_balance"])
+    new_wallet = to_rupees(balances["wallet_balance"])
 
     return {
         "message": "Funds unlocked",
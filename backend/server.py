@@ -12,10 +12,21 @@ load_dotenv(ROOT_DIR / '.env')
 
 # Import routes AFTER loading environment variables
 from routes import auth_routes, user_routes, payment_routes, admin_routes, game_routes, wallet_routes, admin_settings_routes, wagering_routes, promotion_routes, device_routes, bonus_routes, admin_bonus_routes
+from money import MONEY_MIGRATION_ID, set_strict_stored_paisa
+from services.approval_queue_service import approval_queues
+from services.approval_recovery_service import approval_recovery
+from services.archive_service import history_archiver
+from services.crash_round_service import crash_engine
+from services.index_service import apply_indexes, index_drift
+from services.ledger_service import ledger_replay
+from services.settings_service import settings_registry
+from services.stats_service import start_counting
+from services.user_cache_service import user_state_cache
+from services.write_behind_service import journal
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
@@ -59,6 +70,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -71,18 +83,48 @@ logger = logging.getLogger(__name__)
 @app.on_event("startup")
 async def startup_event():
     logger.info("WINPKRHUB API starting up...")
-    # Create indexes
-    await db.users.create_index("email", unique=True)
-    await db.users.create_index("referral_code", unique=True)
-    await db.deposits.create_index("user_id")
-    await db.withdrawals.create_index("user_id")
-    await db.transactions.create_index("user_id")
-    await db.bets.create_index("user_id")
-    await db.system_settings.create_index("setting_key", unique=True)
-    await db.security_events.create_index("user_id")
-    logger.info("Database indexes created")
+    # Indexes are applied at deploy time (apply_indexes.py); workers only report drift
+    if os.environ.get("DB_APPLY_INDEXES_ON_STARTUP", "").lower() in ("1", "true", "yes"):
+        result = await apply_indexes(db)
+        logger.info("Database indexes applied: %d created", len(result["created"]))
+    drift = await index_drift(db)
+    if drift["missing"] or drift["conflicting"]:
+        logger.warning(
+            "Index drift: %d missing, %d conflicting; run apply_indexes.py",
+            len(drift["missing"]),
+            len(drift["conflicting"]),
+        )
+
+    money_migration = await db.migrations.find_one({"id": MONEY_MIGRATION_ID}, {"_id": 0, "completed_at": 1})
+    if money_migration and money_migration.get("completed_at"):
+        set_strict_stored_paisa(True)
+    else:
+        logger.error("Money migration has not completed; run migrate_money_to_paisa.py before serving traffic")
+
+    await settings_registry.reload(db)
+    await start_counting(db)
+    settings_registry.start(db)
+    journal.start(db)
+    ledger_replay.start(db)
+    user_state_cache.start(db)
+    crash_engine.start(db)
+    history_archiver.start(db)
+    approval_queues.start(db)
+    approval_recovery.start(db)
+    logger.info(
+        "Settings watcher, write-behind journal, user cache bus, crash round engine, history archiver, "
+        "approval queues and approval recovery started"
+    )
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await approval_recovery.stop()
+    await approval_queues.stop()
+    await history_archiver.stop()
+    await crash_engine.stop()
+    await user_state_cache.stop()
+    await journal.stop()
+    await ledger_replay.stop()
+    await settings_registry.stop()
     client.close()
     logger.info("WINPKRHUB API shutting down...")
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+from money import to_rupees
+from services.settings_service import settings_registry
+from services.write_behind_service import journal
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = float(os.getenv("QUEUE_POLL_SECONDS", "0.5"))
+RESYNC_SECONDS = float(os.getenv("QUEUE_RESYNC_SECONDS", "60"))
+LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+MAX_ITEMS = int(os.getenv("QUEUE_MAX_ITEMS", "5000"))  # per queue held in memory
+SUBSCRIBER_BUFFER = 1000
+HEARTBEAT_SECONDS = 15.0
+EVENT_OVERLAP_SECONDS = 5.0  # re-read window covering clock skew between workers
+EVENT_RETENTION = timedelta(minutes=10)
+
+WORKER_ID = uuid.uuid4().hex
+
+# Set on an item while an admin works on it; approvals by other admins are refused until it expires
+LEASE_FIELD = "review_lease"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass(frozen=True)
+class QueueSource:
+    collection: str
+    match: Dict[str, Any]
+    time_field: str
+    user_field: str
+    amount_field: Optional[str] = None
+    projection: Dict[str, Any] = field(default_factory=lambda: {"_id": 0})
+
+
+QUEUES: Dict[str, QueueSource] = {
+    "deposits": QueueSource("deposits", {"status": "pending"}, "created_at", "user_id", "amount"),
+    "withdrawals": QueueSource("withdrawals", {"status": "pending"}, "created_at", "user_id", "amount"),
+    "kyc": QueueSource(
+        "users",
+        {"kyc_status": "pending"},
+        "updated_at",
+        "id",
+        projection={
+            "_id": 0, "id": 1, "email": 1, "full_name": 1, "kyc_status": 1, "vip_level": 1,
+            "created_at": 1, "updated_at": 1, LEASE_FIELD: 1,
+        },
+    ),
+}
+
+
+def lease_free_filter(admin_id: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Items `admin_id` may act on: not leased, lease expired, or leased by that admin."""
+    now = now or _now()
+    return {
+        "$or": [
+            {LEASE_FIELD: None},
+            {f"{LEASE_FIELD}.expires_at": {"$lt": now}},
+            {f"{LEASE_FIELD}.admin_id": admin_id},
+        ]
+    }
+
+
+def _lease_free(item: Dict[str, Any], admin_id: str, now: datetime) -> bool:
+    lease = item.get(LEASE_FIELD)
+    return not lease or lease["expires_at"] < now or lease["admin_id"] == admin_id
+
+
+class _Subscriber:
+    def __init__(self) -> None:
+        self.events: asyncio.Queue = asyncio.Queue(SUBSCRIBER_BUFFER)
+
+
+class ApprovalQueues:
+    """Per-worker in-memory view of the pending deposit, withdrawal and KYC queues.
+
+    Loaded once, then kept current by targeted re-reads of the items that changed:
+    writers call notify(), which refreshes this worker immediately and publishes the
+    ids on the queue_events bus for the other workers. A full resync every
+    RESYNC_SECONDS catches writes made outside the API. Admin consoles read the view
+    or subscribe to its deltas, so Mongo load does not grow with the number of admins.
+    """
+
+    def __init__(self) -> None:
+        self._items: Dict[str, Dict[str, Dict[str, Any]]] = {name: {} for name in QUEUES}
+        self._dirty: Dict[str, set] = {name: set() for name in QUEUES}
+        self._subscribers: set[_Subscriber] = set()
+        self._seen: Dict[Any, float] = {}
+        self._since = time.time()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._loaded = False
+        self._resynced_at = 0.0
+        self.resyncs = 0
+        self.refreshes = 0
+        self.events_sent = 0
+        self.dropped_subscribers = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db) -> None:
+        if self.running:
+            return
+        self._since = time.time()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, db) -> None:
+        while True:
+            try:
+                if time.monotonic() - self._resynced_at >= RESYNC_SECONDS:
+                    await self.resync(db)
+                await self._drain(db)
+                for queue, ids in self._dirty.items():
+                    if ids:
+                        self._dirty[queue] = set()
+                        await self._refresh(db, queue, ids)
+            except Exception:
+                logger.exception("Approval queue sync failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    # -------------------------
+    # Loading
+    # -------------------------
+
+    async def _with_vip(self, db, queue: str, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        source = QUEUES[queue]
+        if source.collection == "users" or not docs:
+            return docs
+        users = await db.users.find(
+            {"id": {"$in": list({d[source.user_field] for d in docs})}}, {"_id": 0, "id": 1, "vip_level": 1}
+        ).to_list(None)
+        vip = {u["id"]: int(u.get("vip_level") or 0) for u in users}
+        for d in docs:
+            d["vip_level"] = vip.get(d[source.user_field], 0)
+        return docs
+
+    def _apply(self, queue: str, item_id: str, doc: Optional[Dict[str, Any]]) -> None:
+        items = self._items[queue]
+        if doc is None:
+            if items.pop(item_id, None) is not None:
+                self._broadcast({"queue": queue, "op": "remove", "id": item_id})
+        elif items.get(item_id) != doc:
+            items[item_id] = doc
+            self._broadcast({"queue": queue, "op": "upsert", "item": doc})
+
+    async def resync(self, db) -> None:
+        """Reload every queue and emit the differences."""
+        for queue, source in QUEUES.items():
+            docs = await (
+                db[source.collection]
+                .find(source.match, source.projection)
+                .sort(source.time_field, 1)
+                .limit(MAX_ITEMS)
+                .to_list(MAX_ITEMS)
+            )
+            fresh = {d["id"]: d for d in await self._with_vip(db, queue, docs)}
+            for item_id in list(self._items[queue]):
+                if item_id not in fresh:
+                    self._apply(queue, item_id, None)
+            for item_id, doc in fresh.items():
+                self._apply(queue, item_id, doc)
+        self._loaded = True
+        self._resynced_at = time.monotonic()
+        self.resyncs += 1
+
+    async def _refresh(self, db, queue: str, ids: Iterable[str]) -> None:
+        ids = list(ids)
+        source = QUEUES[queue]
+        docs = await db[source.collection].find({"id": {"$in": ids}, **source.match}, source.projection).to_list(None)
+        fresh = {d["id"]: d for d in await self._with_vip(db, queue, docs)}
+        for item_id in ids:
+            self._apply(queue, item_id, fresh.get(item_id))
+        self.refreshes += 1
+
+    async def notify(self, db, queue: str, ids: Iterable[str]) -> None:
+        """Items of `queue` were created, changed or settled: refresh them here and tell other workers."""
+        ids = [i for i in ids if i]
+        if not ids:
+            return
+        expires_at = _now() + EVENT_RETENTION
+        at = time.time()
+        journal.write_nowait(
+            db,
+            "queue_events",
+            [{"queue": queue, "item_id": i, "worker": WORKER_ID, "at": at, "expires_at": expires_at} for i in ids],
+        )
+        if self._loaded:
+            await self._refresh(db, queue, ids)
+
+    async def _drain(self, db) -> None:
+        cursor = db.queue_events.find(
+            {"at": {"$gt": self._since - EVENT_OVERLAP_SECONDS}, "worker": {"$ne": WORKER_ID}},
+            {"queue": 1, "item_id": 1, "at": 1},
+        )
+        async for doc in cursor:
+            if doc["_id"] in self._seen:
+                continue
+            self._seen[doc["_id"]] = doc["at"]
+            self._since = max(self._since, doc["at"])
+            if doc.get("queue") in self._dirty:
+                self._dirty[doc["queue"]].add(doc["item_id"])
+
+        cutoff = self._since - EVENT_OVERLAP_SECONDS
+        for key, at in list(self._seen.items()):
+            if at <= cutoff:
+                del self._seen[key]
+
+    # -------------------------
+    # Reading
+    # -------------------------
+
+    async def _ensure_loaded(self, db) -> None:
+        if not self._loaded:
+            await self.resync(db)
+
+    async def pending(self, db, queue: str, limit: int) -> List[Dict[str, Any]]:
+        """Pending items newest first, like the legacy pending lists."""
+        await self._ensure_loaded(db)
+        source = QUEUES[queue]
+        epoch = datetime.min.replace(tzinfo=timezone.utc)
+        items = sorted(self._items[queue].values(), key=lambda d: d.get(source.time_field) or epoch, reverse=True)
+        return [dict(d) for d in items[:limit]]
+
+    async def ranked(self, db, queue: str, limit: int) -> List[Dict[str, Any]]:
+        """Pending items in processing order, each with its `priority_at`.
+
+        priority_at is the item's age reference moved earlier by a credit per VIP level
+        and per PKR 10,000, so older items still rise to the top while large or VIP items
+        jump ahead by a bounded amount.
+        """
+        await self._ensure_loaded(db)
+        settings = await settings_registry.snapshot(db)
+        vip_minutes = float(settings["queue_vip_boost_minutes"])
+        amount_minutes = float(settings["queue_amount_boost_minutes_per_10k"])
+        source = QUEUES[queue]
+        epoch = datetime.min.replace(tzinfo=timezone.utc) + timedelta(days=366)
+
+        out = []
+        for doc in self._items[queue].values():
+            credit = int(doc.get("vip_level") or 0) * vip_minutes
+            if source.amount_field:
+                credit += to_rupees(int(doc.get(source.amount_field) or 0)) / 10000 * amount_minutes
+            out.append({**doc, "priority_at": (doc.get(source.time_field) or epoch) - timedelta(minutes=credit)})
+        out.sort(key=lambda d: (d["priority_at"], d["id"]))
+        return out[:limit]
+
+    # -------------------------
+    # Leases
+    # -------------------------
+
+    async def claim(self, db, queue: str, admin_id: str, item_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Lease an item to `admin_id` (the given one, or the highest-priority free one).
+
+        Claiming an item one already holds renews the lease. Returns the leased item,
+        or None when it is gone, processed or held by another admin.
+        """
+        source = QUEUES[queue]
+        now = _now()
+        if item_id is not None:
+            candidates = [item_id]
+        else:
+            ranked = await self.ranked(db, queue, MAX_ITEMS)
+            candidates = [d["id"] for d in ranked if _lease_free(d, admin_id, now)][:10]
+
+        lease = {"admin_id": admin_id, "expires_at": now + timedelta(seconds=LEASE_SECONDS)}
+        for candidate in candidates:
+            doc = await db[source.collection].find_one_and_update(
+                {"id": candidate, **source.match, **lease_free_filter(admin_id, now)},
+                {"$set": {LEASE_FIELD: lease}},
+                projection=source.projection,
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc:
+                await self.notify(db, queue, [candidate])
+                return doc
+        return None
+
+    async def release(self, db, queue: str, item_id: str, admin_id: str) -> bool:
+        source = QUEUES[queue]
+        result = await db[source.collection].update_one(
+            {"id": item_id, f"{LEASE_FIELD}.admin_id": admin_id}, {"$unset": {LEASE_FIELD: ""}}
+        )
+        if result.modified_count:
+            await self.notify(db, queue, [item_id])
+        return bool(result.modified_count)
+
+    # -------------------------
+    # Subscribers
+    # -------------------------
+
+    def subscribe(self) -> _Subscriber:
+        sub = _Subscriber()
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: _Subscriber) -> None:
+        self._subscribers.discard(sub)
+
+    def _broadcast(self, event: Dict[str, Any]) -> None:
+        for sub in list(self._subscribers):
+            try:
+                sub.events.put_nowait(event)
+                self.events_sent += 1
+            except asyncio.QueueFull:
+                # Too far behind: drop it; None tells the stream to make the client resync
+                self._subscribers.discard(sub)
+                self.dropped_subscribers += 1
+                while not sub.events.empty():
+                    sub.events.get_nowait()
+                sub.events.put_nowait(None)
+
+    async def held_by_other(self, db, queue: str, item_id: str, admin_id: str) -> bool:
+        """Whether a pending item is leased to another admin (used to tell 409 from 404)."""
+        source = QUEUES[queue]
+        now = _now()
+        doc = await db[source.collection].find_one(
+            {"id": item_id, **source.match, f"{LEASE_FIELD}.expires_at": {"$gte": now}},
+            {"_id": 0, LEASE_FIELD: 1},
+        )
+        return bool(doc) and doc[LEASE_FIELD]["admin_id"] != admin_id
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "loaded": self._loaded,
+            "items": {name: len(items) for name, items in self._items.items()},
+            "subscribers": len(self._subscribers),
+            "resyncs": self.resyncs,
+            "refreshes": self.refreshes,
+            "events_sent": self.events_sent,
+            "dropped_subscribers": self.dropped_subscribers,
+        }
+
+
+approval_queues = ApprovalQueues()
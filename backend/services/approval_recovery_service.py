@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from services.deposit_approval_service import recover_lapsed_deposits
+from services.withdrawal_approval_service import recover_lapsed_withdrawals
+
+logger = logging.getLogger(__name__)
+
+RECOVERY_INTERVAL_SECONDS = float(os.getenv("APPROVAL_RECOVERY_INTERVAL_SECONDS", "60"))
+
+
+class ApprovalRecovery:
+    """Settles approvals a crashed worker left half done.
+
+    Approvals move an item to "processing" before money moves and key the balance write
+    on the item, so a claim that lapsed can always be finished or undone from whether
+    that write landed. Each pass is guarded per item; running it on every worker is safe.
+    """
+
+    def __init__(self, interval_seconds: float = RECOVERY_INTERVAL_SECONDS):
+        self._interval = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.recovered: Dict[str, int] = {
+            "deposits_approved": 0,
+            "deposits_returned": 0,
+            "withdrawals_approved": 0,
+            "withdrawals_returned": 0,
+        }
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db) -> None:
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._loop(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self, db) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.run_once(db)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Approval recovery failed")
+
+    async def run_once(self, db) -> None:
+        deposits = await recover_lapsed_deposits(db)
+        self.recovered["deposits_approved"] += deposits["approved"]
+        self.recovered["deposits_returned"] += deposits["returned"]
+        withdrawals = await recover_lapsed_withdrawals(db)
+        self.recovered["withdrawals_approved"] += withdrawals["approved"]
+        self.recovered["withdrawals_returned"] += withdrawals["returned"]
+        self.last_error = None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"running": self.running, "recovered": dict(self.recovered), "last_error": self.last_error}
+
+
+approval_recovery = ApprovalRecovery()
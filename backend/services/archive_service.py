@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Hot collections whose history endpoints only show the last ARCHIVE_AFTER_DAYS
+ARCHIVED_COLLECTIONS = ("bets", "transactions")
+
+ENABLED = os.getenv("ARCHIVE_ENABLED", "1").lower() in ("1", "true", "yes")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+BATCH_PAUSE_SECONDS = float(os.getenv("ARCHIVE_BATCH_PAUSE_SECONDS", "0.2"))
+INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+LEASE_SECONDS = 120
+
+WORKER_ID = uuid.uuid4().hex
+LEASE_ID = "lease"
+MAX_READ_MONTHS = 36
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def archive_collection_name(collection: str, at: datetime) -> str:
+    """Monthly archive for documents created in `at`'s UTC month, e.g. bets_archive_2025_01."""
+    at = at.astimezone(timezone.utc)
+    return f"{collection}_archive_{at.year:04d}_{at.month:02d}"
+
+
+def _months_between(start: datetime, end: datetime) -> List[datetime]:
+    """First instant of every UTC month overlapping [start, end), newest first (capped)."""
+    end = end.astimezone(timezone.utc)
+    month = datetime(end.year, end.month, 1, tzinfo=timezone.utc)
+    if month == end:
+        month = (month - timedelta(days=1)).replace(day=1)
+    months = []
+    while (month + timedelta(days=32)).replace(day=1) > start and len(months) < MAX_READ_MONTHS:
+        months.append(month)
+        month = (month - timedelta(days=1)).replace(day=1)
+    return months
+
+
+class HistoryArchiver:
+    """Moves bets/transactions older than ARCHIVE_AFTER_DAYS into monthly archive collections.
+
+    One worker at a time holds a lease and archives in rate-limited batches: copy a batch
+    into its month's collection (upsert by _id, so a retry after a crash is harmless), then
+    delete it from the hot collection. Progress is checkpointed per collection in
+    `archive_state`.
+    """
+
+    def __init__(self) -> None:
+        self._task: Optional[asyncio.Task] = None
+        self._indexed: set[str] = set()
+        self.runs = 0
+        self.moved = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db) -> None:
+        if not ENABLED or self.running:
+            return
+        self._task = asyncio.create_task(self._loop(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self, db) -> None:
+        while True:
+            try:
+                await self.run_once(db)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("History archiver run failed")
+            await asyncio.sleep(INTERVAL_SECONDS)
+
+    async def _acquire_lease(self, db) -> bool:
+        now = _now()
+        try:
+            await db.archive_state.find_one_and_update(
+                {"_id": LEASE_ID, "$or": [{"holder": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": WORKER_ID, "expires_at": now + timedelta(seconds=LEASE_SECONDS)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Held by another worker and not expired
+            return False
+        return True
+
+    async def _release_lease(self, db) -> None:
+        await db.archive_state.update_one(
+            {"_id": LEASE_ID, "holder": WORKER_ID}, {"$set": {"expires_at": _now()}}
+        )
+
+    async def run_once(self, db) -> Dict[str, int]:
+        """Archive everything past the retention window; returns documents moved per collection."""
+        if not await self._acquire_lease(db):
+            return {}
+        moved: Dict[str, int] = {}
+        try:
+            cutoff = _now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+            for collection in ARCHIVED_COLLECTIONS:
+                moved[collection] = await self._archive_collection(db, collection, cutoff)
+        finally:
+            await self._release_lease(db)
+        self.runs += 1
+        self.last_run_at = _now()
+        self.last_error = None
+        return moved
+
+    async def _ensure_indexes(self, db, name: str) -> None:
+        if name in self._indexed:
+            return
+        await db[name].create_index([("user_id", 1), ("created_at", -1), ("id", -1)])
+        await db[name].create_index("id")
+        self._indexed.add(name)
+
+    async def _archive_collection(self, db, collection: str, cutoff: datetime) -> int:
+        # Each batch is the head of the (created_at, _id) index, so it costs BATCH_SIZE keys, not a scan
+        moved = 0
+        while True:
+            batch = await (
+                db[collection]
+                .find({"created_at": {"$lt": cutoff}})
+                .sort([("created_at", 1), ("_id", 1)])
+                .limit(BATCH_SIZE)
+                .to_list(BATCH_SIZE)
+            )
+            if not batch:
+                break
+
+            by_month: Dict[str, List[Dict[str, Any]]] = {}
+            for doc in batch:
+                by_month.setdefault(archive_collection_name(collection, doc["created_at"]), []).append(doc)
+            for name, docs in by_month.items():
+                await self._ensure_indexes(db, name)
+                await db[name].bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in docs], ordered=False)
+
+            # Copies are durable; only now drop them from the hot collection
+            await db[collection].delete_many({"_id": {"$in": [d["_id"] for d in batch]}})
+            moved += len(batch)
+            self.moved += len(batch)
+
+            await db.archive_state.update_one(
+                {"_id": collection},
+                {
+                    "$set": {
+                        "archived_through": batch[-1]["created_at"],
+                        "cutoff": cutoff,
+                        "updated_at": _now(),
+                    },
+                    "$inc": {"moved": len(batch)},
+                },
+                upsert=True,
+            )
+            # Renew the lease and yield to foreground traffic between batches
+            if not await self._acquire_lease(db):
+                logger.warning("Archiver lease lost; stopping after %d %s", moved, collection)
+                break
+            await asyncio.sleep(BATCH_PAUSE_SECONDS)
+
+        if moved:
+            logger.info("Archived %d %s older than %s", moved, collection, cutoff.isoformat())
+        return moved
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": ENABLED,
+            "running": self.running,
+            "archive_after_days": ARCHIVE_AFTER_DAYS,
+            "runs": self.runs,
+            "moved": self.moved,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_error": self.last_error,
+        }
+
+
+async def read_archive(
+    db,
+    collection: str,
+    user_id: str,
+    start: datetime,
+    end: datetime,
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Archived documents of one user created in [start, end), newest first.
+
+    Months are disjoint, so reading them newest-first and stopping at `limit` keeps
+    the result ordered without a merge.
+    """
+    names = set(await db.list_collection_names())
+    out: List[Dict[str, Any]] = []
+    for month in _months_between(start, end):
+        name = archive_collection_name(collection, month)
+        if name not in names:
+            continue
+        docs = await (
+            db[name]
+            .find({"user_id": user_id, "created_at": {"$gte": start, "$lt": end}}, {"_id": 0})
+            .sort([("created_at", -1), ("id", -1)])
+            .limit(limit - len(out))
+            .to_list(limit - len(out))
+        )
+        out.extend(docs)
+        if len(out) >= limit:
+            break
+    return out
+
+
+history_archiver = HistoryArchiver()
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services.time_service import PK_TZ, pk_date_str
+
+MODE_PK_DAY = "pk_day"
+MODE_ROLLING_24H = "rolling_24h"
+
+# Counter documents are only needed for the current and previous PK day
+RETENTION = timedelta(days=3)
+# rolling_24h: tries at the guarded window update before a bet is turned away
+ROLLING_ATTEMPTS = 5
+
+
+def _counter_key(user_id: str, pk_date: str) -> str:
+    return f"{user_id}:{pk_date}"
+
+
+def _window_key(user_id: str) -> str:
+    return f"{user_id}:rolling"
+
+
+def _hour(at: datetime) -> int:
+    return int(at.timestamp() // 3600)
+
+
+def _pk_now(at: Optional[datetime] = None) -> datetime:
+    return (at or datetime.now(timezone.utc)).astimezone(PK_TZ)
+
+
+async def _reserve_pk_day(db, user_id: str, amount: int, limit: int, now: datetime) -> Tuple[bool, int]:
+    pk_date = pk_date_str(now)
+    key = _counter_key(user_id, pk_date)
+    try:
+        doc = await db.bet_counters.find_one_and_update(
+            {"_id": key, "total": {"$lte": limit - amount}},
+            {
+                "$inc": {"total": amount, f"hours.{now.hour:02d}": amount},
+                "$setOnInsert": {
+                    "user_id": user_id,
+                    "date": pk_date,
+                    "expires_at": datetime.now(timezone.utc) + RETENTION,
+                },
+            },
+            projection={"total": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return True, int(doc["total"]) - amount
+    except DuplicateKeyError:
+        # Counter exists but the guard failed: limit would be exceeded
+        doc = await db.bet_counters.find_one({"_id": key}, {"total": 1})
+        return False, int(doc["total"]) if doc else 0
+
+
+async def _reserve_rolling(db, user_id: str, amount: int, limit: int, now: datetime) -> Tuple[bool, int]:
+    """Count the stake in the user's window document: hourly buckets of the last 24 hours.
+
+    Read, check, then one update guarded on the revision read (compare-and-swap): a
+    concurrent bet changes the revision, so this update misses (or its upsert collides)
+    and the check runs again on fresh totals.
+    """
+    key = _window_key(user_id)
+    hour = _hour(now)
+    total = 0
+    for _ in range(ROLLING_ATTEMPTS):
+        doc = await db.bet_counters.find_one({"_id": key}, {"hours": 1, "rev": 1})
+        hours = {h: int(v) for h, v in ((doc or {}).get("hours") or {}).items() if int(h) > hour - 24}
+        total = sum(hours.values())
+        if total + amount > limit:
+            return False, total
+
+        hours[str(hour)] = hours.get(str(hour), 0) + amount
+        try:
+            result = await db.bet_counters.update_one(
+                {"_id": key, "rev": (doc or {}).get("rev")},
+                {
+                    "$set": {"hours": hours, "rev": uuid.uuid4().hex, "expires_at": datetime.now(timezone.utc) + RETENTION},
+                    "$setOnInsert": {"user_id": user_id},
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            continue  # the document changed (or was created) since the read
+        if result.matched_count or result.upserted_id is not None:
+            return True, total
+    return False, total
+
+
+async def reserve_bet_amount(
+    db,
+    user_id: str,
+    amount: int,
+    limit: int,
+    mode: str = MODE_PK_DAY,
+    at: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Check the bet limit and count the stake (paisa) in one step.
+
+    In pk_day mode the guarded $inc on the user's counter document for the Pakistan day is the
+    limit check itself, so concurrent bets cannot overshoot. rolling_24h keeps hourly buckets
+    in one window document per user and updates it guarded on the revision it checked.
+    """
+    amount = int(amount)
+    limit = int(limit)
+    if amount > limit:
+        return {"allowed": False, "total": 0}
+
+    now = _pk_now(at)
+    if mode == MODE_ROLLING_24H:
+        allowed, total = await _reserve_rolling(db, user_id, amount, limit, now)
+    else:
+        allowed, total = await _reserve_pk_day(db, user_id, amount, limit, now)
+    return {"allowed": allowed, "total": total}
+
+
+async def release_bet_amount(db, user_id: str, amount: int, at: datetime, mode: str = MODE_PK_DAY) -> None:
+    """Undo a reservation made at `at` in `mode` (bet rejected after reserving, or refunded)."""
+    now = _pk_now(at)
+    if mode == MODE_ROLLING_24H:
+        await db.bet_counters.update_one(
+            {"_id": _window_key(user_id)},
+            {"$inc": {f"hours.{_hour(now)}": -int(amount)}, "$set": {"rev": uuid.uuid4().hex}},
+        )
+        return
+    await db.bet_counters.update_one(
+        {"_id": _counter_key(user_id, pk_date_str(now))},
+        {"$inc": {"total": -int(amount), f"hours.{now.hour:02d}": -int(amount)}},
+    )
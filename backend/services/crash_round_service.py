@@ -0,0 +1,441 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import math
+import os
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models import Bet, BetStatus, Transaction, TransactionType, TransactionStatus
+from money import scale
+from services.bet_limit_service import MODE_PK_DAY, release_bet_amount
+from services.crash_seed_chain_service import seed_chain
+from services.settings_service import settings_registry
+from services.stats_service import record_bets
+from services.wallet_service import apply_balance_changes_many, refund_bet
+from services.write_behind_service import journal
+
+logger = logging.getLogger(__name__)
+
+ROUND_BETTING = "betting"
+ROUND_FLYING = "flying"
+ROUND_CRASHED = "crashed"
+ROUND_ABORTED = "aborted"
+
+# Multiplier curve while flying: m(t) = e^(GROWTH_RATE * t)
+GROWTH_RATE = 0.25
+MAX_CRASH_POINT = 100.0
+COOLDOWN_SECONDS = 1.0
+HISTORY_SIZE = 20
+
+# One worker runs rounds at a time: it holds this lease (in crash_seed_state) for each whole
+# round plus LEASE_GRACE_SECONDS; the other workers retry every LEASE_RETRY_SECONDS and take
+# over once it lapses
+LEASE_ID = "round_engine"
+LEASE_GRACE_SECONDS = float(os.getenv("CRASH_ENGINE_LEASE_GRACE_SECONDS", "30"))
+LEASE_RETRY_SECONDS = float(os.getenv("CRASH_ENGINE_LEASE_RETRY_SECONDS", "5"))
+WORKER_ID = uuid.uuid4().hex
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def sha256_hex(s: str) -> str:
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+def crash_point_from_seed(server_seed: str, client_seed: str, nonce: int, house_edge: float) -> float:
+    # Deterministic, verifiable mapping from seeds -> crash point
+    msg = f"{client_seed}:{nonce}".encode("utf-8")
+    digest = hmac.new(server_seed.encode("utf-8"), msg, hashlib.sha256).hexdigest()
+
+    # Use first 52 bits (13 hex chars) -> integer
+    r = int(digest[:13], 16)
+    two_52 = 2 ** 52
+
+    # Classic crash-style formula with house edge (expected return ~= 1 - edge)
+    # crash = max(1.0, (1-edge) * (2^52 / (r + 1)))
+    crash = (1.0 - float(house_edge)) * (two_52 / (r + 1))
+    crash = max(1.0, min(float(crash), MAX_CRASH_POINT))
+    return round(crash, 2)
+
+
+def flight_seconds(crash_point: float) -> float:
+    return math.log(max(1.0, float(crash_point))) / GROWTH_RATE
+
+
+@dataclass
+class PendingBet:
+    user_id: str
+    amount: int  # paisa
+    cashout_multiplier: float
+    client_seed: str
+    balance_after_debit: int
+    placed_at: datetime = field(default_factory=_now)
+    bet_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    limit_mode: str = MODE_PK_DAY  # bet limit mode the stake was reserved in
+
+
+@dataclass
+class CrashRound:
+    id: str
+    number: int
+    server_seed: str
+    server_seed_hash: str
+    chain_id: str
+    chain_index: int
+    salt: str
+    house_edge: float
+    crash_point: float
+    betting_closes_at: datetime
+    state: str = ROUND_BETTING
+    started_at: datetime = field(default_factory=_now)
+    crashed_at: Optional[datetime] = None
+    persisted: bool = False
+    bets: List[PendingBet] = field(default_factory=list)
+
+    def public(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "round_id": self.id,
+            "number": self.number,
+            "state": self.state,
+            "server_seed_hash": self.server_seed_hash,
+            "chain_id": self.chain_id,
+            "chain_index": self.chain_index,
+            "salt": self.salt,
+            "started_at": self.started_at.isoformat(),
+            "betting_closes_at": self.betting_closes_at.isoformat(),
+            "bets_count": len(self.bets),
+        }
+        # Outcome and seed are only revealed once the round is over
+        if self.state == ROUND_CRASHED:
+            out["crash_point"] = self.crash_point
+            out["server_seed"] = self.server_seed
+            out["crashed_at"] = self.crashed_at.isoformat() if self.crashed_at else None
+        return out
+
+
+class CrashRoundEngine:
+    """Shared Crash rounds: bets join the betting window and settle together at crash time.
+
+    Every worker starts an engine, but only the one holding the round lease runs rounds
+    and takes bets; on the others `serving` is False and bets are turned away. Crash
+    traffic should therefore be routed to a single worker (or run with one worker); a
+    standby worker takes over once the serving one stops renewing its lease.
+    """
+
+    def __init__(self):
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self._settling: Optional[asyncio.Future] = None
+        self._round: Optional[CrashRound] = None
+        self._number = 0
+        self._history: Deque[Dict[str, Any]] = deque(maxlen=HISTORY_SIZE)
+        self.serving = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db) -> None:
+        if self.running:
+            return
+        self._db = db
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # A settlement already under way finishes; bets that never reached one are refunded
+        if self._settling and not self._settling.done():
+            await asyncio.wait([self._settling])
+        await self._abort("engine stopped")
+        if self.serving:
+            self.serving = False
+            await self._db.crash_seed_state.update_one(
+                {"_id": LEASE_ID, "holder": WORKER_ID}, {"$set": {"expires_at": _now()}}
+            )
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "serving": self.serving,
+            "current": self._round.public() if self._round else None,
+            "history": list(self._history),
+        }
+
+    def is_betting_open(self) -> bool:
+        return self.serving and self._round is not None and self._round.state == ROUND_BETTING
+
+    def place(self, bet: PendingBet) -> Optional[Dict[str, Any]]:
+        """Add a debited bet to the round taking bets and return that round; None if betting is closed.
+
+        Does not wait: the bet is in the round (and covered by its settlement or refund) as
+        soon as this returns, and the caller refunds the stake itself when it gets None.
+        """
+        if not self.is_betting_open():
+            return None
+        self._round.bets.append(bet)
+        return self._round.public()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._run_round()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Crash round failed")
+                await self._abort("round failed")
+                await asyncio.sleep(COOLDOWN_SECONDS)
+
+    async def _acquire_lease(self, seconds: float) -> bool:
+        now = _now()
+        try:
+            await self._db.crash_seed_state.find_one_and_update(
+                {"_id": LEASE_ID, "$or": [{"holder": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": WORKER_ID, "expires_at": now + timedelta(seconds=seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Another worker is serving rounds
+            return False
+        return True
+
+    async def _open_round(self, s) -> CrashRound:
+        window = float(s["crash_betting_window_seconds"])
+        seed = await seed_chain.next_seed(self._db)
+        self._number += 1
+        house_edge = float(s["crash_house_edge"])
+
+        now = _now()
+        return CrashRound(
+            id=str(uuid.uuid4()),
+            number=self._number,
+            server_seed=seed["server_seed"],
+            server_seed_hash=seed["server_seed_hash"],
+            chain_id=seed["chain_id"],
+            chain_index=seed["chain_index"],
+            salt=seed["salt"],
+            house_edge=house_edge,
+            crash_point=crash_point_from_seed(seed["server_seed"], seed["salt"], seed["chain_index"], house_edge),
+            started_at=now,
+            betting_closes_at=datetime.fromtimestamp(now.timestamp() + window, tz=timezone.utc),
+        )
+
+    async def _run_round(self) -> None:
+        s = await settings_registry.snapshot(self._db)
+        # The lease covers the longest possible round, so no other worker opens one meanwhile
+        longest = float(s["crash_betting_window_seconds"]) + flight_seconds(MAX_CRASH_POINT) + COOLDOWN_SECONDS
+        self.serving = await self._acquire_lease(longest + LEASE_GRACE_SECONDS)
+        if not self.serving:
+            self._round = None
+            await asyncio.sleep(LEASE_RETRY_SECONDS)
+            return
+
+        rnd = await self._open_round(s)
+        self._round = rnd
+
+        await asyncio.sleep(max(0.0, (rnd.betting_closes_at - _now()).total_seconds()))
+        rnd.state = ROUND_FLYING
+
+        await asyncio.sleep(flight_seconds(rnd.crash_point))
+        rnd.state = ROUND_CRASHED
+        rnd.crashed_at = _now()
+
+        # Shielded: cancelling the engine mid-settlement does not leave the round half paid
+        self._settling = asyncio.ensure_future(self._finish(rnd))
+        await asyncio.shield(self._settling)
+        await asyncio.sleep(COOLDOWN_SECONDS)
+
+    async def _finish(self, rnd: CrashRound) -> None:
+        status = "settled"
+        try:
+            await self._settle(rnd)
+        except Exception:
+            if rnd.persisted:
+                # Bets are already on record; leave balances for reconciliation instead of double-crediting
+                logger.exception("Crash round %s settlement partially failed", rnd.id)
+            else:
+                logger.exception("Crash round %s settlement failed, refunding stakes", rnd.id)
+                await self._refund(rnd)
+                status = "refunded"
+        self._remember(rnd, status)
+
+    def _remember(self, rnd: CrashRound, status: str) -> None:
+        self._history.appendleft(
+            {
+                "round_id": rnd.id,
+                "number": rnd.number,
+                "status": status,
+                "crash_point": rnd.crash_point,
+                "server_seed": rnd.server_seed,
+                "server_seed_hash": rnd.server_seed_hash,
+            }
+        )
+
+    async def _settle(self, rnd: CrashRound) -> None:
+        """Settle every bet in the round with one batch of writes per collection."""
+        db = self._db
+        settled_at = _now()
+        bet_docs: List[Dict[str, Any]] = []
+        txn_docs: List[Dict[str, Any]] = []
+        wins: List[Tuple[str, int, str]] = []  # (user_id, payout, bet_id)
+        wagered: Dict[str, int] = {}
+
+        for pb in rnd.bets:
+            won = pb.cashout_multiplier <= rnd.crash_point
+            payout = scale(pb.amount, pb.cashout_multiplier) if won else 0
+
+            bet = Bet(
+                id=pb.bet_id,
+                user_id=pb.user_id,
+                game_id="crash",
+                game_name="Crash",
+                bet_amount=pb.amount,
+                bet_data={
+                    "round_id": rnd.id,
+                    "cashout_multiplier": pb.cashout_multiplier,
+                    "client_seed": pb.client_seed,
+                    "server_seed_hash": rnd.server_seed_hash,
+                },
+                multiplier=pb.cashout_multiplier if won else 0.0,
+                payout=payout,
+                status=BetStatus.WON if won else BetStatus.LOST,
+                result_data={
+                    "round_id": rnd.id,
+                    "crash_point": rnd.crash_point,
+                    "server_seed": rnd.server_seed,  # revealed after settlement
+                    "server_seed_hash": rnd.server_seed_hash,
+                },
+                created_at=pb.placed_at,
+                settled_at=settled_at,
+            )
+            bet_dict = bet.model_dump()
+            bet_docs.append(bet_dict)
+
+            txns = [
+                Transaction(
+                    user_id=pb.user_id,
+                    type=TransactionType.BET,
+                    amount=pb.amount,
+                    status=TransactionStatus.COMPLETED,
+                    description="Crash bet",
+                    metadata={"bet_id": bet.id, "round_id": rnd.id},
+                    balance_before=pb.balance_after_debit + pb.amount,
+                    balance_after=pb.balance_after_debit,
+                    created_at=pb.placed_at,
+                    updated_at=pb.placed_at,
+                )
+            ]
+            if won and payout > 0:
+                txns.append(
+                    Transaction(
+                        user_id=pb.user_id,
+                        type=TransactionType.WIN,
+                        amount=payout,
+                        status=TransactionStatus.COMPLETED,
+                        description="Crash win",
+                        metadata={"bet_id": bet.id, "round_id": rnd.id},
+                        balance_before=pb.balance_after_debit,
+                        balance_after=pb.balance_after_debit + payout,
+                    )
+                )
+                wins.append((pb.user_id, payout, bet.id))
+            for t in txns:
+                t_dict = t.model_dump()
+                txn_docs.append(t_dict)
+
+            wagered[pb.user_id] = wagered.get(pb.user_id, 0) + pb.amount
+
+        if bet_docs:
+            await journal.write(db, "bets", bet_docs)
+            rnd.persisted = True
+            await record_bets(db, bet_docs)
+        round_doc = {
+            "id": rnd.id,
+            "number": rnd.number,
+            "server_seed": rnd.server_seed,
+            "server_seed_hash": rnd.server_seed_hash,
+            "chain_id": rnd.chain_id,
+            "chain_index": rnd.chain_index,
+            "salt": rnd.salt,
+            "house_edge": rnd.house_edge,
+            "crash_point": rnd.crash_point,
+            "bets_count": len(rnd.bets),
+            "total_wagered": sum(pb.amount for pb in rnd.bets),
+            "total_payout": sum(payout for _, payout, _ in wins),
+            "started_at": rnd.started_at,
+            "crashed_at": rnd.crashed_at,
+        }
+        await asyncio.gather(
+            journal.write(db, "transactions", txn_docs),
+            journal.write(db, "crash_rounds", [round_doc]),
+        )
+        # All wins in one users.bulk_write, each with its own ledger entry; a win that cannot be
+        # credited is logged with its bet for reconciliation and does not hold up the others
+        unpaid = await apply_balance_changes_many(
+            db,
+            [
+                (user_id, {"wallet_balance": payout, "total_wins": payout}, "win", bet_id)
+                for user_id, payout, bet_id in wins
+            ],
+        )
+        for user_id, bet_id, error in unpaid:
+            logger.error("Crash round %s: win on bet %s not credited to user %s: %s", rnd.id, bet_id, user_id, error)
+
+        # Apply wagering progress for the whole round at once (bets count even on losses)
+        from services.wagering_service import apply_wagering_progress_many
+
+        try:
+            await apply_wagering_progress_many(db, wagered.items())
+        except Exception:
+            logger.exception("Wagering progress failed for round %s", rnd.id)
+
+    async def _abort(self, reason: str) -> None:
+        """Refund every bet of a round that stopped before it crashed."""
+        rnd = self._round
+        if rnd is None or rnd.state in (ROUND_CRASHED, ROUND_ABORTED):
+            return
+        rnd.state = ROUND_ABORTED
+        if rnd.bets:
+            logger.warning("Crash round %s aborted with %d bet(s): %s", rnd.id, len(rnd.bets), reason)
+        self._remember(rnd, "refunded")
+        # Shielded like settlement; stop() waits for it
+        self._settling = asyncio.ensure_future(self._refund(rnd))
+        await asyncio.shield(self._settling)
+
+    async def _refund(self, rnd: CrashRound) -> None:
+        # Keyed on the bet, so a stake is never returned twice
+        outcomes = await asyncio.gather(
+            *(
+                refund_bet(self._db, pb.user_id, pb.amount, ref_id=pb.bet_id, once=f"refund:{pb.bet_id}")
+                for pb in rnd.bets
+            ),
+            return_exceptions=True,
+        )
+        for pb, outcome in zip(rnd.bets, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error("Crash round %s refund failed for bet %s: %s", rnd.id, pb.bet_id, outcome)
+            try:
+                await release_bet_amount(self._db, pb.user_id, pb.amount, pb.placed_at, pb.limit_mode)
+            except Exception:
+                logger.exception("Bet limit release failed for user %s", pb.user_id)
+
+
+crash_engine = CrashRoundEngine()
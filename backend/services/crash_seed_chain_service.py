@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterable, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+HASH_BYTES = 32
+CHUNK_SIZE = 10_000  # hashes per stored chunk (320 KB of raw digests)
+DEFAULT_CHAIN_LENGTH = 1_000_000
+INSERT_BATCH = 20  # chunks per insert_many
+
+# Seeds left in the active chain when the next one starts being built in the background
+PREBUILD_REMAINING = int(os.getenv("CRASH_CHAIN_PREBUILD_REMAINING", "50000"))
+# One worker builds the standby chain; the lease outlives a slow build
+PREBUILD_LEASE_ID = "standby_build"
+PREBUILD_LEASE_SECONDS = 900
+WORKER_ID = uuid.uuid4().hex
+
+# Chain positions kept per chain while streaming an audit
+AUDIT_WINDOW = 1000
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _sha256(b: bytes) -> bytes:
+    return hashlib.sha256(b).digest()
+
+
+def build_chain(length: int, seed: Optional[bytes] = None) -> Tuple[bytes, bytes]:
+    """Build `length` chained SHA-256 digests: h[i+1] = sha256(h[i]).
+
+    Returns the packed digests and the terminal hash sha256(h[length-1]).
+    Rounds consume the chain from the end, so every revealed seed hashes to the one revealed before it.
+    """
+    h = seed or secrets.token_bytes(HASH_BYTES)
+    buf = bytearray(length * HASH_BYTES)
+    sha256 = hashlib.sha256
+    for i in range(length):
+        buf[i * HASH_BYTES:(i + 1) * HASH_BYTES] = h
+        h = sha256(h).digest()
+    return bytes(buf), h
+
+
+def walk(seed: bytes, steps: int) -> bytes:
+    h = seed
+    for _ in range(steps):
+        h = _sha256(h)
+    return h
+
+
+async def create_chain(
+    db, length: int = DEFAULT_CHAIN_LENGTH, created_by: str = "system", status: str = "active"
+) -> Dict[str, Any]:
+    """Precompute a chain and store it as packed binary chunks.
+
+    An "active" chain replaces the active one; a "standby" chain waits to be promoted
+    when the active one runs out. Only the terminal hash is public from the start; chunk
+    checkpoints are kept on the chain and published as their chunks are played out
+    (see published_checkpoints()).
+    """
+    data, terminal = await asyncio.to_thread(build_chain, length)
+
+    chain_id = str(uuid.uuid4())
+    chunks: List[Dict[str, Any]] = []
+    for chunk_index, start in enumerate(range(0, length, CHUNK_SIZE)):
+        end = min(start + CHUNK_SIZE, length)
+        last = data[(end - 1) * HASH_BYTES:end * HASH_BYTES]
+        chunks.append(
+            {
+                "chain_id": chain_id,
+                "chunk_index": chunk_index,
+                "start_index": start,
+                "count": end - start,
+                "data": data[start * HASH_BYTES:end * HASH_BYTES],
+                # Hash of the chunk's last entry: first entry of the next chunk, or the terminal hash
+                "checkpoint": _sha256(last).hex(),
+            }
+        )
+
+    for i in range(0, len(chunks), INSERT_BATCH):
+        await db.crash_seed_chunks.insert_many(chunks[i:i + INSERT_BATCH], ordered=False)
+
+    chain = {
+        "id": chain_id,
+        "length": length,
+        "chunk_size": CHUNK_SIZE,
+        "terminal_hash": terminal.hex(),
+        "checkpoints": [c["checkpoint"] for c in chunks],
+        "salt": secrets.token_hex(16),
+        "next_index": length - 1,
+        "status": status,  # standby|active|retired|exhausted
+        "created_by": created_by,
+        "created_at": _now(),
+    }
+    if status == "active":
+        await db.crash_seed_chains.update_many(
+            {"status": "active"},
+            {"$set": {"status": "retired", "retired_at": _now()}},
+        )
+    await db.crash_seed_chains.insert_one(dict(chain))
+    return chain
+
+
+async def get_active_chain(db) -> Optional[Dict[str, Any]]:
+    return await db.crash_seed_chains.find_one({"status": "active"}, {"_id": 0})
+
+
+def published_checkpoints(chain: Dict[str, Any]) -> Dict[int, str]:
+    """Chunk checkpoints that can be made public: chunk index -> hash.
+
+    Checkpoint j is the seed at index (j+1)*chunk_size, and a seed hashes forward to
+    every seed above it, i.e. to every round played before it. So a checkpoint may only
+    be published once its chunk has been handed out entirely; the seed it equals was
+    then played a whole chunk earlier. The last chunk's checkpoint is the terminal hash.
+    """
+    chunk_size = int(chain.get("chunk_size", CHUNK_SIZE))
+    next_index = int(chain.get("next_index", -1))
+    return {j: h for j, h in enumerate(chain.get("checkpoints") or []) if j * chunk_size > next_index}
+
+
+def public_chain(chain: Dict[str, Any]) -> Dict[str, Any]:
+    """The published commitment of a chain."""
+    return {
+        "chain_id": chain["id"],
+        "terminal_hash": chain["terminal_hash"],
+        # Chunk j covers indexes [j*chunk_size, (j+1)*chunk_size); its checkpoint is the
+        # hash its last seed leads to. Listed only for chunks already played out.
+        "chunk_size": chain.get("chunk_size", CHUNK_SIZE),
+        "checkpoints": [{"chunk_index": j, "hash": h} for j, h in published_checkpoints(chain).items()],
+        "salt": chain["salt"],
+        "length": chain["length"],
+        "remaining": max(0, int(chain["next_index"]) + 1),
+        "created_at": chain["created_at"],
+    }
+
+
+class CrashSeedChain:
+    """Hands out chain seeds in reverse order, keeping the current chunk in memory.
+
+    Once the active chain is down to PREBUILD_REMAINING seeds, a standby chain is built
+    in the background, so running out only promotes it rather than making a round wait
+    for a million hashes. A chain is built inline only if there is no standby (the very
+    first round, or a failed background build).
+    """
+
+    def __init__(self):
+        self._chunk_key: Optional[Tuple[str, int]] = None
+        self._chunk: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+        self._prebuild: Optional[asyncio.Task] = None
+
+    async def next_seed(self, db) -> Dict[str, Any]:
+        async with self._lock:
+            chain = await self._claim(db)
+            if not chain:
+                # Active chain used up (or none created yet): switch to the standby one
+                await db.crash_seed_chains.update_many(
+                    {"status": "active", "next_index": {"$lt": 0}},
+                    {"$set": {"status": "exhausted", "exhausted_at": _now()}},
+                )
+                await self._promote_standby(db)
+                chain = await self._claim(db)
+                if not chain:
+                    logger.warning("No standby crash seed chain; building one inline")
+                    await create_chain(db)
+                    chain = await self._claim(db)
+                    if not chain:
+                        raise RuntimeError("No crash seed chain available")
+            if int(chain["next_index"]) < PREBUILD_REMAINING:
+                self._ensure_prebuild(db)
+            return await self._seed_at(db, chain, int(chain["next_index"]))
+
+    async def _promote_standby(self, db) -> None:
+        if await db.crash_seed_chains.find_one({"status": "active", "next_index": {"$gte": 0}}, {"_id": 1}):
+            return  # another worker promoted one already
+        await db.crash_seed_chains.find_one_and_update(
+            {"status": "standby"},
+            {"$set": {"status": "active", "activated_at": _now()}},
+            sort=[("created_at", 1)],
+        )
+
+    def _ensure_prebuild(self, db) -> None:
+        if self._prebuild is None or self._prebuild.done():
+            self._prebuild = asyncio.create_task(self._build_standby(db))
+
+    async def _build_standby(self, db) -> None:
+        now = _now()
+        try:
+            await db.crash_seed_state.find_one_and_update(
+                {"_id": PREBUILD_LEASE_ID, "$or": [{"holder": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": WORKER_ID, "expires_at": now + timedelta(seconds=PREBUILD_LEASE_SECONDS)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return  # another worker is building it
+        try:
+            if not await db.crash_seed_chains.find_one({"status": "standby"}, {"_id": 1}):
+                chain = await create_chain(db, status="standby")
+                logger.info("Standby crash seed chain %s built", chain["id"])
+        except Exception:
+            logger.exception("Building the standby crash seed chain failed")
+        finally:
+            await db.crash_seed_state.update_one(
+                {"_id": PREBUILD_LEASE_ID, "holder": WORKER_ID}, {"$set": {"expires_at": _now()}}
+            )
+
+    async def _claim(self, db) -> Optional[Dict[str, Any]]:
+        # Returns the chain as it was before the decrement, i.e. with the index being consumed
+        return await db.crash_seed_chains.find_one_and_update(
+            {"status": "active", "next_index": {"$gte": 0}},
+            {"$inc": {"next_index": -1}},
+            projection={"_id": 0, "id": 1, "salt": 1, "chunk_size": 1, "next_index": 1},
+        )
+
+    async def _seed_at(self, db, chain: Dict[str, Any], index: int) -> Dict[str, Any]:
+        chunk_size = int(chain.get("chunk_size", CHUNK_SIZE))
+        key = (chain["id"], index // chunk_size)
+        if self._chunk_key != key:
+            self._chunk = await db.crash_seed_chunks.find_one(
+                {"chain_id": key[0], "chunk_index": key[1]},
+                {"_id": 0, "data": 1, "start_index": 1},
+            )
+            if not self._chunk:
+                raise RuntimeError("Crash seed chain chunk missing")
+            self._chunk_key = key
+
+        offset = (index - int(self._chunk["start_index"])) * HASH_BYTES
+        seed = bytes(self._chunk["data"][offset:offset + HASH_BYTES])
+        return {
+            "chain_id": chain["id"],
+            "chain_index": index,
+            "salt": chain["salt"],
+            "server_seed": seed.hex(),
+            # Committed ahead of time: the seed revealed by the previous round (or the terminal hash)
+            "server_seed_hash": _sha256(seed).hex(),
+        }
+
+
+async def verify_round(db, round_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Check a round's seed against commitments made public before the round was played.
+
+    The seed is walked forward to the nearest later chain position whose hash is
+    already public: the seed revealed by an earlier round of the chain (chains are
+    consumed from the end), a published chunk checkpoint, or the terminal hash. The
+    checkpoints keep the walk within two chunks when the rounds in between are gone.
+    """
+    chain = await db.crash_seed_chains.find_one({"id": round_doc["chain_id"]}, {"_id": 0})
+    if not chain:
+        raise ValueError("Seed chain not found")
+
+    index = int(round_doc["chain_index"])
+    length = int(chain["length"])
+    chunk_size = int(chain.get("chunk_size", CHUNK_SIZE))
+    seed = bytes.fromhex(round_doc["server_seed"])
+
+    # (hash steps, expected hash, description) of each public anchor above the round
+    anchors = [(length - index, chain["terminal_hash"], {"type": "terminal_hash"})]
+    checkpoint = next(
+        ((j, h) for j, h in sorted(published_checkpoints(chain).items()) if (j + 1) * chunk_size > index),
+        None,
+    )
+    if checkpoint:
+        j, h = checkpoint
+        anchors.append((min((j + 1) * chunk_size, length) - index, h, {"type": "checkpoint", "chunk_index": j}))
+    revealed = await db.crash_rounds.find_one(
+        {"chain_id": chain["id"], "chain_index": {"$gt": index}},
+        {"_id": 0, "id": 1, "chain_index": 1, "server_seed": 1},
+        sort=[("chain_index", 1)],
+    )
+    if revealed:
+        anchors.append(
+            (
+                int(revealed["chain_index"]) - index,
+                revealed["server_seed"],
+                {"type": "revealed_round", "round_id": revealed["id"], "chain_index": revealed["chain_index"]},
+            )
+        )
+
+    steps, expected, anchor = min(anchors, key=lambda a: a[0])
+    reached = await asyncio.to_thread(walk, seed, steps)
+    anchor.update({"hash": expected, "hash_steps": steps, "valid": reached.hex() == expected})
+    return {
+        "chain_id": chain["id"],
+        "chain_index": index,
+        "terminal_hash": chain["terminal_hash"],
+        "anchor": anchor,
+        "valid": anchor["valid"],
+    }
+
+
+async def audit_rounds(rounds: AsyncIterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Verify consecutive rounds of one chain link up: sha256(seed[i]) == seed[i+1].
+
+    Takes the rounds as a stream in crash time order. Chains are consumed from the end,
+    so a round's chain neighbours crashed around the same time; only seeds within
+    AUDIT_WINDOW positions of the newest round seen are held per chain, and each pair is
+    checked when its second round arrives.
+    """
+    windows: Dict[str, Dict[int, Tuple[str, str]]] = {}  # chain_id -> index -> (round id, seed)
+    broken: List[str] = []
+    checked = 0
+    links = 0
+    async for r in rounds:
+        if "chain_id" not in r:
+            continue
+        checked += 1
+        window = windows.setdefault(r["chain_id"], {})
+        index = int(r["chain_index"])
+        window[index] = (r["id"], r["server_seed"])
+        for lo in (index - 1, index):
+            if lo in window and lo + 1 in window:
+                links += 1
+                if _sha256(bytes.fromhex(window[lo][1])).hex() != window[lo + 1][1]:
+                    broken.append(window[lo][0])
+        if len(window) > 2 * AUDIT_WINDOW:
+            for i in [i for i in window if abs(i - index) > AUDIT_WINDOW]:
+                del window[i]
+    return {"rounds_checked": checked, "links_checked": links, "broken_links": broken, "valid": not broken}
+
+
+seed_chain = CrashSeedChain()
@@ -1,109 +1,118 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from models import Transaction, TransactionType, TransactionStatus
-from services.wagering_service import new_wagering_record
+from money import percent_of, to_paisa, to_rupees
+from services.approval_queue_service import approval_queues, lease_free_filter
+from services.ledger_service import LEDGER_FIELDS, append_entries
+from services.user_cache_service import user_state_cache
+from services.wagering_service import add_wagering_records, add_wagering_records_many, new_wagering_record
 from services.promotion_service import compute_first_deposit_108_bonus, get_first_deposit_108_config
+from services.stats_service import record_daily
 from services.time_service import pk_date_str
+from services.wallet_service import APPLIED_FIELD, APPLIED_KEEP, credit_deposit, was_applied
+from services.write_behind_service import journal
+
+logger = logging.getLogger(__name__)
+
+# Set on deposits an approval (batch or single) is settling, which holds them in "processing";
+# a lapsed claim (crashed worker) is settled by recover_lapsed_deposits()
+CLAIM_FIELD = "approval_claim"
+CLAIM_SECONDS = int(os.getenv("DEPOSIT_BATCH_CLAIM_SECONDS", "300"))
+# Deposits per approve_deposits_batch() call (the approve-batch endpoint caps requests at this)
+MAX_BATCH_SIZE = 500
+# Lapsed claims settled per recover_lapsed_deposits() call
+RECOVER_BATCH = 500
+# Batch result detail for a deposit whose stamp (e.g. statement reference) a unique index refused
+STAMP_TAKEN = "Already settled by another deposit"
 
 
-def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
 
 
-async def _create_wagering_for_bonus(db, user_id: str, source: str, source_id: str, amount: float):
-    rec = new_wagering_record(
+def credit_key(deposit_id: str) -> str:
+    """Idempotency key of a deposit's credit (see apply_balance_change's `once`)."""
+    return f"deposit:{deposit_id}"
+
+
+def _wagering_for_bonus(user_id: str, source: str, source_id: str, amount: int) -> Dict[str, Any]:
+    return new_wagering_record(
         user_id=user_id,
         source=source,
         source_id=source_id,
-        principal_amount=float(amount),
+        principal_amount=int(amount),
         multiplier=35.0,
         priority=1,
     )
-    await db.wagering.insert_one(rec)
 
 
-async def _create_wagering_for_deposit(db, user_id: str, deposit_id: str, amount: float, multiplier: float):
-    rec = new_wagering_record(
+def _wagering_for_deposit(user_id: str, deposit_id: str, amount: int, multiplier: float) -> Dict[str, Any]:
+    return new_wagering_record(
         user_id=user_id,
         source="deposit",
         source_id=deposit_id,
-        principal_amount=float(amount),
+        principal_amount=int(amount),
         multiplier=float(multiplier),
         priority=2,
     )
-    await db.wagering.insert_one(rec)
-
 
-async def approve_deposit_apply_promotions(db, deposit: Dict[str, Any], admin_id: str) -> Dict[str, Any]:
-    """Apply promotions, create wagering records, and credit single wallet balance."""
-
-    user = await db.users.find_one({"id": deposit["user_id"]}, {"_id": 0})
-    if not user:
-        raise ValueError("User not found")
 
-    deposit_amount = float(deposit["amount"])
+def _bonus_for(
+    deposit: Dict[str, Any], user: Dict[str, Any], cfg: Optional[List[Dict[str, Any]]], today: str
+) -> Tuple[int, Dict[str, Any]]:
+    """Promotion bonus (paisa) of one deposit and the user fields it consumes."""
+    deposit_amount = int(deposit["amount"])
     promo_key = deposit.get("promotion_key")
 
-    bonus_amount = 0.0
+    bonus_amount = 0
+    extra_set: Dict[str, Any] = {}
 
     # Daily 8% first deposit bonus (optional)
     if promo_key == "daily_first_deposit_8":
-        today = pk_date_str()
         last = user.get("daily_first_deposit_bonus_last_date")
         if last != today:
-            bonus_amount = round(deposit_amount * 0.08, 2)
-            await db.users.update_one(
-                {"id": user["id"]},
-                {"$set": {"daily_first_deposit_bonus_last_date": today, "updated_at": _now_iso()}},
-            )
+            bonus_amount = percent_of(deposit_amount, 8)
+            extra_set["daily_first_deposit_bonus_last_date"] = today
 
     # First deposit lifetime bonus 108% (strict)
     if promo_key == "first_deposit_108":
         # If the deposit has this promotion key, it means it was eligible when created
         # The eligibility was already consumed at deposit creation time
-        cfg = await get_first_deposit_108_config(db)
-        bonus_amount = float(compute_first_deposit_108_bonus(deposit_amount, cfg))
+        # The promotion table is configured in rupees
+        bonus_amount = to_paisa(compute_first_deposit_108_bonus(to_rupees(deposit_amount), cfg))
 
     # Referral bonus etc will be applied elsewhere
+    return bonus_amount, extra_set
 
-    # Credit wallet (single display)
-    wallet_before = float(user.get("wallet_balance", 0.0))
-    wallet_after = wallet_before + deposit_amount + bonus_amount
 
-    await db.users.update_one(
-        {"id": user["id"]},
-        {
-            "$set": {
-                "wallet_balance": wallet_after,
-                "total_deposits": float(user.get("total_deposits", 0.0)) + deposit_amount,
-                "updated_at": _now_iso(),
-            }
-        },
-    )
+def _settlement_docs(
+    deposit: Dict[str, Any], user_id: str, bonus_amount: int, wallet_before: int
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], float]:
+    """Wagering records and transactions of one credited deposit, plus its wagering multiplier."""
+    deposit_amount = int(deposit["amount"])
+    promo_key = deposit.get("promotion_key")
 
     # Deposit wagering (randomized multiplier locked at request time)
     dep_mult = float(deposit.get("deposit_wagering_multiplier") or 3.0)
-    await _create_wagering_for_deposit(db, user["id"], deposit["id"], deposit_amount, dep_mult)
+    wagering_docs = [_wagering_for_deposit(user_id, deposit["id"], deposit_amount, dep_mult)]
 
     # Bonus wagering (35x)
     if bonus_amount > 0:
-        await _create_wagering_for_bonus(db, user["id"], "bonus", f"{deposit['id']}:bonus", bonus_amount)
-
-        # Track bonus in internal field (not shown separately in UI)
-        await db.users.update_one(
-            {"id": user["id"]},
-            {
-                "$inc": {"bonus_balance": bonus_amount},
-                "$set": {"updated_at": _now_iso()},
-            },
-        )
+        wagering_docs.append(_wagering_for_bonus(user_id, "bonus", f"{deposit['id']}:bonus", bonus_amount))
 
     # Deposit transaction
     deposit_tx = Transaction(
-        user_id=user["id"],
+        user_id=user_id,
         type=TransactionType.DEPOSIT,
         amount=deposit_amount,
         status=TransactionStatus.COMPLETED,
@@ -117,25 +126,359 @@ async def approve_deposit_apply_promotions(db, deposit: Dict[str, Any], admin_id
         balance_before=wallet_before,
         balance_after=wallet_before + deposit_amount,
     )
-    d = deposit_tx.model_dump()
-    d["created_at"] = d["created_at"].isoformat()
-    d["updated_at"] = d["updated_at"].isoformat()
-    await db.transactions.insert_one(d)
+    txn_docs = [deposit_tx.model_dump()]
 
     if bonus_amount > 0:
         bonus_tx = Transaction(
-            user_id=user["id"],
+            user_id=user_id,
             type=TransactionType.BONUS,
             amount=bonus_amount,
             status=TransactionStatus.COMPLETED,
             description=f"Bonus credited (secure processing) - {promo_key}",
             metadata={"deposit_id": deposit["id"], "promotion_key": promo_key},
             balance_before=wallet_before + deposit_amount,
-            balance_after=wallet_after,
+            balance_after=wallet_before + deposit_amount + bonus_amount,
         )
-        bd = bonus_tx.model_dump()
-        bd["created_at"] = bd["created_at"].isoformat()
-        bd["updated_at"] = bd["updated_at"].isoformat()
-        await db.transactions.insert_one(bd)
+        txn_docs.append(bonus_tx.model_dump())
+
+    return wagering_docs, txn_docs, dep_mult
+
+
+async def approve_deposit_apply_promotions(db, deposit: Dict[str, Any], admin_id: str) -> Dict[str, Any]:
+    """Apply promotions, create wagering records, and credit single wallet balance."""
+
+    user = await db.users.find_one({"id": deposit["user_id"]}, {"_id": 0})
+    if not user:
+        raise ValueError("User not found")
+
+    deposit_amount = int(deposit["amount"])
+    cfg = await get_first_deposit_108_config(db) if deposit.get("promotion_key") == "first_deposit_108" else None
+    bonus_amount, extra_set = _bonus_for(deposit, user, cfg, pk_date_str())
+
+    # Credit wallet (single display); bonus is also tracked in internal bonus_balance
+    balances = await credit_deposit(
+        db, user["id"], deposit_amount, bonus_amount, extra_set=extra_set, ref_id=deposit["id"],
+        once=credit_key(deposit["id"]),
+    )
+    if not balances:
+        if await was_applied(db, user["id"], credit_key(deposit["id"])):
+            # Credited by an approval that died before marking it; its records were its job
+            logger.warning("Deposit %s was already credited; approving it without crediting again", deposit["id"])
+            return {
+                "wallet_after": None,
+                "bonus_amount": 0,
+                "deposit_multiplier": float(deposit.get("deposit_wagering_multiplier") or 3.0),
+                "already_credited": True,
+            }
+        raise ValueError("User not found")
+    wallet_after = int(balances["wallet_balance"])
+    wallet_before = wallet_after - deposit_amount - bonus_amount
+
+    wagering_docs, txn_docs, dep_mult = _settlement_docs(deposit, user["id"], bonus_amount, wallet_before)
+    await asyncio.gather(
+        add_wagering_records(db, user["id"], wagering_docs),
+        journal.write(db, "transactions", txn_docs),
+    )
 
     return {"wallet_after": wallet_after, "bonus_amount": bonus_amount, "deposit_multiplier": dep_mult}
+
+
+# -------------------------
+# Batch approval
+# -------------------------
+
+def unclaimed_filter(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Deposits no approval holds a live claim on (claims older than CLAIM_SECONDS have lapsed)."""
+    now = now or _now()
+    return {
+        "$or": [
+            {CLAIM_FIELD: {"$exists": False}},
+            {f"{CLAIM_FIELD}.expires_at": {"$lt": now}},
+        ]
+    }
+
+
+def _claim(token: str, admin_id: str, now: datetime, stamps: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    claim: Dict[str, Any] = {"token": token, "by": admin_id, "expires_at": now + timedelta(seconds=CLAIM_SECONDS)}
+    if stamps:
+        # Stamps are written with the claim and removed again if the deposit goes back to pending
+        claim["stamped"] = sorted(stamps)
+    return {"status": "processing", CLAIM_FIELD: claim, **(stamps or {})}
+
+
+def _unclaim(stamped: Iterable[str] = ()) -> Dict[str, str]:
+    return {CLAIM_FIELD: "", **{f: "" for f in stamped}}
+
+
+async def claim_deposit(db, deposit_id: str, admin_id: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Claim one pending deposit for approval: (deposit, token), deposit None if it is not available.
+
+    Takes the same claim a batch does, in one atomic update that only matches a pending
+    deposit no other admin holds a queue lease on, and moves it to "processing" before any
+    money moves; until the claim is released, approved or recovered, no other approval or
+    rejection can touch the deposit.
+    """
+    now = _now()
+    token = uuid.uuid4().hex
+    deposit = await db.deposits.find_one_and_update(
+        {"id": deposit_id, "status": "pending", "$and": [unclaimed_filter(now), lease_free_filter(admin_id, now)]},
+        {"$set": _claim(token, admin_id, now)},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    return deposit, token
+
+
+async def release_deposit_claim(db, deposit_id: str, token: str) -> None:
+    """Hand a claimed deposit back to the queue untouched."""
+    await release_deposit_claims(db, [deposit_id], token)
+
+
+async def release_deposit_claims(db, deposit_ids: List[str], token: str, stamped: Iterable[str] = ()) -> None:
+    """release_deposit_claim() for many deposits, also removing the `stamped` fields the claim wrote."""
+    await db.deposits.update_many(
+        {"id": {"$in": deposit_ids}, "status": "processing", f"{CLAIM_FIELD}.token": token},
+        {"$set": {"status": "pending"}, "$unset": _unclaim(stamped)},
+    )
+
+
+async def mark_deposits_approved(db, deposit_ids: List[str], token: str, admin_id: str) -> int:
+    """Approve deposits still processing under claim `token`, dropping the claim; returns how many."""
+    result = await db.deposits.update_many(
+        {"id": {"$in": deposit_ids}, "status": "processing", f"{CLAIM_FIELD}.token": token},
+        {
+            "$set": {"status": "approved", "approved_at": _now(), "approved_by": admin_id},
+            "$unset": {CLAIM_FIELD: ""},
+        },
+    )
+    return result.modified_count
+
+
+def _plan_user(
+    user: Dict[str, Any],
+    deposits: List[Dict[str, Any]],
+    cfg: Optional[List[Dict[str, Any]]],
+    today: str,
+) -> Dict[str, Any]:
+    """Everything one user's share of a batch writes, derived from the balances read up front.
+
+    Deposits are credited oldest first, as approving them one by one would: each gets
+    its own ledger entry and transactions carrying the running balance.
+    """
+    state = dict(user)
+    balances = {f: int(user.get(f) or 0) for f in LEDGER_FIELDS}
+    seq = int(user.get("ledger_seq") or 0)
+    inc = {"wallet_balance": 0, "total_deposits": 0, "bonus_balance": 0}
+    extra_set: Dict[str, Any] = {}
+    plan: Dict[str, Any] = {"wagering": [], "transactions": [], "ledger": [], "items": []}
+
+    for deposit in deposits:
+        deposit_amount = int(deposit["amount"])
+        bonus_amount, consumed = _bonus_for(deposit, state, cfg, today)
+        state.update(consumed)
+        extra_set.update(consumed)
+
+        wallet_before = balances["wallet_balance"]
+        delta = {"wallet_balance": deposit_amount + bonus_amount, "bonus_balance": bonus_amount}
+        for field, amount in delta.items():
+            balances[field] += amount
+        seq += 1
+        plan["ledger"].append((user["id"], seq, "deposit", delta, dict(balances), deposit["id"]))
+
+        inc["wallet_balance"] += deposit_amount + bonus_amount
+        inc["total_deposits"] += deposit_amount
+        inc["bonus_balance"] += bonus_amount
+
+        wagering_docs, txn_docs, dep_mult = _settlement_docs(deposit, user["id"], bonus_amount, wallet_before)
+        plan["wagering"].extend(wagering_docs)
+        plan["transactions"].extend(txn_docs)
+        plan["items"].append(
+            {
+                "deposit_id": deposit["id"],
+                "user_id": user["id"],
+                "amount": deposit_amount,
+                "bonus_amount": bonus_amount,
+                "deposit_multiplier": dep_mult,
+            }
+        )
+
+    keys = [credit_key(d["id"]) for d in deposits]
+    update: Dict[str, Any] = {
+        "$inc": {**{k: v for k, v in inc.items() if v}, "ledger_seq": len(deposits)},
+        "$set": {"updated_at": _now(), **extra_set},
+        "$push": {APPLIED_FIELD: {"$each": keys, "$slice": -APPLIED_KEEP}},
+    }
+    # Guarded on ledger_seq: every balance write bumps it, so a match means the balances
+    # this plan was computed from are still current. The deposits' credit keys make the
+    # credit land at most once, and tell afterwards whether it did.
+    plan["op"] = UpdateOne(
+        {"id": user["id"], "ledger_seq": user.get("ledger_seq"), APPLIED_FIELD: {"$nin": keys}}, update
+    )
+    plan["keys"] = keys
+    return plan
+
+
+async def approve_deposits_batch(
+    db,
+    deposit_ids: List[str],
+    admin_id: str,
+    stamps: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """Approve many pending deposits; returns one result per distinct requested id, in request order.
+
+    The deposits are claimed into "processing" with one update, then users and promotion
+    config are read once. Balances are committed with a single users.bulk_write, guarded
+    per user on ledger_seq and keyed on the deposits (credit_key()). Wagering records,
+    transactions and ledger entries follow as one batched write each. Users whose
+    balances moved between the read and the write, e.g. through a bet, are settled one
+    deposit at a time through approve_deposit_apply_promotions(), under the same keys.
+    If the process dies midway, the claims lapse and recover_lapsed_deposits() settles
+    the deposits from the keys. `stamps` are per-deposit fields written by the claim
+    itself; one a unique index refuses (the payment already settled another deposit)
+    leaves its deposit pending with a STAMP_TAKEN result.
+    """
+    ids = list(dict.fromkeys(deposit_ids))
+    if not ids:
+        return []
+    now = _now()
+    token = uuid.uuid4().hex
+    claimed = {"id": {"$in": ids}, f"{CLAIM_FIELD}.token": token}
+
+    claimable = {"status": "pending", "$and": [unclaimed_filter(now), lease_free_filter(admin_id, now)]}
+    taken: List[str] = []
+    stamped = sorted({f for fields in (stamps or {}).values() for f in fields})
+    if stamps:
+        ops = [UpdateOne({"id": i, **claimable}, {"$set": _claim(token, admin_id, now, stamps.get(i))}) for i in ids]
+        try:
+            await db.deposits.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            taken = [ids[err["index"]] for err in errors]
+    else:
+        await db.deposits.update_many({"id": {"$in": ids}, **claimable}, {"$set": _claim(token, admin_id, now)})
+    deposits = await db.deposits.find(claimed, {"_id": 0}).sort([("created_at", 1), ("id", 1)]).to_list(None)
+
+    results: Dict[str, Dict[str, Any]] = {
+        i: {"deposit_id": i, "status": "skipped", "detail": "Deposit not found or already processed"} for i in ids
+    }
+    for i in taken:
+        results[i] = {"deposit_id": i, "status": "skipped", "detail": STAMP_TAKEN}
+    by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for d in deposits:
+        by_user.setdefault(d["user_id"], []).append(d)
+
+    projection = {"_id": 0, "id": 1, "ledger_seq": 1, "daily_first_deposit_bonus_last_date": 1, **{f: 1 for f in LEDGER_FIELDS}}
+    users = {u["id"]: u for u in await db.users.find({"id": {"$in": list(by_user)}}, projection).to_list(None)}
+    needs_cfg = any(d.get("promotion_key") == "first_deposit_108" for d in deposits)
+    cfg = await get_first_deposit_108_config(db) if needs_cfg else None
+    today = pk_date_str()
+
+    failed: List[str] = []
+    plans: Dict[str, Dict[str, Any]] = {}
+    for user_id, user_deposits in by_user.items():
+        if user_id not in users:
+            for d in user_deposits:
+                results[d["id"]] = {"deposit_id": d["id"], "status": "failed", "detail": "User not found"}
+                failed.append(d["id"])
+            continue
+        plans[user_id] = _plan_user(users[user_id], user_deposits, cfg, today)
+
+    landed: List[Dict[str, Any]] = []
+    if plans:
+        result = await db.users.bulk_write([p["op"] for p in plans.values()], ordered=False)
+        if result.matched_count == len(plans):
+            landed = list(plans.values())
+        else:
+            marked = await db.users.find(
+                {"id": {"$in": list(plans)}, APPLIED_FIELD: {"$in": [k for p in plans.values() for k in p["keys"]]}},
+                {"_id": 0, "id": 1},
+            ).to_list(None)
+            landed = [plans[u["id"]] for u in marked]
+
+    items = [item for p in landed for item in p["items"]]
+    if items:
+        await mark_deposits_approved(db, [i["deposit_id"] for i in items], token, admin_id)
+        user_state_cache.invalidate(db, *[p["items"][0]["user_id"] for p in landed])
+        await asyncio.gather(
+            add_wagering_records_many(db, [r for p in landed for r in p["wagering"]]),
+            journal.write(db, "transactions", [t for p in landed for t in p["transactions"]]),
+            append_entries(db, [e for p in landed for e in p["ledger"]]),
+        )
+        for item in items:
+            results[item["deposit_id"]] = {"status": "approved", **item}
+
+    # Lost the ledger_seq race: settle those users' deposits one at a time
+    landed_users = {p["items"][0]["user_id"] for p in landed}
+    for user_id, plan in plans.items():
+        if user_id in landed_users:
+            continue
+        for deposit in by_user[user_id]:
+            try:
+                applied = await approve_deposit_apply_promotions(db, deposit, admin_id)
+            except ValueError as e:
+                results[deposit["id"]] = {"deposit_id": deposit["id"], "status": "failed", "detail": str(e)}
+                failed.append(deposit["id"])
+                continue
+            await mark_deposits_approved(db, [deposit["id"]], token, admin_id)
+            results[deposit["id"]] = {
+                "deposit_id": deposit["id"],
+                "status": "approved",
+                "user_id": user_id,
+                "amount": int(deposit["amount"]),
+                "bonus_amount": applied["bonus_amount"],
+                "deposit_multiplier": applied["deposit_multiplier"],
+            }
+
+    if failed:
+        # Back to the queue untouched
+        await release_deposit_claims(db, failed, token, stamped)
+    await approval_queues.notify(db, "deposits", [d["id"] for d in deposits])
+    approved = [r for r in results.values() if r["status"] == "approved"]
+    await record_daily(
+        db, _now(), {"deposits_amount": sum(r["amount"] for r in approved), "deposits_count": len(approved)}
+    )
+    return [results[i] for i in ids]
+
+
+async def recover_lapsed_deposits(db) -> Dict[str, int]:
+    """Settle deposits left in "processing" by an approval that died (its claim lapsed).
+
+    A deposit whose credit landed (its credit_key() is on the user) is marked approved
+    and flagged `recovered_at` for reconciliation, since its transactions and wagering
+    may be missing; any other goes back to pending, without the stamps its claim wrote.
+    Every update is guarded on the lapsed claim, so workers sweeping at the same time
+    cannot both act on a deposit.
+    """
+    now = _now()
+    lapsed = await db.deposits.find(
+        {"status": "processing", f"{CLAIM_FIELD}.expires_at": {"$lt": now}},
+        {"_id": 0, "id": 1, "user_id": 1, CLAIM_FIELD: 1},
+    ).to_list(RECOVER_BATCH)
+
+    approved: List[str] = []
+    returned: List[str] = []
+    for deposit in lapsed:
+        claim = deposit[CLAIM_FIELD]
+        guard = {"id": deposit["id"], "status": "processing", f"{CLAIM_FIELD}.token": claim["token"]}
+        if await was_applied(db, deposit["user_id"], credit_key(deposit["id"])):
+            result = await db.deposits.update_one(
+                guard,
+                {
+                    "$set": {"status": "approved", "approved_at": now, "approved_by": claim.get("by"), "recovered_at": now},
+                    "$unset": {CLAIM_FIELD: ""},
+                },
+            )
+            if result.modified_count:
+                approved.append(deposit["id"])
+                logger.error("Deposit %s was credited by an approval that died; approved it, check its records", deposit["id"])
+        else:
+            result = await db.deposits.update_one(
+                guard, {"$set": {"status": "pending"}, "$unset": _unclaim(claim.get("stamped", []))}
+            )
+            if result.modified_count:
+                returned.append(deposit["id"])
+    if approved or returned:
+        await approval_queues.notify(db, "deposits", approved + returned)
+    return {"approved": len(approved), "returned": len(returned)}
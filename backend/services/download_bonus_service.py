@@ -5,9 +5,11 @@ from typing import Any, Dict, Optional
 import uuid
 import random
 
+from money import to_paisa
 
-def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
 
 
 def _random_download_bonus_amount() -> int:
@@ -50,23 +52,26 @@ async def try_grant_download_bonus(db, user: Dict[str, Any]) -> Optional[Dict[st
     if exists:
         return None
 
-    amount = float(_random_download_bonus_amount())
+    amount = to_paisa(_random_download_bonus_amount())
 
-    # Credit bonus into single wallet
-    new_balance = float(user.get("wallet_balance", 0.0)) + amount
+    # Credit bonus into single wallet; the has_download_bonus guard makes the grant one-shot
+    from services.wallet_service import apply_balance_change
 
-    await db.users.update_one(
-        {"id": user["id"]},
-        {
-            "$set": {
-                "has_download_bonus": True,
-                "download_bonus_amount": amount,
-                "download_bonus_at": _now_iso(),
-                "wallet_balance": new_balance,
-                "updated_at": _now_iso(),
-            }
+    balances = await apply_balance_change(
+        db,
+        user["id"],
+        {"wallet_balance": amount},
+        match={"has_download_bonus": {"$ne": True}},
+        extra_set={
+            "has_download_bonus": True,
+            "download_bonus_amount": amount,
+            "download_bonus_at": _now(),
         },
+        kind="download_bonus",
     )
+    if not balances:
+        return None
+    new_balance = int(balances["wallet_balance"])
 
     claim = {
         "id": str(uuid.uuid4()),
@@ -76,7 +81,7 @@ async def try_grant_download_bonus(db, user: Dict[str, Any]) -> Optional[Dict[st
         "app_install_id": app_install_id,
         "phone": phone,
         "amount": amount,
-        "created_at": _now_iso(),
+        "created_at": _now(),
         "source": "system_auto",
     }
     await db.bonus_claims.insert_one(claim)
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+ASC = 1
+DESC = -1
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    purpose: str
+    unique: bool = False
+    expire_after_seconds: Optional[int] = None  # TTL index
+    partial_filter: Optional[Dict[str, Any]] = field(default=None, hash=False)  # partial index
+
+    @property
+    def name(self) -> str:
+        # Same naming MongoDB uses by default, so pre-existing indexes are recognised
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+    def options(self) -> Dict[str, Any]:
+        opts: Dict[str, Any] = {"name": self.name}
+        if self.unique:
+            opts["unique"] = True
+        if self.expire_after_seconds is not None:
+            opts["expireAfterSeconds"] = self.expire_after_seconds
+        if self.partial_filter is not None:
+            opts["partialFilterExpression"] = self.partial_filter
+        return opts
+
+
+def _idx(collection: str, *keys: Tuple[str, int], purpose: str, **options: Any) -> IndexSpec:
+    return IndexSpec(collection, tuple(keys), purpose, **options)
+
+
+INDEXES: List[IndexSpec] = [
+    # users
+    _idx("users", ("email", ASC), purpose="login / registration lookup", unique=True),
+    _idx("users", ("referral_code", ASC), purpose="referral code lookup", unique=True),
+    _idx("users", ("id", ASC), purpose="every per-user read and balance update", unique=True),
+    _idx("users", ("role", ASC), ("created_at", DESC), ("id", DESC), purpose="admin user list (keyset)"),
+    _idx("users", ("kyc_status", ASC), purpose="pending KYC count"),
+    _idx("users", ("search.tokens", ASC), ("created_at", DESC), purpose="admin user search (multikey tokens)"),
+    # money history: user_id + created_at, keyset on (created_at, id)
+    _idx("transactions", ("user_id", ASC), ("created_at", DESC), ("id", DESC), purpose="transaction history"),
+    _idx("bets", ("user_id", ASC), ("created_at", DESC), ("id", DESC), purpose="bet history"),
+    # Archiver batches walk (created_at, _id) oldest first; the bets one also serves the dashboard range
+    _idx("transactions", ("created_at", ASC), ("_id", ASC), purpose="history archiver batches"),
+    _idx("bets", ("created_at", ASC), ("_id", ASC), purpose="history archiver batches / dashboard bets today"),
+    _idx("deposits", ("id", ASC), purpose="deposit approval lookup", unique=True),
+    _idx("deposits", ("user_id", ASC), ("created_at", DESC), ("id", DESC), purpose="deposit history / first-deposit count"),
+    _idx("deposits", ("status", ASC), ("created_at", DESC), purpose="pending deposit queue"),
+    _idx("deposits", ("status", ASC), ("approved_at", ASC), purpose="dashboard deposits today"),
+    # Unique: one statement payment settles at most one deposit (only stamped deposits are indexed)
+    _idx(
+        "deposits",
+        ("statement_ref", ASC),
+        purpose="statement import: payment already settled",
+        unique=True,
+        partial_filter={"statement_ref": {"$type": "string"}},
+    ),
+    _idx("withdrawals", ("id", ASC), purpose="withdrawal approval lookup", unique=True),
+    _idx("withdrawals", ("user_id", ASC), ("created_at", DESC), ("id", DESC), purpose="withdrawal history"),
+    _idx("withdrawals", ("status", ASC), ("created_at", DESC), purpose="pending withdrawal queue"),
+    _idx("withdrawals", ("status", ASC), ("approved_at", ASC), purpose="dashboard withdrawals today"),
+    # bonuses
+    _idx("wagering", ("id", ASC), purpose="wagering record updates", unique=True),
+    _idx("wagering", ("user_id", ASC), ("status", ASC), ("priority", ASC), purpose="active requirements in priority order"),
+    _idx("wagering", ("user_id", ASC), ("created_at", DESC), ("id", DESC), purpose="admin wagering list by user"),
+    _idx("wagering", ("created_at", DESC), ("id", DESC), purpose="admin wagering list"),
+    _idx("bonus_claims", ("bonus_type", ASC), ("created_at", DESC), ("id", DESC), purpose="admin bonus claim list"),
+    # One index per $or branch of the app-download duplicate check
+    _idx("bonus_claims", ("device_fingerprint", ASC), purpose="download bonus duplicate check"),
+    _idx("bonus_claims", ("app_install_id", ASC), purpose="download bonus duplicate check"),
+    _idx("bonus_claims", ("phone", ASC), purpose="download bonus duplicate check / admin filter"),
+    _idx("bonus_claims", ("user_id", ASC), purpose="download bonus duplicate check"),
+    _idx("referrals", ("referred_user_id", ASC), purpose="referral status updates"),
+    _idx("notifications", ("created_at", DESC), ("id", DESC), purpose="admin notification list"),
+    # settings, security, counters
+    _idx("system_settings", ("setting_key", ASC), purpose="settings registry", unique=True),
+    _idx("security_events", ("user_id", ASC), purpose="per-user security audit"),
+    _idx("bet_counters", ("expires_at", ASC), purpose="expire daily counters", expire_after_seconds=0),
+    _idx("rate_counters", ("name", ASC), ("key", ASC), ("bucket", ASC), purpose="sliding window buckets"),
+    _idx("rate_counters", ("expires_at", ASC), purpose="expire window buckets", expire_after_seconds=0),
+    _idx("throttle_buckets", ("expires_at", ASC), purpose="expire idle throttle buckets", expire_after_seconds=0),
+    _idx("cache_invalidations", ("at", ASC), purpose="user cache bus poll"),
+    _idx("cache_invalidations", ("expires_at", ASC), purpose="expire bus messages", expire_after_seconds=0),
+    _idx("queue_events", ("at", ASC), purpose="approval queue bus poll"),
+    _idx("queue_events", ("expires_at", ASC), purpose="expire queue events", expire_after_seconds=0),
+    # ledger
+    _idx("ledger_entries", ("user_id", ASC), ("seq", ASC), purpose="ledger replay", unique=True),
+    _idx("ledger_snapshots", ("user_id", ASC), ("seq", ASC), purpose="ledger snapshots", unique=True),
+    # crash
+    _idx("crash_rounds", ("id", ASC), purpose="round verify", unique=True),
+    _idx("crash_rounds", ("chain_id", ASC), ("chain_index", ASC), purpose="chain neighbour lookup"),
+    _idx("crash_rounds", ("crashed_at", ASC), purpose="round audit range"),
+    _idx("crash_seed_chains", ("id", ASC), purpose="chain lookup", unique=True),
+    _idx("crash_seed_chains", ("status", ASC), purpose="active chain"),
+    _idx("crash_seed_chunks", ("chain_id", ASC), ("chunk_index", ASC), purpose="seed chunk lookup", unique=True),
+]
+
+
+def _collections() -> List[str]:
+    return sorted({spec.collection for spec in INDEXES})
+
+
+def _key(index: Dict[str, Any]) -> Tuple[Tuple[str, int], ...]:
+    return tuple((field, int(direction)) for field, direction in index["key"])
+
+
+def _differences(spec: IndexSpec, index: Dict[str, Any]) -> List[str]:
+    diffs = []
+    if bool(index.get("unique")) != spec.unique:
+        diffs.append(f"unique: expected {spec.unique}, found {bool(index.get('unique'))}")
+    ttl = index.get("expireAfterSeconds")
+    if (None if ttl is None else int(ttl)) != spec.expire_after_seconds:
+        diffs.append(f"expireAfterSeconds: expected {spec.expire_after_seconds}, found {ttl}")
+    partial = index.get("partialFilterExpression")
+    if (None if partial is None else dict(partial)) != spec.partial_filter:
+        diffs.append(f"partialFilterExpression: expected {spec.partial_filter}, found {partial}")
+    return diffs
+
+
+async def index_drift(db) -> Dict[str, Any]:
+    """Compare the live indexes of every spec'd collection with INDEXES.
+
+    missing: spec'd but not present; conflicting: present with the same keys but
+    different options; unexpected: present but not spec'd (candidates for removal).
+    """
+    missing: List[Dict[str, Any]] = []
+    conflicting: List[Dict[str, Any]] = []
+    unexpected: List[Dict[str, Any]] = []
+
+    for collection in _collections():
+        live = await db[collection].index_information()
+        live_by_key = {_key(info): (name, info) for name, info in live.items()}
+        specs = [s for s in INDEXES if s.collection == collection]
+
+        for spec in specs:
+            found = live_by_key.get(spec.keys)
+            if not found:
+                missing.append({"collection": collection, "name": spec.name, "purpose": spec.purpose})
+                continue
+            diffs = _differences(spec, found[1])
+            if diffs:
+                conflicting.append({"collection": collection, "name": found[0], "differences": diffs})
+
+        wanted = {spec.keys for spec in specs}
+        for name, info in live.items():
+            if name != "_id_" and _key(info) not in wanted:
+                unexpected.append({"collection": collection, "name": name, "key": info["key"]})
+
+    return {
+        "in_sync": not (missing or conflicting or unexpected),
+        "missing": missing,
+        "conflicting": conflicting,
+        "unexpected": unexpected,
+    }
+
+
+async def apply_indexes(db, drop_unexpected: bool = False) -> Dict[str, Any]:
+    """Create missing spec'd indexes; idempotent.
+
+    Conflicting indexes are reported, never rebuilt here: changing e.g. uniqueness on a
+    live collection needs a deliberate drop and rebuild. Unexpected indexes are only
+    dropped when asked.
+    """
+    drift = await index_drift(db)
+    by_name = {(s.collection, s.name): s for s in INDEXES}
+
+    created = []
+    for item in drift["missing"]:
+        spec = by_name[(item["collection"], item["name"])]
+        await db[spec.collection].create_index(list(spec.keys), **spec.options())
+        created.append(f"{spec.collection}.{spec.name}")
+
+    dropped = []
+    if drop_unexpected:
+        for item in drift["unexpected"]:
+            await db[item["collection"]].drop_index(item["name"])
+            dropped.append(f"{item['collection']}.{item['name']}")
+
+    return {"created": created, "dropped": dropped, "conflicting": drift["conflicting"]}
+
+
+async def unused_indexes(db) -> Dict[str, Any]:
+    """Indexes with no recorded accesses since the server last started, via $indexStats.
+
+    Counters reset on restart and are per node, so a short uptime says little.
+    """
+    unused: List[Dict[str, Any]] = []
+    for collection in _collections():
+        try:
+            stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+        except (OperationFailure, NotImplementedError) as e:
+            return {"available": False, "error": str(e), "unused": []}
+        for s in stats:
+            ops = int(s.get("accesses", {}).get("ops", 0))
+            if s["name"] != "_id_" and ops == 0:
+                since = s.get("accesses", {}).get("since")
+                unused.append({
+                    "collection": collection,
+                    "name": s["name"],
+                    "since": since.isoformat() if hasattr(since, "isoformat") else since,
+                })
+    return {"available": True, "unused": unused}
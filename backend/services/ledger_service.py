@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from services.write_behind_service import journal
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FIELDS = ("wallet_balance", "locked_balance", "bonus_balance")
+
+# Entries between snapshots; bounds the tail a balance_at() query replays
+SNAPSHOT_EVERY = int(os.getenv("LEDGER_SNAPSHOT_EVERY", "100"))
+
+# Entries whose write failed are retried this often; past the cap further failures are only logged
+REPLAY_INTERVAL_SECONDS = float(os.getenv("LEDGER_REPLAY_INTERVAL_SECONDS", "5"))
+REPLAY_MAX_PENDING = int(os.getenv("LEDGER_REPLAY_MAX_PENDING", "100000"))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _balances(doc: Dict[str, Any]) -> Dict[str, int]:
+    return {f: int(doc.get(f) or 0) for f in LEDGER_FIELDS}
+
+
+def _entry_docs(
+    user_id: str,
+    seq: int,
+    kind: str,
+    delta: Dict[str, int],
+    after: Dict[str, Any],
+    ref_id: Optional[str],
+    at: datetime,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """The ledger entry for one change plus the snapshots it is due (opening and periodic)."""
+    balances_after = _balances(after)
+    entry = {
+        "user_id": user_id,
+        "seq": int(seq),
+        "kind": kind,
+        "ref_id": ref_id,
+        "delta": {f: int(delta[f]) for f in LEDGER_FIELDS if delta.get(f)},
+        "balances_after": balances_after,
+        "at": at,
+    }
+    snapshots: List[Dict[str, Any]] = []
+    if seq == 1:
+        # First ledgered change: everything before it is carried in as the opening balance
+        opening = {f: balances_after[f] - entry["delta"].get(f, 0) for f in LEDGER_FIELDS}
+        snapshots.append({"user_id": user_id, "seq": 0, "balances": opening, "at": at})
+    if seq % SNAPSHOT_EVERY == 0:
+        snapshots.append({"user_id": user_id, "seq": int(seq), "balances": balances_after, "at": at})
+    return entry, snapshots
+
+
+async def _write_entries(db, entries: List[Dict[str, Any]]) -> None:
+    """Durable write of ledger entries that never raises: a failure is logged and handed to
+    ledger_replay, because the balance change the entries describe has already committed."""
+    try:
+        await journal.write(db, "ledger_entries", entries)
+    except Exception:
+        logger.exception("Ledger write of %d entries failed; queued for replay", len(entries))
+        ledger_replay.enqueue(db, entries)
+
+
+async def append_entry(
+    db,
+    user_id: str,
+    seq: int,
+    kind: str,
+    delta: Dict[str, int],
+    after: Dict[str, Any],
+    ref_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Record one balance change (amounts in paisa).
+
+    `seq` is the user's ledger_seq taken by the same atomic update that applied `delta`,
+    so a user's entries are numbered 1, 2, 3... without gaps. `after` is that update's
+    post-image; it also seeds the opening snapshot (seq 0) and the periodic snapshots.
+    Never raises: an entry that cannot be written is queued for ledger_replay.
+    """
+    entry, snapshots = _entry_docs(user_id, seq, kind, delta, after, ref_id, _now())
+    await _write_entries(db, [entry])
+    # Snapshots are derivable from the entries, so they need not hold up the request
+    journal.write_nowait(db, "ledger_snapshots", snapshots)
+    return entry
+
+
+async def append_entries(
+    db,
+    changes: List[Tuple[str, int, str, Dict[str, int], Dict[str, Any], Optional[str]]],
+) -> List[Dict[str, Any]]:
+    """append_entry() for many changes at once: (user_id, seq, kind, delta, after, ref_id) each.
+
+    For batch writers that took a consecutive run of ledger_seq values in one update
+    and derived each change's post-image themselves; all entries go out in one write.
+    """
+    at = _now()
+    entries: List[Dict[str, Any]] = []
+    snapshots: List[Dict[str, Any]] = []
+    for user_id, seq, kind, delta, after, ref_id in changes:
+        entry, due = _entry_docs(user_id, seq, kind, delta, after, ref_id, at)
+        entries.append(entry)
+        snapshots.extend(due)
+    await _write_entries(db, entries)
+    journal.write_nowait(db, "ledger_snapshots", snapshots)
+    return entries
+
+
+async def balance_at(db, user_id: str, at: datetime) -> Optional[Dict[str, Any]]:
+    """Rebuild a user's balances as of `at` from the nearest snapshot plus the entries after it.
+
+    Returns None when the user's ledger starts after `at`.
+    """
+    at = at.astimezone(timezone.utc)
+    snapshot = await db.ledger_snapshots.find_one(
+        {"user_id": user_id, "at": {"$lte": at}},
+        {"_id": 0},
+        sort=[("seq", -1)],
+    )
+    if not snapshot:
+        return None
+
+    balances = dict(snapshot["balances"])
+    seq = int(snapshot["seq"])
+    tail = await db.ledger_entries.find(
+        {"user_id": user_id, "seq": {"$gt": seq}, "at": {"$lte": at}},
+        {"_id": 0, "seq": 1, "delta": 1},
+    ).sort("seq", 1).to_list(None)
+
+    for entry in tail:
+        if entry["seq"] != seq + 1:
+            logger.warning("Ledger gap for user %s between seq %s and %s", user_id, seq, entry["seq"])
+        for field, amount in entry.get("delta", {}).items():
+            balances[field] = balances.get(field, 0) + int(amount)
+        seq = entry["seq"]
+
+    return {
+        "user_id": user_id,
+        "at": at,
+        "seq": seq,
+        "balances": balances,
+        "snapshot_seq": int(snapshot["seq"]),
+        "replayed_entries": len(tail),
+    }
+
+
+class LedgerReplay:
+    """Retries ledger entries whose write failed after their balance change committed.
+
+    Replays upsert on (user_id, seq) — the key the unique index enforces — so an entry
+    that did land before its write reported an error is left as it is rather than
+    duplicated. Pending entries live in memory; one lost with the process shows up as a
+    gap in the user's seq numbers, which balance_at() reports.
+    """
+
+    def __init__(self, interval_seconds: float = REPLAY_INTERVAL_SECONDS, max_pending: int = REPLAY_MAX_PENDING):
+        self._interval = interval_seconds
+        self._max_pending = max_pending
+        self._db = None
+        self._pending: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.replayed = 0
+        self.dropped = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db) -> None:
+        if self.running:
+            return
+        self._db = db
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending and self._db is not None:
+            try:
+                await self.replay(self._db)
+            except Exception:
+                logger.exception("Ledger replay at shutdown failed; %d entries unwritten", len(self._pending))
+
+    def enqueue(self, db, entries: List[Dict[str, Any]]) -> None:
+        if self._db is None:
+            self._db = db
+        for entry in entries:
+            if len(self._pending) >= self._max_pending:
+                self.dropped += 1
+                logger.error("Ledger replay queue full; entry %s/%s dropped", entry["user_id"], entry["seq"])
+                continue
+            # insert_many stamps an _id on the dict; the replay keys on (user_id, seq) instead
+            self._pending[(entry["user_id"], entry["seq"])] = {k: v for k, v in entry.items() if k != "_id"}
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            if not self._pending:
+                continue
+            try:
+                await self.replay(self._db)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("Ledger replay failed; %d entries still pending: %s", len(self._pending), e)
+
+    async def replay(self, db) -> int:
+        """Write every pending entry (idempotently); returns how many were written."""
+        batch = dict(self._pending)
+        if not batch:
+            return 0
+        ops = [
+            UpdateOne(
+                {"user_id": user_id, "seq": seq},
+                {"$setOnInsert": {k: v for k, v in entry.items() if k not in ("user_id", "seq")}},
+                upsert=True,
+            )
+            for (user_id, seq), entry in batch.items()
+        ]
+        await db.ledger_entries.bulk_write(ops, ordered=False)
+        for key in batch:
+            self._pending.pop(key, None)
+        self.replayed += len(batch)
+        self.last_error = None
+        return len(batch)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "pending": self.pending(),
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+            "last_error": self.last_error,
+        }
+
+
+ledger_replay = LedgerReplay()
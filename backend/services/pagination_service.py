@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Response
+
+# Newest first; `id` breaks ties between documents created in the same instant
+PAGE_SORT = [("created_at", -1), ("id", -1)]
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(doc: Dict[str, Any], source: Optional[str] = None) -> str:
+    """Opaque token for the position just after `doc` in PAGE_SORT order.
+
+    `source` tags the stream a document came from when several are merged (timeline).
+    """
+    created_at = doc["created_at"]
+    payload = {"i": doc["id"]}
+    if isinstance(created_at, datetime):
+        payload["d"] = created_at.isoformat()
+    else:
+        payload["c"] = created_at
+    if source is not None:
+        payload["s"] = source
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[Any, str, Optional[str]]:
+    """(created_at, id, source) from a token made by encode_cursor; ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        last_id = str(payload["i"])
+        if "d" in payload:
+            created_at = datetime.fromisoformat(payload["d"])
+        else:
+            created_at = str(payload["c"])
+        source = payload.get("s")
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError):
+        raise ValueError("Invalid cursor")
+    return created_at, last_id, None if source is None else str(source)
+
+
+def after_position(created_at: Any, last_id: str) -> Dict[str, Any]:
+    """Filter for documents strictly after (created_at, id) in PAGE_SORT order."""
+    return {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": last_id}},
+        ]
+    }
+
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of `collection` in PAGE_SORT order, plus the cursor for the next page.
+
+    With a cursor the query seeks past the last seen (created_at, id) on the
+    (..., created_at, id) index, so page N costs the same as page 1. `skip` is the
+    deprecated offset fallback and is ignored when a cursor is given. The next cursor
+    is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if cursor:
+        created_at, last_id, _ = decode_cursor(cursor)
+        after = after_position(created_at, last_id)
+        query = {"$and": [query, after]} if query else after
+        skip = 0
+
+    docs = await (
+        collection.find(query, projection)
+        .sort(PAGE_SORT)
+        .skip(max(0, int(skip)))
+        .limit(limit + 1)
+        .to_list(limit + 1)
+    )
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    # List bodies stay unchanged for existing clients; the cursor travels in a header
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -5,8 +5,8 @@ from typing import Any, Dict, List, Optional, Tuple
 import random
 
 
-def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
 
 
 DEFAULT_FIRST_DEPOSIT_108_CONFIG: List[Dict[str, Any]] = [
@@ -56,7 +56,7 @@ async def set_first_deposit_108_config(db, config: List[Dict[str, Any]], admin_i
                 "key": "first_deposit_108",
                 "config": config,
                 "updated_by": admin_id,
-                "updated_at": _now_iso(),
+                "updated_at": _now(),
             }
         },
         upsert=True,
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Optional
+
+# memory: per-process counts; mongo: shared across workers via bucketed counter documents
+BACKEND = os.getenv("RATE_COUNTER_BACKEND", "memory")
+
+SWEEP_EVERY = 1000  # hits between sweeps of idle in-memory keys
+MONGO_BUCKETS = 10  # sub-buckets per window in mongo mode
+
+
+class SlidingWindowCounter:
+    """Counts events per key over a trailing time window without scanning stored events."""
+
+    def __init__(self, name: str, window_seconds: float, backend: Optional[str] = None):
+        self.name = name
+        self.window = float(window_seconds)
+        self.backend = backend or BACKEND
+        self._events: Dict[str, Deque[float]] = {}
+        self._hits = 0
+
+    async def hit(self, db, key: str, now: Optional[float] = None) -> int:
+        """Record one event for `key` and return the number of events in the window, including it."""
+        now = time.time() if now is None else now
+        if self.backend == "mongo":
+            return await self._hit_mongo(db, key, now)
+        return self._hit_memory(key, now)
+
+    async def count(self, db, key: str, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        if self.backend == "mongo":
+            return await self._count_mongo(db, key, now)
+        events = self._events.get(key)
+        if not events:
+            return 0
+        self._prune(events, now)
+        return len(events)
+
+    def reset(self, key: str) -> None:
+        self._events.pop(key, None)
+
+    # -------------------------
+    # In-memory backend
+    # -------------------------
+
+    def _prune(self, events: Deque[float], now: float) -> None:
+        cutoff = now - self.window
+        while events and events[0] <= cutoff:
+            events.popleft()
+
+    def _hit_memory(self, key: str, now: float) -> int:
+        events = self._events.setdefault(key, deque())
+        self._prune(events, now)
+        events.append(now)
+
+        self._hits += 1
+        if self._hits % SWEEP_EVERY == 0:
+            self._sweep(now)
+        return len(events)
+
+    def _sweep(self, now: float) -> None:
+        for key in list(self._events.keys()):
+            events = self._events[key]
+            self._prune(events, now)
+            if not events:
+                del self._events[key]
+
+    # -------------------------
+    # Shared (Mongo) backend
+    # -------------------------
+
+    def _bucket_seconds(self) -> float:
+        return self.window / MONGO_BUCKETS
+
+    async def _hit_mongo(self, db, key: str, now: float) -> int:
+        size = self._bucket_seconds()
+        bucket = int(now // size)
+        await db.rate_counters.update_one(
+            {"_id": f"{self.name}:{key}:{bucket}"},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {
+                    "name": self.name,
+                    "key": key,
+                    "bucket": bucket,
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.window + size),
+                },
+            },
+            upsert=True,
+        )
+        return await self._count_mongo(db, key, now)
+
+    async def _count_mongo(self, db, key: str, now: float) -> int:
+        # Bucket granularity: the window is approximated by the last MONGO_BUCKETS buckets
+        size = self._bucket_seconds()
+        first = int(now // size) - MONGO_BUCKETS + 1
+        docs = await db.rate_counters.find(
+            {"name": self.name, "key": key, "bucket": {"$gte": first}},
+            {"_id": 0, "count": 1},
+        ).to_list(MONGO_BUCKETS + 1)
+        return sum(int(d.get("count", 0)) for d in docs)
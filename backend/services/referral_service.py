@@ -5,8 +5,8 @@ from typing import Any, Dict, Optional
 import uuid
 
 
-def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
 
 
 async def create_referral_record(db, referrer_user_id: str, referred_user_id: str, code: str, signals: Dict[str, Any]):
@@ -19,13 +19,13 @@ async def create_referral_record(db, referrer_user_id: str, referred_user_id: st
         "deposit_verified": False,
         "first_wager_completed": False,
         "referral_reward_paid": False,
-        "total_deposit_commission_earned": 0.0,
-        "total_rebate_earned": 0.0,
+        "total_deposit_commission_earned": 0,
+        "total_rebate_earned": 0,
         "fraud_flags": signals.get("fraud_flags", []),
         "signals": signals,
         "system_decision_timestamp": None,
-        "created_at": _now_iso(),
-        "updated_at": _now_iso(),
+        "created_at": _now(),
+        "updated_at": _now(),
     }
     await db.referrals.insert_one(rec)
 
@@ -34,7 +34,7 @@ async def flag_referral(db, referred_user_id: str, flags: list[str]):
     await db.referrals.update_one(
         {"referred_user_id": referred_user_id},
         {
-            "$set": {"referral_status": "flagged", "updated_at": _now_iso(), "system_decision_timestamp": _now_iso()},
+            "$set": {"referral_status": "flagged", "updated_at": _now(), "system_decision_timestamp": _now()},
             "$addToSet": {"fraud_flags": {"$each": flags}},
         },
     )
@@ -44,7 +44,7 @@ async def reject_referral(db, referred_user_id: str, flags: list[str]):
     await db.referrals.update_one(
         {"referred_user_id": referred_user_id},
         {
-            "$set": {"referral_status": "rejected", "updated_at": _now_iso(), "system_decision_timestamp": _now_iso()},
+            "$set": {"referral_status": "rejected", "updated_at": _now(), "system_decision_timestamp": _now()},
             "$addToSet": {"fraud_flags": {"$each": flags}},
         },
     )
@@ -53,14 +53,14 @@ async def reject_referral(db, referred_user_id: str, flags: list[str]):
 async def mark_deposit_verified(db, referred_user_id: str):
     await db.referrals.update_one(
         {"referred_user_id": referred_user_id},
-        {"$set": {"deposit_verified": True, "updated_at": _now_iso()}},
+        {"$set": {"deposit_verified": True, "updated_at": _now()}},
     )
 
 
 async def mark_first_wager(db, referred_user_id: str):
     await db.referrals.update_one(
         {"referred_user_id": referred_user_id},
-        {"$set": {"first_wager_completed": True, "updated_at": _now_iso()}},
+        {"$set": {"first_wager_completed": True, "updated_at": _now()}},
     )
 
 
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = float(os.getenv("SETTINGS_POLL_SECONDS", "1"))
+USE_CHANGE_STREAM = os.getenv("SETTINGS_CHANGE_STREAM", "").lower() in ("1", "true", "yes")
+
+VERSION_DOC_ID = "system_settings"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass(frozen=True)
+class SettingSpec:
+    key: str
+    type: type
+    default: Any
+    description: str
+    public: bool = False  # exposed on unauthenticated endpoints
+
+
+SETTINGS: List[SettingSpec] = [
+    SettingSpec("currency", str, "PKR", "Display currency", public=True),
+    SettingSpec("deposit_min", float, 300, "Minimum deposit (PKR)"),
+    SettingSpec("deposit_max", float, 50000, "Maximum deposit (PKR)"),
+    SettingSpec("first_deposit_108_min_deposit", float, 100, "Minimum deposit when first-deposit-108 is selected"),
+    SettingSpec("statement_match_window_minutes", float, 30, "Statement auto-match: max minutes between a payment and its deposit request"),
+    SettingSpec("queue_vip_boost_minutes", float, 30, "Approval queues: minutes each VIP level moves an item ahead"),
+    SettingSpec("queue_amount_boost_minutes_per_10k", float, 10, "Approval queues: minutes every PKR 10,000 moves an item ahead"),
+    SettingSpec("withdraw_min", float, 300, "Minimum withdrawal (PKR)"),
+    SettingSpec("withdraw_max", float, 30000, "Maximum withdrawal (PKR)"),
+    SettingSpec("daily_bet_limit", float, 100000, "Maximum total stake per user per day"),
+    SettingSpec("daily_bet_limit_mode", str, "pk_day", "pk_day (Pakistan calendar day) or rolling_24h"),
+    SettingSpec("crash_house_edge", float, 0.03, "Crash house edge (0.03 = 3%)", public=True),
+    SettingSpec("crash_min_bet", float, 50, "Crash minimum bet", public=True),
+    SettingSpec("crash_max_bet", float, 50000, "Crash maximum bet", public=True),
+    SettingSpec("crash_enabled", bool, True, "Crash game enabled", public=True),
+    SettingSpec("crash_betting_window_seconds", float, 5, "Crash betting window per round", public=True),
+    SettingSpec("auth_throttle_enabled", bool, True, "Throttle login/registration attempts"),
+    SettingSpec("auth_login_ip_per_minute", float, 30, "Login attempts per IP per minute"),
+    SettingSpec("auth_login_email_per_minute", float, 10, "Login attempts per email per minute"),
+    SettingSpec("auth_admin_login_ip_per_minute", float, 10, "Admin login attempts per IP per minute"),
+    SettingSpec("auth_admin_login_email_per_minute", float, 5, "Admin login attempts per email per minute"),
+    SettingSpec("auth_register_ip_per_minute", float, 5, "Registrations per IP per minute"),
+    SettingSpec("auth_register_email_per_minute", float, 3, "Registration attempts per email per minute"),
+]
+
+REGISTRY: Dict[str, SettingSpec] = {spec.key: spec for spec in SETTINGS}
+DEFAULTS: Dict[str, Any] = {spec.key: spec.default for spec in SETTINGS}
+
+
+def coerce_setting(spec: SettingSpec, value: Any) -> Any:
+    """Convert a stored or submitted value to the setting's type; raises ValueError if impossible."""
+    if spec.type is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in ("true", "false", "1", "0"):
+            return value.lower() in ("true", "1")
+        if isinstance(value, (int, float)):
+            return bool(value)
+        raise ValueError(f"{spec.key} must be a boolean")
+    if spec.type is float:
+        if isinstance(value, bool):
+            raise ValueError(f"{spec.key} must be a number")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{spec.key} must be a number")
+    return spec.type(value)
+
+
+class SettingsSnapshot(Mapping):
+    """Immutable view of every registered setting at one version."""
+
+    def __init__(self, values: Dict[str, Any], version: int):
+        self._values = MappingProxyType(dict(values))
+        self.version = version
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def subset(self, keys: List[str]) -> Dict[str, Any]:
+        return {k: self._values[k] for k in keys}
+
+    def public(self) -> Dict[str, Any]:
+        return {k: v for k, v in self._values.items() if REGISTRY[k].public}
+
+
+class SettingsRegistry:
+    """Process-wide settings cache.
+
+    Readers get the cached snapshot with no DB round trip. A version counter bumped on every
+    admin write is polled in the background (or a change stream is watched) to reload it.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[SettingsSnapshot] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def watching(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def snapshot(self, db) -> SettingsSnapshot:
+        snap = self._snapshot
+        if snap is not None and (self.watching or time.monotonic() - self._loaded_at < POLL_SECONDS):
+            return snap
+        return await self.reload(db, if_newer=snap is not None)
+
+    async def reload(self, db, if_newer: bool = False) -> SettingsSnapshot:
+        async with self._lock:
+            version = await self._read_version(db)
+            if if_newer and self._snapshot is not None and self._snapshot.version >= version:
+                self._loaded_at = time.monotonic()
+                return self._snapshot
+
+            docs = await db.system_settings.find(
+                {"setting_key": {"$in": list(REGISTRY.keys())}},
+                {"_id": 0, "setting_key": 1, "setting_value": 1},
+            ).to_list(len(REGISTRY))
+
+            values = dict(DEFAULTS)
+            for d in docs:
+                spec = REGISTRY[d["setting_key"]]
+                try:
+                    values[spec.key] = coerce_setting(spec, d.get("setting_value"))
+                except ValueError:
+                    logger.warning("Ignoring invalid stored value for setting %s", spec.key)
+
+            self._snapshot = SettingsSnapshot(values, version)
+            self._loaded_at = time.monotonic()
+            return self._snapshot
+
+    async def update(self, db, updates: Dict[str, Any], updated_by: str, description: str) -> Dict[str, Any]:
+        """Validate, persist and publish setting changes. Unknown keys are ignored."""
+        coerced = {k: coerce_setting(REGISTRY[k], v) for k, v in updates.items() if k in REGISTRY}
+        if not coerced:
+            return {}
+
+        now = _now()
+        await db.system_settings.bulk_write(
+            [
+                UpdateOne(
+                    {"setting_key": k},
+                    {
+                        "$set": {
+                            "setting_key": k,
+                            "setting_value": v,
+                            "description": description,
+                            "updated_by": updated_by,
+                            "updated_at": now,
+                        }
+                    },
+                    upsert=True,
+                )
+                for k, v in coerced.items()
+            ],
+            ordered=False,
+        )
+        await db.settings_versions.update_one(
+            {"_id": VERSION_DOC_ID},
+            {"$inc": {"version": 1}, "$set": {"updated_at": now}},
+            upsert=True,
+        )
+        await self.reload(db)
+        return coerced
+
+    async def _read_version(self, db) -> int:
+        doc = await db.settings_versions.find_one({"_id": VERSION_DOC_ID}, {"version": 1})
+        return int(doc["version"]) if doc else 0
+
+    def start(self, db) -> None:
+        if self.watching:
+            return
+        self._task = asyncio.create_task(self._watch_change_stream(db) if USE_CHANGE_STREAM else self._poll(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _poll(self, db) -> None:
+        while True:
+            try:
+                await self.reload(db, if_newer=True)
+            except Exception:
+                logger.exception("Settings reload failed")
+            await asyncio.sleep(POLL_SECONDS)
+
+    async def _watch_change_stream(self, db) -> None:
+        # Requires a replica set; falls back to polling when change streams are unavailable
+        try:
+            await self.reload(db)
+            async with db.settings_versions.watch() as stream:
+                async for _ in stream:
+                    await self.reload(db, if_newer=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Settings change stream unavailable, polling instead", exc_info=True)
+            await self._poll(db)
+
+
+settings_registry = SettingsRegistry()
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from money import to_paisa
+from services.deposit_approval_service import MAX_BATCH_SIZE, STAMP_TAKEN, approve_deposits_batch, unclaimed_filter
+from services.time_service import PK_TZ
+
+CHUNK_SIZE = 64 * 1024
+# Unmatched lines listed in the report; the rest are only counted
+MAX_REPORT_LINES = 1000
+
+# Header aliases, compared lower-cased with spaces/underscores/dashes removed
+COLUMN_ALIASES = {
+    "number": ("msisdn", "sendermsisdn", "sender", "sendernumber", "mobile", "mobilenumber", "from", "account", "jazzcashnumber"),
+    "amount": ("amount", "credit", "creditamount", "amountpkr", "transactionamount"),
+    "time": ("datetime", "timestamp", "transactiondate", "transactiontime", "date", "time"),
+    "reference": ("tid", "transactionid", "txnid", "reference", "referenceno", "referencenumber"),
+    "status": ("status", "transactionstatus"),
+}
+SUCCESS_STATUSES = {"success", "successful", "completed", "complete"}
+
+TIME_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d-%m-%Y %H:%M:%S",
+    "%d-%m-%Y %H:%M",
+    "%d-%b-%Y %H:%M:%S",
+    "%d-%b-%Y %I:%M:%S %p",
+    "%d %b %Y %H:%M:%S",
+)
+
+
+def normalize_number(raw: str) -> Optional[str]:
+    """JazzCash mobile number as 03XXXXXXXXX; accepts +92/0092/92 prefixes and separators."""
+    digits = re.sub(r"\D", "", raw or "")
+    if digits.startswith("0092"):
+        digits = digits[4:]
+    elif digits.startswith("92") and len(digits) == 12:
+        digits = digits[2:]
+    if len(digits) == 10 and digits.startswith("3"):
+        digits = "0" + digits
+    return digits if len(digits) == 11 and digits.startswith("03") else None
+
+
+def parse_amount(raw: str) -> Optional[int]:
+    """Statement amount ("Rs. 1,500.00") in paisa; None unless positive."""
+    cleaned = re.sub(r"(?i)rs\.?|pkr|,|\s", "", raw or "")
+    try:
+        amount = to_paisa(float(cleaned))
+    except ValueError:
+        return None
+    return amount if amount > 0 else None
+
+
+def parse_time(raw: str) -> Optional[datetime]:
+    """Statement timestamp as aware UTC; times without an offset are Pakistan time."""
+    raw = (raw or "").strip()
+    try:
+        dt = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        dt = None
+        for fmt in TIME_FORMATS:
+            try:
+                dt = datetime.strptime(raw, fmt)
+                break
+            except ValueError:
+                continue
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=PK_TZ)
+    return dt.astimezone(timezone.utc)
+
+
+def _columns(header: List[str]) -> Dict[str, int]:
+    """Column index per field from the header row; ValueError if a required column is missing."""
+    keys = [re.sub(r"[\s_\-]", "", h.strip().lower()) for h in header]
+    found: Dict[str, int] = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in keys:
+                found[field] = keys.index(alias)
+                break
+    # The reference is what stops a payment in an overlapping or re-uploaded statement
+    # from settling a second deposit, so it is required like the matching fields
+    missing = [f for f in ("number", "amount", "time", "reference") if f not in found]
+    if missing:
+        raise ValueError(f"Statement header is missing column(s): {', '.join(missing)}")
+    return found
+
+
+async def iter_chunks(file, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Byte chunks of an uploaded file (anything with an async read(size))."""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def stream_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, List[str]]]:
+    """(line number, fields) of every CSV record, decoded incrementally from byte chunks.
+
+    Only one chunk and the record being assembled are held in memory. A quoted field
+    may span lines; the record is emitted once its quotes balance.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    record: List[str] = []
+    quotes = 0
+    line_no = 0
+    start = 0
+
+    def flush() -> Optional[Tuple[int, List[str]]]:
+        nonlocal record, quotes
+        text, record, quotes = "\n".join(record), [], 0
+        if not text.strip():
+            return None
+        return start, next(csv.reader([text]))
+
+    final = False
+    while not final:
+        try:
+            chunk = await chunks.__anext__()
+            pending += decoder.decode(chunk)
+        except StopAsyncIteration:
+            pending += decoder.decode(b"", final=True)
+            final = True
+        *lines, pending = re.split(r"\r?\n", pending)
+        if final and pending:
+            lines.append(pending)
+        for line in lines:
+            line_no += 1
+            if not record:
+                start = line_no
+            record.append(line)
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                item = flush()
+                if item:
+                    yield item
+    if record:
+        # Unterminated quote at end of file: hand the csv module what there is
+        item = flush()
+        if item:
+            yield item
+
+
+class PendingDepositIndex:
+    """Hash index of pending deposits keyed by (number, amount, time bucket).
+
+    Buckets are `window` wide, so every deposit within `window` of a payment sits in
+    the payment's bucket or one of its two neighbours: a lookup probes three keys.
+    Each deposit can be matched once.
+    """
+
+    def __init__(self, window: timedelta) -> None:
+        self.window = window
+        self._width = max(1, int(window.total_seconds()))
+        self._buckets: Dict[Tuple[str, int, int], List[Dict[str, Any]]] = {}
+        self._taken: set[str] = set()
+        self.size = 0
+
+    def _bucket(self, at: datetime) -> int:
+        return int(at.timestamp()) // self._width
+
+    def add(self, deposit: Dict[str, Any]) -> None:
+        number = normalize_number(deposit.get("jazzcash_number", ""))
+        if number is None:
+            return
+        key = (number, int(deposit["amount"]), self._bucket(deposit["created_at"]))
+        self._buckets.setdefault(key, []).append(deposit)
+        self.size += 1
+
+    def take(self, number: str, amount: int, at: datetime) -> Optional[Dict[str, Any]]:
+        """The untaken deposit closest in time to a payment, within the window; marks it taken."""
+        bucket = self._bucket(at)
+        best: Optional[Dict[str, Any]] = None
+        best_gap: Optional[float] = None
+        for b in (bucket - 1, bucket, bucket + 1):
+            for deposit in self._buckets.get((number, amount, b), ()):
+                if deposit["id"] in self._taken:
+                    continue
+                gap = abs((deposit["created_at"] - at).total_seconds())
+                if gap <= self.window.total_seconds() and (best_gap is None or gap < best_gap):
+                    best, best_gap = deposit, gap
+        if best is not None:
+            self._taken.add(best["id"])
+        return best
+
+
+async def build_pending_index(db, window: timedelta) -> PendingDepositIndex:
+    index = PendingDepositIndex(window)
+    cursor = db.deposits.find(
+        {"status": "pending", **unclaimed_filter()},
+        {"_id": 0, "id": 1, "user_id": 1, "amount": 1, "jazzcash_number": 1, "created_at": 1},
+    )
+    async for deposit in cursor:
+        index.add(deposit)
+    return index
+
+
+async def match_statement(
+    db,
+    chunks: AsyncIterator[bytes],
+    admin_id: str,
+    window: timedelta,
+    approve: bool = True,
+) -> Dict[str, Any]:
+    """Match a JazzCash statement CSV against pending deposits and approve the matches.
+
+    One pass over the file: every line is looked up in a PendingDepositIndex built
+    beforehand, so the job is linear in lines plus deposits. Matches are approved through
+    approve_deposits_batch() in chunks of MAX_BATCH_SIZE and stamped with the statement
+    reference in the same update that claims them, before any credit; the unique index on
+    statement_ref keeps a re-uploaded or overlapping statement, even one running at the
+    same time, from paying out twice. Lines without a reference are reported,
+    never matched. Raises ValueError when the file has no usable header.
+    """
+    index = await build_pending_index(db, window)
+
+    columns: Optional[Dict[str, int]] = None
+    lines = 0
+    unmatched_count = 0
+    unmatched: List[Dict[str, Any]] = []
+    matches: List[Dict[str, Any]] = []
+    seen_refs: set[str] = set()
+
+    def miss(line_no: int, reason: str, fields: List[str]) -> None:
+        nonlocal unmatched_count
+        unmatched_count += 1
+        if len(unmatched) < MAX_REPORT_LINES:
+            unmatched.append({"line": line_no, "reason": reason, "fields": fields})
+
+    async for line_no, fields in stream_records(chunks):
+        if columns is None:
+            columns = _columns(fields)
+            continue
+        lines += 1
+
+        def col(name: str) -> str:
+            i = columns.get(name)
+            return fields[i].strip() if i is not None and i < len(fields) else ""
+
+        if "status" in columns and col("status").lower() not in SUCCESS_STATUSES:
+            miss(line_no, "not_successful", fields)
+            continue
+        number, amount, at = normalize_number(col("number")), parse_amount(col("amount")), parse_time(col("time"))
+        if number is None or amount is None or at is None:
+            miss(line_no, "unparseable", fields)
+            continue
+        reference = col("reference")
+        if not reference:
+            miss(line_no, "missing_reference", fields)
+            continue
+        if reference in seen_refs:
+            miss(line_no, "duplicate_reference", fields)
+            continue
+        seen_refs.add(reference)
+
+        deposit = index.take(number, amount, at)
+        if deposit is None:
+            miss(line_no, "no_pending_deposit", fields)
+            continue
+        matches.append({"line": line_no, "reference": reference, "deposit_id": deposit["id"], "paid_at": at})
+
+    if columns is None:
+        raise ValueError("Statement is empty")
+
+    # References already settled by an earlier upload. Only a cheap early report: the unique
+    # statement_ref index is what stops a concurrent upload settling the same payment twice
+    refs = [m["reference"] for m in matches]
+    used: set[str] = set()
+    for i in range(0, len(refs), MAX_BATCH_SIZE):
+        docs = await db.deposits.find(
+            {"statement_ref": {"$in": refs[i:i + MAX_BATCH_SIZE]}}, {"_id": 0, "statement_ref": 1}
+        ).to_list(None)
+        used.update(d["statement_ref"] for d in docs)
+    if used:
+        for m in matches:
+            if m["reference"] in used:
+                miss(m["line"], "reference_already_used", [m["reference"]])
+        matches = [m for m in matches if m["reference"] not in used]
+
+    results: List[Dict[str, Any]] = []
+    refused = 0
+    if approve:
+        by_deposit = {m["deposit_id"]: m for m in matches}
+        for i in range(0, len(matches), MAX_BATCH_SIZE):
+            chunk = [m["deposit_id"] for m in matches[i:i + MAX_BATCH_SIZE]]
+            # The reference is stamped by the very update that claims the deposit, before crediting
+            stamps = {
+                d: {"statement_ref": by_deposit[d]["reference"], "statement_paid_at": by_deposit[d]["paid_at"]}
+                for d in chunk
+            }
+            batch = await approve_deposits_batch(db, chunk, admin_id, stamps)
+            for r in batch:
+                m = by_deposit[r["deposit_id"]]
+                if r.get("detail") == STAMP_TAKEN:
+                    miss(m["line"], "reference_already_used", [m["reference"]])
+                    refused += 1
+                    continue
+                results.append({"line": m["line"], **r})
+    else:
+        results = [{**m, "status": "matched"} for m in matches]
+
+    return {
+        "lines": lines,
+        "pending_indexed": index.size,
+        "matched": len(matches) - refused,
+        "approved": sum(1 for r in results if r["status"] == "approved"),
+        "unmatched": unmatched_count,
+        "unmatched_lines": sorted(unmatched, key=lambda u: u["line"]),
+        "results": results,
+    }
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from money import to_rupees
+
+logger = logging.getLogger(__name__)
+
+CACHE_SECONDS = float(os.getenv("DASHBOARD_CACHE_SECONDS", "15"))
+
+# daily_stats: one document per UTC day ("2025-01-31") holding deposits_/withdrawals_/bets_
+# amount (paisa) and count, plus a "meta" document recording when counting began
+META_ID = "meta"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _day(at: datetime) -> Tuple[str, datetime]:
+    start = at.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.date().isoformat(), start
+
+
+async def start_counting(db) -> None:
+    """Record when counters began (first deploy wins); days starting after it are fully counted."""
+    await db.daily_stats.update_one({"_id": META_ID}, {"$setOnInsert": {"since": _now()}}, upsert=True)
+
+
+async def record_daily(db, at: datetime, inc: Dict[str, int]) -> None:
+    """Add to the counters of `at`'s UTC day. Never raises: a lost increment must not fail the caller."""
+    inc = {k: int(v) for k, v in inc.items() if v}
+    if not inc:
+        return
+    day, _ = _day(at)
+    try:
+        await db.daily_stats.update_one(
+            {"_id": day}, {"$inc": inc, "$set": {"updated_at": _now()}}, upsert=True
+        )
+    except Exception:
+        logger.exception("Daily stats update failed for %s", day)
+
+
+async def record_bets(db, bets: Iterable[Dict[str, Any]]) -> None:
+    """Count settled bets on the day each was placed."""
+    by_day: Dict[str, Dict[str, Any]] = {}
+    for bet in bets:
+        day, _ = _day(bet["created_at"])
+        entry = by_day.setdefault(day, {"at": bet["created_at"], "bets_amount": 0, "bets_count": 0})
+        entry["bets_amount"] += int(bet["bet_amount"])
+        entry["bets_count"] += 1
+    for entry in by_day.values():
+        await record_daily(db, entry.pop("at"), entry)
+
+
+async def _counted_day(db, start: datetime) -> Optional[Dict[str, Any]]:
+    """Counters of the day starting at `start`, or None if counting began after that day started."""
+    day, _ = _day(start)
+    docs = await db.daily_stats.find({"_id": {"$in": [META_ID, day]}}).to_list(2)
+    by_id = {d["_id"]: d for d in docs}
+    meta = by_id.get(META_ID)
+    if not meta or meta["since"] > start:
+        return None
+    return by_id.get(day, {})
+
+
+async def _status_facet(collection, start: datetime, end: datetime, with_today: bool) -> Dict[str, int]:
+    """Pending count, plus today's approved total when the counters cannot supply it: one pipeline."""
+    branches = [{"status": "pending"}]
+    facets: Dict[str, Any] = {"pending": [{"$match": {"status": "pending"}}, {"$count": "n"}]}
+    if with_today:
+        today = {"status": "approved", "approved_at": {"$gte": start, "$lt": end}}
+        branches.append(today)
+        facets["today"] = [
+            {"$match": today},
+            {"$group": {"_id": None, "amount": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+        ]
+    result = await collection.aggregate([{"$match": {"$or": branches}}, {"$facet": facets}]).to_list(1)
+    row = result[0] if result else {}
+    pending = row.get("pending") or [{}]
+    today_row = (row.get("today") or [{}])[0]
+    return {
+        "pending": int(pending[0].get("n", 0)),
+        "amount": int(today_row.get("amount", 0)),
+        "count": int(today_row.get("count", 0)),
+    }
+
+
+async def _user_counts(db) -> Dict[str, int]:
+    result = await db.users.aggregate(
+        [
+            {"$match": {"$or": [{"role": "user"}, {"kyc_status": "pending"}]}},
+            {
+                "$facet": {
+                    "total": [{"$match": {"role": "user"}}, {"$count": "n"}],
+                    "active": [{"$match": {"role": "user", "is_active": True}}, {"$count": "n"}],
+                    "kyc": [{"$match": {"kyc_status": "pending"}}, {"$count": "n"}],
+                }
+            },
+        ]
+    ).to_list(1)
+    row = result[0] if result else {}
+    return {k: int((row.get(k) or [{}])[0].get("n", 0)) for k in ("total", "active", "kyc")}
+
+
+async def _bets_between(db, start: datetime, end: datetime) -> Dict[str, int]:
+    result = await db.bets.aggregate(
+        [
+            {"$match": {"created_at": {"$gte": start, "$lt": end}}},
+            {"$group": {"_id": None, "amount": {"$sum": "$bet_amount"}, "count": {"$sum": 1}}},
+        ]
+    ).to_list(1)
+    row = result[0] if result else {}
+    return {"amount": int(row.get("amount", 0)), "count": int(row.get("count", 0))}
+
+
+async def compute_dashboard(db) -> Dict[str, Any]:
+    """Dashboard figures: user/pending counts by one $facet per collection, today's totals from daily_stats.
+
+    Today's totals fall back to ranged aggregations only on a day the counters did not
+    see from its start (the day they were deployed).
+    """
+    _, today_start = _day(_now())
+    today_end = today_start + timedelta(days=1)
+    counted = await _counted_day(db, today_start)
+
+    users, deposits, withdrawals, bets = await asyncio.gather(
+        _user_counts(db),
+        _status_facet(db.deposits, today_start, today_end, counted is None),
+        _status_facet(db.withdrawals, today_start, today_end, counted is None),
+        _bets_between(db, today_start, today_end) if counted is None else asyncio.sleep(0, None),
+    )
+    if counted is not None:
+        today_deposits = int(counted.get("deposits_amount", 0))
+        today_withdrawals = int(counted.get("withdrawals_amount", 0))
+        today_bets = int(counted.get("bets_amount", 0))
+        today_bets_count = int(counted.get("bets_count", 0))
+    else:
+        today_deposits, today_withdrawals = deposits["amount"], withdrawals["amount"]
+        today_bets, today_bets_count = bets["amount"], bets["count"]
+
+    # Calculate winning ratio
+    winning_ratio = (today_withdrawals / today_deposits * 100) if today_deposits > 0 else 0.0
+
+    return {
+        "users": {
+            "total": users["total"],
+            "active": users["active"],
+        },
+        "pending_approvals": {
+            "deposits": deposits["pending"],
+            "withdrawals": withdrawals["pending"],
+            "kyc": users["kyc"],
+        },
+        "today": {
+            "deposits": to_rupees(today_deposits),
+            "withdrawals": to_rupees(today_withdrawals),
+            "winning_ratio": round(winning_ratio, 2),
+            "total_bets": to_rupees(today_bets),
+            "bets_count": today_bets_count,
+        },
+        "source": "counters" if counted is not None else "aggregation",
+        "as_of": _now(),
+    }
+
+
+class DashboardCache:
+    """TTL cache of compute_dashboard() with single-flight refresh.
+
+    However many admin tabs poll, a worker computes the dashboard at most once per
+    CACHE_SECONDS; callers arriving during a refresh wait for that refresh instead of
+    starting their own.
+    """
+
+    def __init__(self, ttl_seconds: float = CACHE_SECONDS) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._value: Optional[Dict[str, Any]] = None
+        self._expires = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.refreshes = 0
+        self.joined = 0
+
+    async def get(self, db) -> Dict[str, Any]:
+        if self._value is not None and time.monotonic() < self._expires:
+            self.hits += 1
+            return self._value
+        if self._inflight is None:
+            # A task of its own, so a caller that disconnects does not cancel it for the others
+            self._inflight = asyncio.ensure_future(self._refresh(db))
+        else:
+            self.joined += 1
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self, db) -> Dict[str, Any]:
+        try:
+            value = await compute_dashboard(db)
+            self._value = value
+            self._expires = time.monotonic() + self.ttl_seconds
+            self.refreshes += 1
+            return value
+        finally:
+            self._inflight = None
+
+    def invalidate(self) -> None:
+        self._expires = 0.0
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "joined": self.joined,
+            "age_seconds": round(self.ttl_seconds - (self._expires - time.monotonic()), 3) if self._value else None,
+        }
+
+
+dashboard_cache = DashboardCache()
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from services.settings_service import settings_registry
+
+# memory: per-process buckets; mongo: buckets shared across workers
+BACKEND = os.getenv("THROTTLE_BACKEND", os.getenv("RATE_COUNTER_BACKEND", "memory"))
+
+SWEEP_EVERY = 1000  # checks between sweeps of full (idle) in-memory buckets
+
+# Reverse proxies in front of the app that each append the address they received from to
+# X-Forwarded-For; 0 means clients connect directly and the header is ignored
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+
+@dataclass(frozen=True)
+class BucketRule:
+    capacity: float  # burst size
+    refill_per_second: float
+
+    @classmethod
+    def per_minute(cls, rate: float) -> "BucketRule":
+        """One minute's worth of requests as burst, refilled evenly."""
+        rate = max(float(rate), 1.0)
+        return cls(capacity=rate, refill_per_second=rate / 60.0)
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by route, dimension (ip/email) and value."""
+
+    def __init__(self, backend: Optional[str] = None):
+        self.backend = backend or BACKEND
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}  # key -> (tokens, updated, full_at)
+        self._checks = 0
+        self.allowed: Dict[str, int] = {}
+        self.rejected: Dict[str, int] = {}
+
+    async def take(self, db, route: str, dimension: str, value: str, rule: BucketRule, now: Optional[float] = None) -> bool:
+        """Consume one token; returns False when the bucket is empty."""
+        now = time.time() if now is None else now
+        key = f"{route}:{dimension}:{value}"
+        if self.backend == "mongo":
+            ok = await self._take_mongo(db, key, rule, now)
+        else:
+            ok = self._take_memory(key, rule, now)
+
+        counter = f"{route}:{dimension}"
+        stats = self.allowed if ok else self.rejected
+        stats[counter] = stats.get(counter, 0) + 1
+        return ok
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "buckets": len(self._buckets),
+            "allowed": dict(self.allowed),
+            "rejected": dict(self.rejected),
+        }
+
+    # -------------------------
+    # In-memory backend
+    # -------------------------
+
+    def _take_memory(self, key: str, rule: BucketRule, now: float) -> bool:
+        tokens, updated, _ = self._buckets.get(key, (rule.capacity, now, now))
+        tokens = min(rule.capacity, tokens + (now - updated) * rule.refill_per_second)
+        ok = tokens >= 1
+        if ok:
+            tokens -= 1
+        full_at = now + (rule.capacity - tokens) / rule.refill_per_second
+        self._buckets[key] = (tokens, now, full_at)
+
+        self._checks += 1
+        if self._checks % SWEEP_EVERY == 0:
+            self._sweep(now)
+        return ok
+
+    def _sweep(self, now: float) -> None:
+        # A bucket that has refilled completely carries no state
+        for key, (_, _, full_at) in list(self._buckets.items()):
+            if full_at <= now:
+                del self._buckets[key]
+
+    # -------------------------
+    # Shared (Mongo) backend
+    # -------------------------
+
+    async def _take_mongo(self, db, key: str, rule: BucketRule, now: float) -> bool:
+        # Refill and take in one pipeline update so concurrent workers cannot both spend the last token
+        refilled = {
+            "$min": [
+                rule.capacity,
+                {
+                    "$add": [
+                        {"$ifNull": ["$tokens", rule.capacity]},
+                        {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, rule.refill_per_second]},
+                    ]
+                },
+            ]
+        }
+        idle = rule.capacity / rule.refill_per_second
+        doc = await db.throttle_buckets.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated": now}},
+                {
+                    "$set": {
+                        "ok": {"$gte": ["$tokens", 1]},
+                        "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=idle),
+                    }
+                },
+            ],
+            projection={"ok": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return bool(doc and doc.get("ok"))
+
+
+auth_throttle = TokenBucketLimiter()
+
+
+async def check_auth_throttle(db, route: str, ip: str, email: str) -> bool:
+    """Take a token from the route's IP and email buckets (settings auth_<route>_{ip,email}_per_minute)."""
+    settings = await settings_registry.snapshot(db)
+    if not settings["auth_throttle_enabled"]:
+        return True
+    if not await auth_throttle.take(db, route, "ip", ip, BucketRule.per_minute(settings[f"auth_{route}_ip_per_minute"])):
+        return False
+    return await auth_throttle.take(
+        db, route, "email", email.strip().lower(), BucketRule.per_minute(settings[f"auth_{route}_email_per_minute"])
+    )
+
+
+def client_ip(headers: Dict[str, str], peer: Optional[str], trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """The address the outermost trusted proxy saw, else the socket peer.
+
+    Hops left of the ones our proxies appended come from the client and can be forged,
+    so X-Forwarded-For is read from the right: with N trusted proxies the client is the
+    N-th entry from the end.
+    """
+    if trusted_hops > 0:
+        hops = [h.strip() for h in headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if hops:
+            return hops[-min(trusted_hops, len(hops))]
+    return peer or "unknown"
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import Bet, Deposit, Transaction, Withdrawal
+from services.pagination_service import MAX_PAGE_SIZE, PAGE_SORT, after_position, decode_cursor, encode_cursor
+
+HISTORY_DAYS = 90
+
+# kind -> (collection, model used to render the document)
+SOURCES: Dict[str, Tuple[str, Any]] = {
+    "bet": ("bets", Bet),
+    "deposit": ("deposits", Deposit),
+    "transaction": ("transactions", Transaction),
+    "withdrawal": ("withdrawals", Withdrawal),
+}
+
+
+class _Head:
+    """Current front document of one source; orders newest-first on (created_at, kind, id)."""
+
+    __slots__ = ("doc", "kind", "cursor", "key")
+
+    def __init__(self, doc: Dict[str, Any], kind: str, cursor) -> None:
+        self.doc = doc
+        self.kind = kind
+        self.cursor = cursor
+        self.key = (doc["created_at"], kind, doc["id"])
+
+    def __lt__(self, other: "_Head") -> bool:
+        # heapq pops the smallest; reversing the comparison makes it pop the newest
+        return self.key > other.key
+
+
+def _source_filter(kind: str, position: Optional[Tuple[Any, str, str]]) -> Optional[Dict[str, Any]]:
+    # The merged order is (created_at, kind, id) descending, so relative to the cursor
+    # a source that sorts below the cursor's kind may still return documents at the same
+    # instant, one above it may not, and the cursor's own source resumes after its id.
+    if position is None:
+        return None
+    created_at, last_id, last_kind = position
+    if kind < last_kind:
+        return {"created_at": {"$lte": created_at}}
+    if kind > last_kind:
+        return {"created_at": {"$lt": created_at}}
+    return after_position(created_at, last_id)
+
+
+async def _next(cursor) -> Optional[Dict[str, Any]]:
+    try:
+        return await cursor.next()
+    except StopAsyncIteration:
+        return None
+
+
+def parse_timeline_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, str, str]]:
+    """(created_at, id, kind) of a timeline cursor; ValueError if it is malformed."""
+    if not cursor:
+        return None
+    created_at, last_id, last_kind = decode_cursor(cursor)
+    if last_kind not in SOURCES:
+        raise ValueError("Invalid cursor")
+    return created_at, last_id, last_kind
+
+
+async def timeline_page(
+    db, user_id: str, limit: int, position: Optional[Tuple[Any, str, str]] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of a user's bets, deposits, transactions and withdrawals, newest first.
+
+    A k-way heap merge over one cursor per source: each source is read lazily in small
+    batches, so a page pulls roughly `limit / len(SOURCES)` documents from each source
+    unless one of them dominates the page. One cursor token covers all four streams;
+    `position` is that token parsed by parse_timeline_cursor().
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    since = datetime.now(timezone.utc) - timedelta(days=HISTORY_DAYS)
+    batch = max(8, math.ceil((limit + 1) / len(SOURCES)) + 1)
+
+    cursors = []
+    for kind, (collection, _) in SOURCES.items():
+        query: Dict[str, Any] = {"user_id": user_id, "created_at": {"$gte": since}}
+        after = _source_filter(kind, position)
+        if after:
+            query = {"$and": [query, after]}
+        cursors.append((kind, db[collection].find(query, {"_id": 0}).sort(PAGE_SORT).limit(limit + 1).batch_size(batch)))
+
+    # First batches of all sources in parallel; later batches only for sources the page drains
+    firsts = await asyncio.gather(*(_next(c) for _, c in cursors))
+    heads = [_Head(doc, kind, c) for (kind, c), doc in zip(cursors, firsts) if doc is not None]
+    heapq.heapify(heads)
+
+    items: List[Dict[str, Any]] = []
+    last: Optional[_Head] = None
+    while heads:
+        if len(items) == limit:
+            # Another document exists beyond this page
+            return items, encode_cursor(last.doc, source=last.kind)
+        head = heads[0]
+        model = SOURCES[head.kind][1]
+        items.append({"kind": head.kind, **model(**head.doc).model_dump(mode="json")})
+        last = head
+        nxt = await _next(head.cursor)
+        if nxt is None:
+            heapq.heappop(heads)
+        else:
+            heapq.heapreplace(heads, _Head(nxt, head.kind, head.cursor))
+    return items, None
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from services.write_behind_service import journal
+
+logger = logging.getLogger(__name__)
+
+TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "2"))
+MAX_ENTRIES = int(os.getenv("USER_CACHE_SIZE", "50000"))
+# mongo: invalidations are published to cache_invalidations and polled by every worker; off: single worker
+BUS = os.getenv("USER_CACHE_BUS", "mongo")
+BUS_POLL_SECONDS = float(os.getenv("USER_CACHE_BUS_POLL_SECONDS", "0.5"))
+BUS_OVERLAP_SECONDS = 5.0  # re-read window covering clock skew and late inserts between workers
+BUS_RETENTION = timedelta(minutes=10)
+
+WORKER_ID = uuid.uuid4().hex
+
+# Everything the gate checks, balance and profile endpoints read
+USER_STATE_PROJECTION = {"_id": 0, "password_hash": 0, "search": 0, "applied_refs": 0}
+
+
+class UserStateCache:
+    """Per-process cache of user documents for gate checks and read-mostly endpoints.
+
+    Entries expire after TTL_SECONDS. Balance writes refresh the local entry from the
+    write's result; every other user write evicts it. Both are published on the
+    invalidation bus so other workers evict their copy.
+    """
+
+    def __init__(self, ttl_seconds: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._loading: Dict[str, object] = {}
+        self._seen: Dict[Any, float] = {}
+        self._since = time.time()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+
+    async def get(self, db, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user's document (without password hash), or None if the user does not exist."""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return dict(entry[0])
+
+        self.misses += 1
+        token = object()
+        self._loading[user_id] = token
+        doc = await db.users.find_one({"id": user_id}, USER_STATE_PROJECTION)
+        # Only cache the read if no invalidation arrived while it was in flight
+        if self._loading.get(user_id) is token:
+            del self._loading[user_id]
+            if doc:
+                self._store(user_id, doc)
+        return dict(doc) if doc else None
+
+    def apply_balances(self, db, user_id: str, balances: Dict[str, Any]) -> None:
+        """Fold the result of an atomic balance write into the local entry and notify other workers."""
+        self._loading.pop(user_id, None)
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry[0].update({k: v for k, v in balances.items() if k != "_id"})
+        self._publish(db, [user_id])
+
+    def invalidate(self, db, *user_ids: str) -> None:
+        """Evict users here and on every other worker."""
+        for user_id in user_ids:
+            self._evict(user_id)
+        self.invalidations += len(user_ids)
+        self._publish(db, list(user_ids))
+
+    def _store(self, user_id: str, doc: Dict[str, Any]) -> None:
+        self._entries[user_id] = (dict(doc), time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict(self, user_id: str) -> None:
+        self._entries.pop(user_id, None)
+        self._loading.pop(user_id, None)
+
+    # -------------------------
+    # Invalidation bus
+    # -------------------------
+
+    def _publish(self, db, user_ids) -> None:
+        if BUS != "mongo" or not user_ids:
+            return
+        at = time.time()
+        expires_at = datetime.now(timezone.utc) + BUS_RETENTION
+        journal.write_nowait(
+            db,
+            "cache_invalidations",
+            [{"user_id": uid, "worker": WORKER_ID, "at": at, "expires_at": expires_at} for uid in user_ids],
+        )
+
+    @property
+    def listening(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db) -> None:
+        if BUS != "mongo" or self.listening:
+            return
+        self._since = time.time()
+        self._task = asyncio.create_task(self._poll(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _poll(self, db) -> None:
+        while True:
+            await asyncio.sleep(BUS_POLL_SECONDS)
+            try:
+                await self._drain(db)
+            except Exception:
+                logger.exception("User cache invalidation poll failed")
+
+    async def _drain(self, db) -> None:
+        cursor = db.cache_invalidations.find(
+            {"at": {"$gt": self._since - BUS_OVERLAP_SECONDS}, "worker": {"$ne": WORKER_ID}},
+            {"user_id": 1, "at": 1},
+        )
+        async for doc in cursor:
+            if doc["_id"] in self._seen:
+                continue
+            self._seen[doc["_id"]] = doc["at"]
+            self._since = max(self._since, doc["at"])
+            self._evict(doc["user_id"])
+            self.remote_invalidations += 1
+
+        cutoff = self._since - BUS_OVERLAP_SECONDS
+        for key, at in list(self._seen.items()):
+            if at <= cutoff:
+                del self._seen[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "remote_invalidations": self.remote_invalidations,
+            "bus": BUS,
+            "listening": self.listening,
+        }
+
+
+user_state_cache = UserStateCache()
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+# Users carry a `search` sub-document built by search_fields(): the normalized values
+# of the searchable fields plus `tokens`, an array indexed by a multikey index on
+# (search.tokens, created_at). Tokens of a value v:
+#   "=v"        exact value
+#   "^p"        prefixes of v (and of each word of the name) up to PREFIX_MAX chars
+#   "abc"       every trigram of v
+# The normalized text never contains "=" or "^", so the three kinds cannot collide.
+SEARCH_VERSION = 2  # 2: non-Latin letters (e.g. Urdu names) are kept
+PREFIX_MAX = 6
+NGRAM = 3
+MAX_RESULTS = 100
+
+SEARCH_FIELDS = ("email", "name", "phone", "referral_code")
+
+_SPACES = re.compile(r"\s+")
+_NOT_TEXT = re.compile(r"[^\w@.+\- ]")
+_PHONE_QUERY = re.compile(r"[\d\s+\-()]+")
+
+
+def normalize_text(raw: Optional[str]) -> str:
+    """Case-folded, accent-free, single-spaced text; letters of any script are kept, other punctuation is dropped."""
+    text = unicodedata.normalize("NFKD", raw or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return _SPACES.sub(" ", _NOT_TEXT.sub("", text)).strip()
+
+
+def normalize_phone(raw: Optional[str]) -> str:
+    """Digits only, with a +92/0092 country prefix folded to the local leading 0."""
+    digits = re.sub(r"\D", "", raw or "")
+    if digits.startswith("0092"):
+        digits = "0" + digits[4:]
+    elif digits.startswith("92") and len(digits) == 12:
+        digits = "0" + digits[2:]
+    return digits
+
+
+def normalize_query(raw: str) -> str:
+    """Search box input in the form the fields are stored in; phone-looking input becomes digits."""
+    raw = (raw or "").strip()
+    if _PHONE_QUERY.fullmatch(raw) and re.search(r"\d", raw):
+        return normalize_phone(raw)
+    return normalize_text(raw)
+
+
+def _ngrams(value: str) -> List[str]:
+    return [value[i:i + NGRAM] for i in range(len(value) - NGRAM + 1)]
+
+
+def _prefixes(value: str) -> List[str]:
+    return ["^" + value[:k] for k in range(1, min(len(value), PREFIX_MAX) + 1)]
+
+
+def search_fields(user: Dict[str, Any]) -> Dict[str, Any]:
+    """{"search": {...}} for a user document, ready to $set or merge into an insert."""
+    values = {
+        "email": normalize_text(user.get("email")),
+        "name": normalize_text(user.get("full_name")),
+        "phone": normalize_phone(user.get("phone")),
+        "referral_code": normalize_text(user.get("referral_code")),
+    }
+    tokens: Dict[str, None] = {}
+    for field, value in values.items():
+        if not value:
+            continue
+        parts = [value] + (value.split(" ")[1:] if field == "name" else [])
+        tokens["=" + value] = None
+        for part in parts:
+            tokens.update(dict.fromkeys(_prefixes(part)))
+        tokens.update(dict.fromkeys(_ngrams(value)))
+    return {"search": {"v": SEARCH_VERSION, **values, "tokens": list(tokens)}}
+
+
+def _rank(user: Dict[str, Any], q: str) -> Optional[int]:
+    """0 exact, 1 prefix, 2 substring match on any search field; None when nothing matches."""
+    values = [v for v in (user.get("search", {}).get(f) for f in SEARCH_FIELDS) if v]
+    if q in values:
+        return 0
+    words = [w for v in values for w in v.split(" ")]
+    if any(v.startswith(q) for v in values + words):
+        return 1
+    if any(q in v for v in values):
+        return 2
+    return None
+
+
+def _tiers(q: str) -> List[Dict[str, Any]]:
+    """Token filter per rank, best first; each is served by the search.tokens index."""
+    tiers: List[Dict[str, Any]] = [{"search.tokens": "=" + q}]
+    if len(q) <= PREFIX_MAX:
+        tiers.append({"search.tokens": "^" + q})
+    else:
+        tiers.append({"search.tokens": {"$all": ["^" + q[:PREFIX_MAX]] + _ngrams(q)}})
+    if len(q) >= NGRAM:
+        tiers.append({"search.tokens": {"$all": _ngrams(q)}})
+    return tiers
+
+
+async def search_users(
+    db,
+    raw_query: str,
+    limit: int = 50,
+    base_filter: Optional[Dict[str, Any]] = None,
+    projection: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Users matching `raw_query`: exact matches first, then prefix, then substring; newest first within a rank.
+
+    Each rank is one indexed query on search.tokens sorted by created_at, and later
+    ranks run only while the result is short, so the cost follows `limit` rather than
+    the size of the collection. Trigram candidates are re-checked against the stored
+    values, since containing every trigram of the query does not imply containing it.
+    Queries shorter than a trigram match exact values and prefixes only. `projection`
+    must be an exclusion projection.
+    """
+    q = normalize_query(raw_query)
+    limit = max(1, min(limit, MAX_RESULTS))
+    if not q:
+        return []
+    # The stored values are needed for ranking; the tokens never leave the database
+    projection = {**(projection or {"_id": 0, "password_hash": 0}), "search.tokens": 0}
+
+    results: List[Dict[str, Any]] = []
+    seen: List[str] = []
+    for rank, tier in enumerate(_tiers(q)):
+        need = limit - len(results)
+        if need <= 0:
+            break
+        query = {**(base_filter or {}), **tier}
+        if seen:
+            query["id"] = {"$nin": seen}
+        # Trigram tiers can yield a few false positives; over-fetch slightly to cover them
+        fetch = need if rank == 0 else need + 10
+        docs = await db.users.find(query, projection).sort("created_at", -1).limit(fetch).to_list(fetch)
+        for doc in docs:
+            if len(results) >= limit:
+                break
+            if _rank(doc, q) != rank:
+                continue
+            seen.append(doc["id"])
+            results.append(doc)
+
+    for doc in results:
+        doc.pop("search", None)
+    return results
@@ -1,90 +1,308 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import Any, Dict, Optional, List
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, List, Tuple
+import logging
 import uuid
 
+from pymongo import UpdateOne
 
-def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+from money import rupees_fields, scale
+from services.write_behind_service import journal
+
+logger = logging.getLogger(__name__)
+
+MONEY_FIELDS = ("principal_amount", "target_amount", "wagered_amount")
+
+# Maintained on the user document so status reads never touch the wagering collection
+SUMMARY_FIELD = "wagering_summary"
+# Record writes whose summary refresh has not landed yet: [{"token", "at"}] on the user
+PENDING_FIELD = "wagering_pending"
+# A pending entry this old belongs to a write that died; the next status read repairs the summary
+STALE_PENDING = timedelta(seconds=60)
+REFRESH_ATTEMPTS = 5
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
 
 
 def new_wagering_record(
     user_id: str,
     source: str,  # bonus|deposit|referral|rebate
     source_id: str,
-    principal_amount: float,
+    principal_amount: int,
     multiplier: float,
     priority: int,
 ) -> Dict[str, Any]:
-    target = round(float(principal_amount) * float(multiplier), 2)
+    target = scale(int(principal_amount), multiplier)
     return {
         "id": str(uuid.uuid4()),
         "user_id": user_id,
         "source": source,
         "source_id": source_id,
         "multiplier": float(multiplier),
-        "principal_amount": float(principal_amount),
+        "principal_amount": int(principal_amount),
         "target_amount": target,
-        "wagered_amount": 0.0,
+        "wagered_amount": 0,
         "status": "active",  # active|completed
         "priority": int(priority),  # lower is higher priority
-        "created_at": _now_iso(),
-        "updated_at": _now_iso(),
+        "version": 0,  # replaced by a fresh token on every progress update; guards concurrent allocation
+        "created_at": _now(),
+        "updated_at": _now(),
         "completed_at": None,
     }
 
 
 async def get_active_wagering(db, user_id: str) -> List[Dict[str, Any]]:
-    return await db.wagering.find({"user_id": user_id, "status": "active"}, {"_id": 0}).sort("priority", 1).to_list(200)
+    return await db.wagering.find({"user_id": user_id, "status": "active"}, {"_id": 0}).sort("priority", 1).to_list(None)
+
+
+def _summarize(active: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Stored summary of a user's active records (amounts in paisa); `active` sorted by priority."""
+    total_target = sum(int(r.get("target_amount", 0)) for r in active)
+    total_wagered = sum(int(r.get("wagered_amount", 0)) for r in active)
+    return {
+        "active_count": len(active),
+        "total_target": total_target,
+        "total_wagered": total_wagered,
+        "remaining": max(0, total_target - total_wagered),
+        "next_id": active[0]["id"] if active else None,
+        "next_priority": int(active[0]["priority"]) if active else None,
+    }
 
 
-async def wagering_status(db, user_id: str) -> Dict[str, Any]:
-    active = await get_active_wagering(db, user_id)
-    total_target = sum(float(r.get("target_amount", 0)) for r in active)
-    total_wagered = sum(float(r.get("wagered_amount", 0)) for r in active)
-    remaining = max(0.0, round(total_target - total_wagered, 2))
+EMPTY_SUMMARY = _summarize([])
 
+
+def _status(summary: Dict[str, Any], pending: bool = False) -> Dict[str, Any]:
+    """Status from a stored summary; while record writes are `pending` nothing can be withdrawn."""
+    remaining = int(summary.get("remaining", 0))
     return {
-        "has_active_wagering": len(active) > 0,
-        "total_target": round(total_target, 2),
-        "total_wagered": round(total_wagered, 2),
+        "has_active_wagering": int(summary.get("active_count", 0)) > 0,
+        "active_count": int(summary.get("active_count", 0)),
+        "total_target": int(summary.get("total_target", 0)),
+        "total_wagered": int(summary.get("total_wagered", 0)),
         "remaining": remaining,
-        "records": active,
-        "can_withdraw": remaining <= 0.0,
+        "next_record_id": summary.get("next_id"),
+        "can_withdraw": remaining <= 0 and not pending,
     }
 
 
-async def apply_wagering_progress(db, user_id: str, bet_amount: float) -> Dict[str, Any]:
-    """Apply bet amount to active wagering records (bonus first by priority)."""
-    remaining_bet = float(bet_amount)
-    if remaining_bet <= 0:
-        return await wagering_status(db, user_id)
+def wagering_status_rupees(status: Dict[str, Any]) -> Dict[str, Any]:
+    """API view of a wagering status: amounts in rupees."""
+    out = rupees_fields(status, ("total_target", "total_wagered", "remaining"))
+    if "records" in status:
+        out["records"] = [rupees_fields(r, MONEY_FIELDS) for r in status["records"]]
+    return out
 
-    active = await get_active_wagering(db, user_id)
 
-    for r in active:
-        if remaining_bet <= 0:
+async def _mark_pending(db, user_ids: List[str]) -> str:
+    """Flag the users' summaries as behind before their records change; returns the flag's token."""
+    token = uuid.uuid4().hex
+    await db.users.update_many(
+        {"id": {"$in": user_ids}}, {"$push": {PENDING_FIELD: {"token": token, "at": _now()}}}
+    )
+    return token
+
+
+async def _refresh_summaries(db, user_ids: List[str], pull: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+    """Recompute users' summaries from their active records; returns the summaries written.
+
+    Each summary carries a `rev` token. The rev is read before the records and the write
+    is guarded on it, so a refresh that read older records than one which landed in the
+    meantime loses and goes again. The write also $pulls `pull` from the pending flags.
+    """
+    summaries: Dict[str, Dict[str, Any]] = {}
+    left = list(user_ids)
+    for _ in range(REFRESH_ATTEMPTS):
+        if not left:
             break
+        revs = {
+            u["id"]: (u.get(SUMMARY_FIELD) or {}).get("rev")
+            async for u in db.users.find({"id": {"$in": left}}, {"_id": 0, "id": 1, f"{SUMMARY_FIELD}.rev": 1})
+        }
+        if not revs:
+            break
+        active_by_user: Dict[str, List[Dict[str, Any]]] = {uid: [] for uid in revs}
+        async for r in db.wagering.find(
+            {"user_id": {"$in": list(revs)}, "status": "active"}, {"_id": 0}
+        ).sort([("user_id", 1), ("priority", 1)]):
+            active_by_user[r["user_id"]].append(r)
+
+        written = {uid: {**_summarize(active), "rev": uuid.uuid4().hex} for uid, active in active_by_user.items()}
+        ops = []
+        for uid, summary in written.items():
+            update: Dict[str, Any] = {"$set": {SUMMARY_FIELD: summary}}
+            if pull:
+                update["$pull"] = {PENDING_FIELD: pull}
+            ops.append(UpdateOne({"id": uid, f"{SUMMARY_FIELD}.rev": revs[uid]}, update))
+        result = await db.users.bulk_write(ops, ordered=False)
+
+        landed = set(written)
+        if result.matched_count < len(ops):
+            landed = {
+                u["id"]
+                async for u in db.users.find(
+                    {"id": {"$in": list(written)}, f"{SUMMARY_FIELD}.rev": {"$in": [w["rev"] for w in written.values()]}},
+                    {"_id": 0, "id": 1},
+                )
+            }
+        for uid in landed:
+            summaries[uid] = written[uid]
+        left = [uid for uid in written if uid not in landed]
+    if left:
+        # Their pending flags stay, so the next status read repairs them
+        logger.warning("Wagering summary refresh gave up after %d attempts for %d users", REFRESH_ATTEMPTS, len(left))
+    return summaries
+
+
+async def rebuild_wagering_summary(db, user_id: str) -> Dict[str, Any]:
+    """Recompute users.wagering_summary from the records (users created before it existed, or repair)."""
+    summaries = await _refresh_summaries(db, [user_id], pull={"at": {"$lt": _now() - STALE_PENDING}})
+    if user_id in summaries:
+        return summaries[user_id]
+    return _summarize(await get_active_wagering(db, user_id))
+
+
+async def wagering_status(db, user_id: str, include_records: bool = False) -> Dict[str, Any]:
+    """Wagering status from the summary on the user document; the records are read only on request.
 
-        target = float(r.get("target_amount", 0.0))
-        wagered = float(r.get("wagered_amount", 0.0))
-        remaining_target = max(0.0, target - wagered)
-        if remaining_target <= 0:
+    A missing summary, or one left behind by a record write that never refreshed it, is rebuilt.
+    """
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, SUMMARY_FIELD: 1, PENDING_FIELD: 1})
+    summary = (user or {}).get(SUMMARY_FIELD)
+    pending = (user or {}).get(PENDING_FIELD) or []
+    stale_before = _now() - STALE_PENDING
+    if user and (summary is None or any(p["at"] < stale_before for p in pending)):
+        summary = await rebuild_wagering_summary(db, user_id)
+        pending = [p for p in pending if p["at"] >= stale_before]
+    status = _status(summary or EMPTY_SUMMARY, pending=bool(pending))
+    if include_records:
+        status["records"] = await get_active_wagering(db, user_id)
+    return status
+
+
+async def add_wagering_records(db, user_id: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Persist new active records and refresh the user's summary from them."""
+    if not records:
+        return _status(EMPTY_SUMMARY)
+    token = await _mark_pending(db, [user_id])
+    await journal.write(db, "wagering", records)
+    summaries = await _refresh_summaries(db, [user_id], pull={"token": token})
+    if user_id in summaries:
+        return _status(summaries[user_id])
+    return await wagering_status(db, user_id)
+
+
+async def add_wagering_records_many(db, records: List[Dict[str, Any]]) -> None:
+    """add_wagering_records() for records of many users: one insert and one summary refresh."""
+    if not records:
+        return
+    user_ids = list({r["user_id"] for r in records})
+    token = await _mark_pending(db, user_ids)
+    await journal.write(db, "wagering", records)
+    await _refresh_summaries(db, user_ids, pull={"token": token})
+
+
+def _allocate(active: List[Dict[str, Any]], amount: int, now: datetime) -> Tuple[List[Tuple[Dict[str, Any], Dict[str, Any], int]], int]:
+    """Spread `amount` over `active` (priority order) in memory.
+
+    Returns (record, $set fields, amount added) for each record touched, and the amount used.
+    """
+    touched = []
+    left = amount
+    for r in active:
+        if left <= 0:
+            break
+        target = int(r.get("target_amount", 0))
+        wagered = int(r.get("wagered_amount", 0))
+        add = min(left, max(0, target - wagered))
+        if add <= 0:
             continue
+        fields: Dict[str, Any] = {"wagered_amount": wagered + add, "updated_at": now}
+        if wagered + add >= target:
+            fields["status"] = "completed"
+            fields["completed_at"] = now
+        touched.append((r, fields, add))
+        left -= add
+    return touched, amount - left
 
-        add = min(remaining_bet, remaining_target)
-        new_wagered = round(wagered + add, 2)
-        new_status = "completed" if new_wagered >= target else "active"
-        update: Dict[str, Any] = {
-            "wagered_amount": new_wagered,
-            "status": new_status,
-            "updated_at": _now_iso(),
-        }
-        if new_status == "completed":
-            update["completed_at"] = _now_iso()
 
-        await db.wagering.update_one({"id": r["id"]}, {"$set": update})
-        remaining_bet -= add
+async def apply_wagering_progress_many(
+    db, allocations: Iterable[Tuple[str, int]], max_attempts: int = 3
+) -> Dict[str, Dict[str, Any]]:
+    """Apply (user_id, bet amount) pairs to active wagering records; returns each user's status.
 
+    Per attempt: one read of the users' active records and one bulk_write of record
+    updates, each guarded on the record's version; allocations whose records changed
+    underneath are retried from fresh state for the amount not yet applied. The
+    summaries are then refreshed from the records once for all users.
+    """
+    pending: Dict[str, int] = {}
+    for user_id, amount in allocations:
+        if int(amount) > 0:
+            pending[user_id] = pending.get(user_id, 0) + int(amount)
+    if not pending:
+        return {}
+
+    user_ids = list(pending)
+    token = await _mark_pending(db, user_ids)
+
+    for _ in range(max_attempts):
+        if not pending:
+            break
+        active_by_user: Dict[str, List[Dict[str, Any]]] = {uid: [] for uid in pending}
+        async for r in db.wagering.find(
+            {"user_id": {"$in": list(pending)}, "status": "active"}, {"_id": 0}
+        ).sort([("user_id", 1), ("priority", 1)]):
+            active_by_user[r["user_id"]].append(r)
+
+        now = _now()
+        plans = {uid: _allocate(active_by_user[uid], amount, now) for uid, amount in pending.items()}
+        ops = []
+        written: Dict[str, str] = {}
+        for uid, (touched, _) in plans.items():
+            for r, fields, _ in touched:
+                # A unique token, not a counter: whether our write landed is then unambiguous
+                written[r["id"]] = uuid.uuid4().hex
+                ops.append(
+                    UpdateOne(
+                        {"id": r["id"], "status": "active", "version": r.get("version")},
+                        {"$set": {**fields, "version": written[r["id"]]}},
+                    )
+                )
+        if not ops:
+            pending = {}  # nobody has anything left to wager against
+            break
+
+        result = await db.wagering.bulk_write(ops, ordered=False)
+        landed = None
+        if result.matched_count < len(ops):
+            # Find which guarded updates lost a race: their record does not carry our token
+            landed = {
+                d["id"]
+                async for d in db.wagering.find({"id": {"$in": list(written)}}, {"_id": 0, "id": 1, "version": 1})
+                if d.get("version") == written[d["id"]]
+            }
+
+        next_pending: Dict[str, int] = {}
+        for uid, (touched, _) in plans.items():
+            applied = [t for t in touched if landed is None or t[0]["id"] in landed]
+            left = pending[uid] - sum(add for _, _, add in applied)
+            if len(applied) < len(touched) and left > 0:
+                next_pending[uid] = left
+        pending = next_pending
+    if pending:
+        logger.warning("Wagering progress gave up after %d attempts for %d users", max_attempts, len(pending))
+
+    summaries = await _refresh_summaries(db, user_ids, pull={"token": token})
+    return {uid: _status(summary) for uid, summary in summaries.items()}
+
+
+async def apply_wagering_progress(db, user_id: str, bet_amount: int) -> Dict[str, Any]:
+    """Apply bet amount to active wagering records (bonus first by priority)."""
+    statuses = await apply_wagering_progress_many(db, [(user_id, bet_amount)])
+    if user_id in statuses:
+        return statuses[user_id]
     return await wagering_status(db, user_id)
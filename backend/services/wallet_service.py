@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from services.ledger_service import LEDGER_FIELDS, append_entries, append_entry
+from services.user_cache_service import user_state_cache
+
+BALANCE_FIELDS = ("wallet_balance", "locked_balance", "bonus_balance")
+
+BALANCE_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "wallet_balance": 1,
+    "locked_balance": 1,
+    "bonus_balance": 1,
+    "total_deposits": 1,
+    "total_withdrawals": 1,
+    "total_bets": 1,
+    "total_wins": 1,
+    "ledger_seq": 1,
+}
+
+# Accounts that may move money: not suspended and not frozen
+ACTIVE_GUARD: Dict[str, Any] = {"is_active": {"$ne": False}, "is_frozen": {"$ne": True}}
+
+# Keys of recent balance writes that must apply at most once (a deposit or withdrawal
+# being settled, the changes of a batch). A keyed write pushes its key in the same
+# update and its filter excludes users already holding it; the newest APPLIED_KEEP stay.
+APPLIED_FIELD = "applied_refs"
+APPLIED_KEEP = 100
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def apply_balance_change(
+    db,
+    user_id: str,
+    inc: Dict[str, int],
+    require: Optional[Dict[str, int]] = None,
+    require_active: bool = False,
+    extra_set: Optional[Dict[str, Any]] = None,
+    match: Optional[Dict[str, Any]] = None,
+    kind: str = "adjustment",
+    ref_id: Optional[str] = None,
+    once: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Atomically $inc balances/totals (paisa) on one user in a single round trip.
+
+    `require` maps a balance field to the minimum it must hold before the change
+    (e.g. {"wallet_balance": amount} for a debit); `match` adds further conditions.
+    With `once`, the write applies only if no earlier write carried the same key, so
+    retrying it is safe; was_applied() tells whether it landed.
+    Returns the user's balances after the write, or None when the user is missing
+    or a guard did not hold. Balance changes are recorded in the ledger as `kind`.
+    """
+    query: Dict[str, Any] = {"id": user_id, **(match or {})}
+    for field, minimum in (require or {}).items():
+        query[field] = {"$gte": int(minimum)}
+    if require_active:
+        query.update(ACTIVE_GUARD)
+    if once:
+        query[APPLIED_FIELD] = {"$ne": once}
+
+    update: Dict[str, Any] = {
+        "$inc": {k: int(v) for k, v in inc.items() if v},
+        "$set": {"updated_at": _now(), **(extra_set or {})},
+    }
+    ledgered = any(update["$inc"].get(f) for f in LEDGER_FIELDS)
+    if ledgered:
+        update["$inc"]["ledger_seq"] = 1
+    if not update["$inc"]:
+        del update["$inc"]
+    if once:
+        update["$push"] = _push_applied([once])
+
+    balances = await db.users.find_one_and_update(
+        query,
+        update,
+        projection={**BALANCE_PROJECTION, **{k: 1 for k in (extra_set or {})}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if balances:
+        user_state_cache.apply_balances(db, user_id, balances)
+        if ledgered:
+            await append_entry(db, user_id, balances["ledger_seq"], kind, update["$inc"], balances, ref_id)
+    return balances
+
+
+def _push_applied(keys: List[str]) -> Dict[str, Any]:
+    return {APPLIED_FIELD: {"$each": keys, "$slice": -APPLIED_KEEP}}
+
+
+async def was_applied(db, user_id: str, key: str) -> bool:
+    """Whether a balance write keyed `key` (see apply_balance_change's `once`) has landed on the user."""
+    return await db.users.find_one({"id": user_id, APPLIED_FIELD: key}, {"_id": 1}) is not None
+
+
+async def apply_balance_changes_many(
+    db,
+    changes: List[Tuple[str, Dict[str, int], str, Optional[str]]],
+) -> List[Tuple[str, Optional[str], str]]:
+    """Unguarded apply_balance_change() for many (user_id, inc, kind, ref_id) changes at once.
+
+    Balances are read once and each user's changes are planned in memory, every one
+    getting its own ledger entry with the running post-image and the next seq. The plan
+    is committed with a single users.bulk_write, one update per user guarded on
+    ledger_seq, as approve_deposits_batch() does. Each change has a key of its own,
+    pushed with the user's update: whether an update landed is read from the keys, and
+    users whose balances moved in between fall back to apply_balance_change() one change
+    at a time under the same keys, so nothing can be applied twice. Returns the changes
+    that could not be applied, as (user_id, ref_id, error), for the caller to reconcile.
+    """
+    by_user: Dict[str, List[Tuple[str, Dict[str, int], str, Optional[str]]]] = {}
+    for change in changes:
+        by_user.setdefault(change[0], []).append(change)
+    if not by_user:
+        return []
+
+    users = {u["id"]: u for u in await db.users.find({"id": {"$in": list(by_user)}}, BALANCE_PROJECTION).to_list(None)}
+    token = uuid.uuid4().hex
+    now = _now()
+    failed: List[Tuple[str, Optional[str], str]] = []
+    plans: Dict[str, Tuple[UpdateOne, List[Tuple[str, int, str, Dict[str, int], Dict[str, Any], Optional[str]]]]] = {}
+    keys: Dict[str, List[str]] = {
+        user_id: [f"{token}:{user_id}:{n}" for n in range(len(user_changes))] for user_id, user_changes in by_user.items()
+    }
+
+    for user_id, user_changes in by_user.items():
+        user = users.get(user_id)
+        if user is None:
+            failed.extend((user_id, ref_id, "User not found") for _, _, _, ref_id in user_changes)
+            continue
+        balances = {f: int(user.get(f) or 0) for f in LEDGER_FIELDS}
+        seq = int(user.get("ledger_seq") or 0)
+        total: Dict[str, int] = {}
+        ledger = []
+        for _, inc, kind, ref_id in user_changes:
+            inc = {k: int(v) for k, v in inc.items() if v}
+            for field, amount in inc.items():
+                total[field] = total.get(field, 0) + amount
+            if any(inc.get(f) for f in LEDGER_FIELDS):
+                for f in LEDGER_FIELDS:
+                    balances[f] += inc.get(f, 0)
+                seq += 1
+                ledger.append((user_id, seq, kind, inc, dict(balances), ref_id))
+        if ledger:
+            total["ledger_seq"] = len(ledger)
+        update: Dict[str, Any] = {"$set": {"updated_at": now}, "$push": _push_applied(keys[user_id])}
+        if total:
+            update["$inc"] = total
+        # Every ledgered write bumps ledger_seq, so a match means the plan's balances are current
+        plans[user_id] = (UpdateOne({"id": user_id, "ledger_seq": user.get("ledger_seq")}, update), ledger)
+
+    landed: List[str] = []
+    if plans:
+        try:
+            result = await db.users.bulk_write([op for op, _ in plans.values()], ordered=False)
+            complete = result.matched_count == len(plans)
+        except BulkWriteError:
+            complete = False
+        if complete:
+            landed = list(plans)
+        else:
+            marked = await db.users.find(
+                {"id": {"$in": list(plans)}, APPLIED_FIELD: {"$in": [k for u in plans for k in keys[u]]}},
+                {"_id": 0, "id": 1},
+            ).to_list(None)
+            landed = [u["id"] for u in marked]
+    if landed:
+        user_state_cache.invalidate(db, *landed)
+        await append_entries(db, [entry for user_id in landed for entry in plans[user_id][1]])
+
+    # Lost the ledger_seq race (or the write failed): one guarded write per change
+    landed_set = set(landed)
+    for user_id in plans:
+        if user_id in landed_set:
+            continue
+        for (_, inc, kind, ref_id), key in zip(by_user[user_id], keys[user_id]):
+            try:
+                applied = await apply_balance_change(db, user_id, inc, kind=kind, ref_id=ref_id, once=key)
+            except Exception as e:
+                failed.append((user_id, ref_id, str(e)))
+                continue
+            if not applied and not await was_applied(db, user_id, key):
+                failed.append((user_id, ref_id, "User not found"))
+    return failed
+
+
+async def debit_bet(db, user_id: str, amount: int, ref_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Take a stake from the wallet and count it in total_bets."""
+    return await apply_balance_change(
+        db,
+        user_id,
+        {"wallet_balance": -amount, "total_bets": amount},
+        require={"wallet_balance": amount},
+        require_active=True,
+        kind="bet",
+        ref_id=ref_id,
+    )
+
+
+async def credit_win(db, user_id: str, amount: int, ref_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Credit a payout and count it in total_wins."""
+    return await apply_balance_change(
+        db, user_id, {"wallet_balance": amount, "total_wins": amount}, kind="win", ref_id=ref_id
+    )
+
+
+async def refund_bet(
+    db, user_id: str, amount: int, ref_id: Optional[str] = None, once: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Return a stake that never played and take it back out of total_bets."""
+    return await apply_balance_change(
+        db, user_id, {"wallet_balance": amount, "total_bets": -amount}, kind="bet_refund", ref_id=ref_id, once=once
+    )
+
+
+async def lock_funds(db, user_id: str, amount: int, ref_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Move funds wallet_balance -> locked_balance (pending withdrawal)."""
+    return await apply_balance_change(
+        db,
+        user_id,
+        {"wallet_balance": -amount, "locked_balance": amount},
+        require={"wallet_balance": amount},
+        require_active=True,
+        kind="withdrawal_lock",
+        ref_id=ref_id,
+    )
+
+
+async def unlock_funds(db, user_id: str, amount: int) -> Optional[Dict[str, Any]]:
+    """Move funds locked_balance -> wallet_balance."""
+    return await apply_balance_change(
+        db,
+        user_id,
+        {"locked_balance": -amount, "wallet_balance": amount},
+        require={"locked_balance": amount},
+        kind="unlock",
+    )
+
+
+async def release_locked(
+    db, user_id: str, amount: int, ref_id: Optional[str] = None, once: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Pay out locked funds of an approved withdrawal."""
+    return await apply_balance_change(
+        db,
+        user_id,
+        {"locked_balance": -amount, "total_withdrawals": amount},
+        require={"locked_balance": amount},
+        kind="withdrawal_payout",
+        ref_id=ref_id,
+        once=once,
+    )
+
+
+async def credit_deposit(
+    db,
+    user_id: str,
+    amount: int,
+    bonus_amount: int = 0,
+    extra_set: Optional[Dict[str, Any]] = None,
+    ref_id: Optional[str] = None,
+    once: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Credit an approved deposit (and its bonus) to the single wallet."""
+    return await apply_balance_change(
+        db,
+        user_id,
+        {
+            "wallet_balance": amount + bonus_amount,
+            "total_deposits": amount,
+            "bonus_balance": bonus_amount,
+        },
+        extra_set=extra_set,
+        kind="deposit",
+        ref_id=ref_id,
+        once=once,
+    )
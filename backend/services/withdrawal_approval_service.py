@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from services.approval_queue_service import approval_queues, lease_free_filter
+from services.wallet_service import release_locked, was_applied
+
+logger = logging.getLogger(__name__)
+
+# An approval holds a withdrawal in "processing" for this long; past it the withdrawal
+# is settled by recover_lapsed_withdrawals() (crashed worker)
+PROCESSING_SECONDS = int(os.getenv("WITHDRAWAL_PROCESSING_SECONDS", "300"))
+PROCESSING_FIELDS = ("processing_by", "processing_at", "processing_token", "processing_expires_at")
+# Lapsed approvals settled per recover_lapsed_withdrawals() call
+RECOVER_BATCH = 500
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def payout_key(withdrawal_id: str) -> str:
+    """Idempotency key of a withdrawal's payout (see apply_balance_change's `once`)."""
+    return f"withdrawal:{withdrawal_id}"
+
+
+def _unset_processing() -> Dict[str, str]:
+    return {f: "" for f in PROCESSING_FIELDS}
+
+
+async def claim_withdrawal(db, withdrawal_id: str, admin_id: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Take a pending withdrawal to "processing" for approval: (withdrawal, token), None if not available.
+
+    Only one admin can win this update, and not while another admin holds the withdrawal's
+    queue lease; the claim lapses after PROCESSING_SECONDS.
+    """
+    now = _now()
+    token = uuid.uuid4().hex
+    withdrawal = await db.withdrawals.find_one_and_update(
+        {"id": withdrawal_id, "status": "pending", **lease_free_filter(admin_id, now)},
+        {
+            "$set": {
+                "status": "processing",
+                "processing_by": admin_id,
+                "processing_at": now,
+                "processing_token": token,
+                "processing_expires_at": now + timedelta(seconds=PROCESSING_SECONDS),
+            }
+        },
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    return withdrawal, token
+
+
+async def release_withdrawal_claim(db, withdrawal_id: str, token: str) -> None:
+    """Hand a claimed withdrawal back to the queue untouched."""
+    await db.withdrawals.update_one(
+        {"id": withdrawal_id, "status": "processing", "processing_token": token},
+        {"$set": {"status": "pending"}, "$unset": _unset_processing()},
+    )
+
+
+async def pay_withdrawal(db, withdrawal: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Pay out the withdrawal's locked funds once; balances after, or None if it could not be paid.
+
+    Keyed on the withdrawal, so a payout that already landed is never taken again.
+    """
+    return await release_locked(
+        db, withdrawal["user_id"], int(withdrawal["amount"]), ref_id=withdrawal["id"], once=payout_key(withdrawal["id"])
+    )
+
+
+async def mark_withdrawal_approved(db, withdrawal_id: str, token: str, admin_id: str) -> bool:
+    """Approve a withdrawal still processing under claim `token`."""
+    result = await db.withdrawals.update_one(
+        {"id": withdrawal_id, "status": "processing", "processing_token": token},
+        {
+            "$set": {"status": "approved", "approved_at": _now(), "approved_by": admin_id},
+            "$unset": _unset_processing(),
+        },
+    )
+    return result.modified_count == 1
+
+
+async def recover_lapsed_withdrawals(db) -> Dict[str, int]:
+    """Settle withdrawals left in "processing" by an approval that died.
+
+    One whose payout landed (its payout_key() is on the user) is marked approved and
+    flagged `recovered_at` for reconciliation, since its transaction record is missing;
+    any other goes back to pending. Approvals from before the claim expiry existed lapse
+    PROCESSING_SECONDS after processing_at.
+    """
+    now = _now()
+    lapsed = await db.withdrawals.find(
+        {
+            "status": "processing",
+            "$or": [
+                {"processing_expires_at": {"$lt": now}},
+                {
+                    "processing_expires_at": {"$exists": False},
+                    "processing_at": {"$lt": now - timedelta(seconds=PROCESSING_SECONDS)},
+                },
+            ],
+        },
+        {"_id": 0, "id": 1, "user_id": 1, "processing_by": 1, "processing_token": 1},
+    ).to_list(RECOVER_BATCH)
+
+    approved: List[str] = []
+    returned: List[str] = []
+    for withdrawal in lapsed:
+        # Guarded on the claim as read, so a sweep on another worker cannot act on it too
+        guard = {"id": withdrawal["id"], "status": "processing", "processing_token": withdrawal.get("processing_token")}
+        if await was_applied(db, withdrawal["user_id"], payout_key(withdrawal["id"])):
+            result = await db.withdrawals.update_one(
+                guard,
+                {
+                    "$set": {
+                        "status": "approved",
+                        "approved_at": now,
+                        "approved_by": withdrawal.get("processing_by"),
+                        "recovered_at": now,
+                    },
+                    "$unset": _unset_processing(),
+                },
+            )
+            if result.modified_count:
+                approved.append(withdrawal["id"])
+                logger.error(
+                    "Withdrawal %s was paid out by an approval that died; approved it, check its records",
+                    withdrawal["id"],
+                )
+        else:
+            result = await db.withdrawals.update_one(guard, {"$set": {"status": "pending"}, "$unset": _unset_processing()})
+            if result.modified_count:
+                returned.append(withdrawal["id"])
+    if approved or returned:
+        await approval_queues.notify(db, "withdrawals", approved + returned)
+    return {"approved": len(approved), "returned": len(returned)}
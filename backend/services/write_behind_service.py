@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", "5"))
+MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+
+_Entry = Tuple[Dict[str, Any], Optional[asyncio.Future]]
+
+
+class WriteBehindJournal:
+    """Buffers inserts per collection and flushes them with insert_many(ordered=False).
+
+    A flush happens every FLUSH_INTERVAL_MS or as soon as a collection buffers MAX_BATCH documents.
+    Durable writes wait for their flush; fire-and-forget writes are only logged on failure.
+    """
+
+    def __init__(self, flush_interval_ms: float = FLUSH_INTERVAL_MS, max_batch: int = MAX_BATCH):
+        self._db = None
+        self._interval = flush_interval_ms / 1000.0
+        self._max_batch = max_batch
+        self._buffers: Dict[str, List[_Entry]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.documents_written = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, db) -> None:
+        if self.running:
+            return
+        self._db = db
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def write(self, db, collection: str, docs: List[Dict[str, Any]]) -> None:
+        """Durable mode: returns once the documents are written; raises if any of them failed."""
+        if not docs:
+            return
+        if not self.running:
+            await db[collection].insert_many(docs, ordered=False)
+            return
+
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in docs]
+        self._enqueue(collection, list(zip(docs, futures)))
+        await asyncio.gather(*futures)
+
+    def write_nowait(self, db, collection: str, docs: List[Dict[str, Any]]) -> None:
+        """Fire-and-forget mode for non-financial records (audit/security events)."""
+        if not docs:
+            return
+        if not self.running:
+            asyncio.get_running_loop().create_task(self._insert_logged(db, collection, docs))
+            return
+        self._enqueue(collection, [(d, None) for d in docs])
+
+    def pending(self) -> int:
+        return sum(len(b) for b in self._buffers.values())
+
+    def _enqueue(self, collection: str, entries: List[_Entry]) -> None:
+        buf = self._buffers.setdefault(collection, [])
+        buf.extend(entries)
+        if len(buf) >= self._max_batch:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+    async def flush(self) -> None:
+        if not self._buffers or self._db is None:
+            return
+        buffers, self._buffers = self._buffers, {}
+        await asyncio.gather(*(self._flush_collection(name, entries) for name, entries in buffers.items()))
+
+    async def _flush_collection(self, collection: str, entries: List[_Entry]) -> None:
+        for i in range(0, len(entries), self._max_batch):
+            batch = entries[i:i + self._max_batch]
+            failed: Dict[int, Exception] = {}
+            try:
+                await self._db[collection].insert_many([d for d, _ in batch], ordered=False)
+            except BulkWriteError as e:
+                for err in e.details.get("writeErrors", []):
+                    failed[err["index"]] = RuntimeError(err.get("errmsg", "write failed"))
+            except Exception as e:
+                failed = {idx: e for idx in range(len(batch))}
+
+            self.flushes += 1
+            self.documents_written += len(batch) - len(failed)
+            for idx, (_, fut) in enumerate(batch):
+                if idx in failed:
+                    if fut is None:
+                        logger.error("Write-behind insert into %s dropped: %s", collection, failed[idx])
+                    elif not fut.done():
+                        fut.set_exception(failed[idx])
+                elif fut is not None and not fut.done():
+                    fut.set_result(None)
+
+    async def _insert_logged(self, db, collection: str, docs: List[Dict[str, Any]]) -> None:
+        try:
+            await db[collection].insert_many(docs, ordered=False)
+        except Exception:
+            logger.exception("Write-behind insert into %s failed", collection)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "pending": self.pending(),
+            "flushes": self.flushes,
+            "documents_written": self.documents_written,
+        }
+
+
+journal = WriteBehindJournal()
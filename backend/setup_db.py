@@ -13,6 +13,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from models import User, UserRole, GameSettings, GameCategory
 from auth import get_password_hash
+from money import MONEY_MIGRATION_ID
 import uuid
 from datetime import datetime, timezone
 
@@ -20,10 +21,19 @@ load_dotenv(Path(__file__).parent / '.env')
 
 async def setup_database():
     mongo_url = os.environ['MONGO_URL']
-    client = AsyncIOMotorClient(mongo_url)
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True)
     db = client[os.environ['DB_NAME']]
     
     print("\n=== WinPKR Database Setup ===")
+
+    # A database with no users holds no legacy rupee amounts: record the money migration
+    # as done so the backend treats it as paisa from the start
+    if await db.users.estimated_document_count() == 0:
+        await db.migrations.update_one(
+            {"id": MONEY_MIGRATION_ID},
+            {"$setOnInsert": {"completed_at": datetime.now(timezone.utc), "fresh_database": True}},
+            upsert=True,
+        )
     
     # Create admin user
     print("\nCreating admin user...")
@@ -45,8 +55,6 @@ async def setup_database():
         
         admin_dict = admin_user.model_dump()
         admin_dict["password_hash"] = get_password_hash(admin_password)
-        admin_dict["created_at"] = admin_dict["created_at"].isoformat()
-        admin_dict["updated_at"] = admin_dict["updated_at"].isoformat()
         
         await db.users.insert_one(admin_dict)
         print(f"\n✓ Admin user created successfully!")
@@ -174,8 +182,6 @@ async def setup_database():
         if not existing_game:
             game = GameSettings(**game_data)
             game_dict = game.model_dump()
-            game_dict["created_at"] = game_dict["created_at"].isoformat()
-            game_dict["updated_at"] = game_dict["updated_at"].isoformat()
             await db.game_settings.insert_one(game_dict)
             games_created += 1
     
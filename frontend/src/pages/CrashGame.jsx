@@ -27,6 +27,17 @@ export default function CrashGame() {
     loadBalance();
   }, []);
 
+  // The bet call returns once the bet is in a round; its outcome appears in the round history
+  const waitForRound = async (roundId) => {
+    for (let i = 0; i < 120; i += 1) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      const res = await api.get("/games/crash/round");
+      const done = (res.data.history || []).find((r) => r.round_id === roundId);
+      if (done) return done;
+    }
+    return null;
+  };
+
   const placeBet = async () => {
     const a = Number(amount);
     if (!a || a <= 0) {
@@ -43,8 +54,22 @@ export default function CrashGame() {
         nonce: 1,
       };
       const res = await api.post("/games/crash/bet", payload);
-      setLastRound(res.data);
-      toast.success(res.data.status === "won" ? `You won PKR ${res.data.payout}` : "You lost this round");
+      const bet = res.data;
+      setBalance((b) => ({ ...b, ...bet.balances }));
+      const round = await waitForRound(bet.round_id);
+      if (!round) {
+        toast.error("Round result is delayed. Check your bet history shortly.");
+      } else if (round.status === "refunded") {
+        toast.error("The round was cancelled. Your stake has been refunded.");
+      } else {
+        const won = bet.cashout_multiplier <= round.crash_point;
+        const payout = won ? Math.round(bet.amount * 100 * bet.cashout_multiplier) / 100 : 0;
+        setLastRound({
+          ...round,
+          provably_fair: { ...bet.provably_fair, server_seed: round.server_seed },
+        });
+        toast.success(won ? `You won PKR ${payout}` : "You lost this round");
+      }
       await loadBalance();
     } catch (e) {
       toast.error(e?.response?.data?.detail || "Failed to place bet");
@@ -156,11 +181,11 @@ export default function CrashGame() {
                 className="w-full rounded-full bg-gradient-to-r from-gold via-gold-400 to-gold-600 text-black font-bold py-6 hover:brightness-110"
                 data-testid="crash-bet-btn"
               >
-                {placing ? "Placing…" : "Place Bet"}
+                {placing ? "Waiting for the round…" : "Place Bet"}
               </Button>
 
               <div className="text-xs text-white/45 text-center">
-                Bets are settled instantly in Phase 2. Full realtime mode comes later.
+                Bets join the current round and settle when it crashes.
               </div>
             </div>
           </div>
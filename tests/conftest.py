@@ -0,0 +1,53 @@
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+from mongomock.collection import Collection
+from mongomock_motor import AsyncMongoMockClient
+
+# Backend modules import each other from the backend directory, as the server does
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+
+@pytest.fixture(autouse=True)
+def find_and_modify_by_id(monkeypatch):
+    """mongomock re-reads find_one_and_update's document by the caller's filter rather than its
+    _id when the projection leaves _id out, so a filter the update itself falsifies (a guard
+    on the field being changed) returns None. Look the document up by _id first, as MongoDB does."""
+    original = Collection._find_and_modify
+
+    def by_id(self, query, projection=None, update=None, upsert=False, sort=None, *args, **kwargs):
+        found = self.find_one(query, {"_id": 1}, sort=sort)
+        if found:
+            query = {"_id": found["_id"]}
+        return original(self, query, projection, update, upsert, sort, *args, **kwargs)
+
+    monkeypatch.setattr(Collection, "_find_and_modify", by_id)
+
+
+@pytest.fixture
+def db():
+    """An empty in-memory Motor database."""
+    return AsyncMongoMockClient(tz_aware=True)[f"test_{uuid.uuid4().hex}"]
+
+
+@pytest.fixture
+def before_first(monkeypatch):
+    """before_first(collection, method, hook): run `hook` once just before the next `method`
+    call on `collection`, to play a concurrent writer."""
+
+    def install(collection, method, hook):
+        cls = type(collection)
+        original = getattr(cls, method)
+        fired = []
+
+        async def wrapper(self, *args, **kwargs):
+            if self.name == collection.name and not fired:
+                fired.append(True)
+                await hook()
+            return await original(self, *args, **kwargs)
+
+        monkeypatch.setattr(cls, method, wrapper)
+
+    return install
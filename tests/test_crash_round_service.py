@@ -0,0 +1,144 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from services import crash_round_service as crash
+from services import crash_seed_chain_service as chains
+from services.bet_limit_service import reserve_bet_amount
+from services.crash_round_service import LEASE_ID, CrashRoundEngine, PendingBet
+from services.crash_seed_chain_service import create_chain
+from services.settings_service import settings_registry
+from services.wallet_service import debit_bet
+
+LIMIT = 1_000_000
+
+
+@pytest.fixture
+def engine(db, monkeypatch):
+    """A round engine over a short seed chain with rounds that last a fraction of a second."""
+
+    async def snapshot(_db):
+        return {"crash_betting_window_seconds": 0.2, "crash_house_edge": 0.03}
+
+    monkeypatch.setattr(settings_registry, "snapshot", snapshot)
+    monkeypatch.setattr(crash, "flight_seconds", lambda crash_point: 0.01)
+    monkeypatch.setattr(crash, "COOLDOWN_SECONDS", 0.01)
+    monkeypatch.setattr(crash, "LEASE_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(chains, "PREBUILD_REMAINING", 0)
+    asyncio.run(db.users.insert_many([{"id": uid, "wallet_balance": 10_000, "ledger_seq": 0} for uid in ("u1", "u2")]))
+    asyncio.run(create_chain(db, length=50))
+    return CrashRoundEngine()
+
+
+async def until(predicate, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+async def bet(db, engine, user_id, amount, cashout):
+    """What the bet route does: reserve the stake under the limit, debit it, join the round."""
+    pb = PendingBet(user_id=user_id, amount=amount, cashout_multiplier=cashout, client_seed="c", balance_after_debit=0)
+    assert (await reserve_bet_amount(db, user_id, amount, LIMIT, at=pb.placed_at))["allowed"]
+    pb.balance_after_debit = (await debit_bet(db, user_id, amount, ref_id=pb.bet_id))["wallet_balance"]
+    return pb, engine.place(pb)
+
+
+def history(engine, round_id):
+    return next((h for h in engine.state()["history"] if h["round_id"] == round_id), None)
+
+
+def wallets(db):
+    users = asyncio.run(db.users.find({}, {"_id": 0}).sort("id", 1).to_list(None))
+    return [u["wallet_balance"] for u in users]
+
+
+def reserved(db):
+    counters = asyncio.run(db.bet_counters.find({}).to_list(None))
+    return sum(c.get("total", 0) for c in counters)
+
+
+def test_round_settles_every_bet_at_the_crash(db, engine):
+    async def run():
+        engine.start(db)
+        await until(engine.is_betting_open)
+        # Every crash point is at least 1.00 and at most MAX_CRASH_POINT
+        winner, rnd = await bet(db, engine, "u1", 1_000, 1.0)
+        loser, _ = await bet(db, engine, "u2", 1_000, crash.MAX_CRASH_POINT + 1)
+        await until(lambda: history(engine, rnd["round_id"]))
+        await engine.stop()
+        return winner, loser, rnd
+
+    winner, loser, rnd = asyncio.run(run())
+
+    assert history(engine, rnd["round_id"])["status"] == "settled"
+    assert wallets(db) == [10_000, 9_000]
+    bets = {b["id"]: b for b in asyncio.run(db.bets.find({}).to_list(None))}
+    assert (bets[winner.bet_id]["status"], bets[winner.bet_id]["payout"]) == ("won", 1_000)
+    assert (bets[loser.bet_id]["status"], bets[loser.bet_id]["payout"]) == ("lost", 0)
+    stored = asyncio.run(db.crash_rounds.find_one({"id": rnd["round_id"]}))
+    assert (stored["total_wagered"], stored["total_payout"]) == (2_000, 1_000)
+    wins = asyncio.run(db.ledger_entries.find({"kind": "win"}).to_list(None))
+    assert [(e["user_id"], e["ref_id"]) for e in wins] == [("u1", winner.bet_id)]
+
+
+def test_bets_are_refunded_when_the_engine_stops_before_the_crash(db, engine, monkeypatch):
+    monkeypatch.setattr(crash, "flight_seconds", lambda crash_point: 60)
+
+    async def run():
+        engine.start(db)
+        await until(engine.is_betting_open)
+        _, rnd = await bet(db, engine, "u1", 1_000, 2.0)
+        await until(lambda: engine.state()["current"]["state"] == crash.ROUND_FLYING)
+        await engine.stop()
+        await engine.stop()
+        return rnd
+
+    rnd = asyncio.run(run())
+
+    assert history(engine, rnd["round_id"])["status"] == "refunded"
+    assert wallets(db) == [10_000, 10_000]
+    assert reserved(db) == 0
+    assert asyncio.run(db.bets.count_documents({})) == 0
+    refunds = asyncio.run(db.ledger_entries.count_documents({"kind": "bet_refund"}))
+    assert refunds == 1
+
+
+def test_bets_are_refunded_when_settlement_fails_before_anything_is_recorded(db, engine, before_first):
+    async def fail():
+        raise RuntimeError("primary stepped down")
+
+    before_first(db.bets, "insert_many", fail)
+
+    async def run():
+        engine.start(db)
+        await until(engine.is_betting_open)
+        _, rnd = await bet(db, engine, "u1", 1_000, 1.0)
+        await until(lambda: history(engine, rnd["round_id"]))
+        await engine.stop()
+        return rnd
+
+    rnd = asyncio.run(run())
+
+    assert history(engine, rnd["round_id"])["status"] == "refunded"
+    assert wallets(db) == [10_000, 10_000]
+    assert reserved(db) == 0
+
+
+def test_bets_are_turned_away_while_another_worker_holds_the_rounds(db, engine):
+    async def run():
+        await db.crash_seed_state.insert_one(
+            {"_id": LEASE_ID, "holder": "other", "expires_at": crash._now() + timedelta(seconds=0.3)}
+        )
+        engine.start(db)
+        await asyncio.sleep(0.1)
+        turned_away = (engine.serving, engine.place(PendingBet("u1", 1_000, 2.0, "c", 9_000)))
+        # The other worker stops renewing: this one takes over
+        await until(engine.is_betting_open)
+        await engine.stop()
+        return turned_away
+
+    assert asyncio.run(run()) == (False, None)
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from services import crash_seed_chain_service as chains
+from services.crash_seed_chain_service import CrashSeedChain, create_chain, public_chain, verify_round
+
+LENGTH = 35
+CHUNK = 10
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(chains, "CHUNK_SIZE", CHUNK)
+    # No background standby build: these chains are tiny
+    monkeypatch.setattr(chains, "PREBUILD_REMAINING", 0)
+
+
+def sha256(b):
+    return hashlib.sha256(b).digest()
+
+
+def full_chain(db, chain_id):
+    """Every seed of the chain, by index, read from the stored chunks."""
+    chunks = asyncio.run(db.crash_seed_chunks.find({"chain_id": chain_id}).sort("chunk_index", 1).to_list(None))
+    data = b"".join(bytes(c["data"]) for c in chunks)
+    return [data[i:i + 32] for i in range(0, len(data), 32)]
+
+
+def stored_chain(db, chain_id):
+    return asyncio.run(db.crash_seed_chains.find_one({"id": chain_id}, {"_id": 0}))
+
+
+def derivable(values, steps):
+    """Everything anyone can compute from `values` by hashing forward."""
+    out = set()
+    for v in values:
+        for _ in range(steps):
+            out.add(v)
+            v = sha256(v)
+    return out
+
+
+def test_seeds_are_handed_out_from_the_end_of_the_chain(db):
+    chain = asyncio.run(create_chain(db, length=LENGTH))
+    seeds = full_chain(db, chain["id"])
+    source = CrashSeedChain()
+
+    played = [asyncio.run(source.next_seed(db)) for _ in range(CHUNK + 2)]
+
+    assert [p["chain_index"] for p in played] == list(range(LENGTH - 1, LENGTH - CHUNK - 3, -1))
+    assert [p["server_seed"] for p in played] == [seeds[p["chain_index"]].hex() for p in played]
+    # Each round's commitment is the seed revealed by the round before it
+    assert played[0]["server_seed_hash"] == chain["terminal_hash"]
+    for earlier, later in zip(played, played[1:]):
+        assert later["server_seed_hash"] == earlier["server_seed"]
+
+
+def test_published_data_never_leads_to_an_unplayed_seed(db):
+    chain = asyncio.run(create_chain(db, length=LENGTH))
+    seeds = full_chain(db, chain["id"])
+    source = CrashSeedChain()
+    revealed = []
+
+    # Check after every round, across chunk boundaries and down to the last seed
+    for _ in range(LENGTH):
+        stored = stored_chain(db, chain["id"])
+        public = public_chain(stored)
+        values = [bytes.fromhex(public["terminal_hash"])]
+        values += [bytes.fromhex(c["hash"]) for c in public["checkpoints"]]
+        values += [bytes.fromhex(s) for s in revealed]
+
+        unplayed = set(seeds[: int(stored["next_index"]) + 1])
+        assert not derivable(values, LENGTH) & unplayed, stored["next_index"]
+
+        revealed.append(asyncio.run(source.next_seed(db))["server_seed"])
+
+
+def test_checkpoints_are_published_once_their_chunk_is_played_out(db):
+    chain = asyncio.run(create_chain(db, length=LENGTH))
+    source = CrashSeedChain()
+
+    # 35 seeds in chunks [0, 10) [10, 20) [20, 30) [30, 35); play the last chunk and one more seed
+    for _ in range(LENGTH - 30 + 1):
+        asyncio.run(source.next_seed(db))
+
+    public = public_chain(stored_chain(db, chain["id"]))
+    assert [c["chunk_index"] for c in public["checkpoints"]] == [3]
+    assert public["remaining"] == 29
+
+
+def test_played_rounds_verify_against_the_public_commitments(db):
+    asyncio.run(create_chain(db, length=LENGTH))
+    source = CrashSeedChain()
+    played = [asyncio.run(source.next_seed(db)) for _ in range(CHUNK + 3)]
+
+    for p in (played[0], played[CHUNK - 1], played[-1]):
+        assert asyncio.run(verify_round(db, p))["valid"] is True
+
+    forged = {**played[-1], "server_seed": sha256(b"forged").hex()}
+    assert asyncio.run(verify_round(db, forged))["valid"] is False
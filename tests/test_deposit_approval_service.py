@@ -0,0 +1,168 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from services.deposit_approval_service import (
+    CLAIM_FIELD,
+    STAMP_TAKEN,
+    approve_deposits_batch,
+    credit_key,
+    recover_lapsed_deposits,
+)
+from services.index_service import apply_indexes
+from services.time_service import pk_date_str
+from services.wallet_service import APPLIED_FIELD, debit_bet
+
+T0 = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def setup(db, *deposits, **user):
+    async def run():
+        await db.users.insert_one(
+            {"id": "u1", "ledger_seq": 0, "wallet_balance": 10_000, "locked_balance": 0, "bonus_balance": 0, **user}
+        )
+        if deposits:
+            await db.deposits.insert_many([dict(d) for d in deposits])
+
+    asyncio.run(run())
+
+
+def deposit(id, amount, promotion_key=None, multiplier=3.0, minutes=0, user_id="u1", **fields):
+    return {
+        "id": id,
+        "user_id": user_id,
+        "amount": amount,
+        "promotion_key": promotion_key,
+        "deposit_wagering_multiplier": multiplier,
+        "jazzcash_number": "03001234567",
+        "status": "pending",
+        "created_at": T0 + timedelta(minutes=minutes),
+        **fields,
+    }
+
+
+def approve(db, *ids, stamps=None):
+    return asyncio.run(approve_deposits_batch(db, list(ids), "admin", stamps))
+
+
+def user(db):
+    return asyncio.run(db.users.find_one({"id": "u1"}))
+
+
+def deposits(db):
+    return {d["id"]: d for d in asyncio.run(db.deposits.find({}).to_list(None))}
+
+
+def test_deposits_are_credited_in_order_with_running_balances(db):
+    setup(db, deposit("d2", 20_000, minutes=1), deposit("d1", 50_000))
+
+    results = approve(db, "d1", "d2")
+
+    assert [r["status"] for r in results] == ["approved", "approved"]
+    assert (user(db)["wallet_balance"], user(db)["total_deposits"]) == (80_000, 70_000)
+    txns = asyncio.run(db.transactions.find({"user_id": "u1"}).sort("balance_after", 1).to_list(None))
+    assert [(t["balance_before"], t["balance_after"]) for t in txns] == [(10_000, 60_000), (60_000, 80_000)]
+    entries = asyncio.run(db.ledger_entries.find({"user_id": "u1"}).sort("seq", 1).to_list(None))
+    assert [(e["seq"], e["ref_id"], e["balances_after"]["wallet_balance"]) for e in entries] == [
+        (1, "d1", 60_000),
+        (2, "d2", 80_000),
+    ]
+    assert all(d["status"] == "approved" and CLAIM_FIELD not in d for d in deposits(db).values())
+
+
+def test_daily_bonus_applies_once_per_day(db):
+    setup(
+        db,
+        deposit("d1", 50_000, "daily_first_deposit_8", multiplier=4.0),
+        deposit("d2", 50_000, "daily_first_deposit_8", minutes=1),
+    )
+
+    results = approve(db, "d1", "d2")
+
+    assert [r["bonus_amount"] for r in results] == [4_000, 0]
+    assert (user(db)["wallet_balance"], user(db)["bonus_balance"]) == (114_000, 4_000)
+    assert user(db)["daily_first_deposit_bonus_last_date"] == pk_date_str()
+    wagering = asyncio.run(db.wagering.find({"user_id": "u1"}).to_list(None))
+    assert sorted((w["source_id"], w["target_amount"]) for w in wagering) == [
+        ("d1", 200_000),
+        ("d1:bonus", 140_000),
+        ("d2", 150_000),
+    ]
+
+
+def test_daily_bonus_already_taken_today_is_not_paid(db):
+    setup(db, deposit("d1", 50_000, "daily_first_deposit_8"), daily_first_deposit_bonus_last_date=pk_date_str())
+
+    assert approve(db, "d1")[0]["bonus_amount"] == 0
+    assert user(db)["bonus_balance"] == 0
+
+
+def test_user_whose_balance_moved_is_credited_once_per_deposit(db, before_first):
+    setup(db, deposit("d1", 50_000), deposit("d2", 20_000, minutes=1))
+
+    async def concurrent_bet():
+        # Lands between the batch's read of the user and its guarded write
+        await debit_bet(db, "u1", 1_000, ref_id="b1")
+
+    before_first(db.users, "bulk_write", concurrent_bet)
+
+    results = approve(db, "d1", "d2")
+
+    assert [r["status"] for r in results] == ["approved", "approved"]
+    assert user(db)["wallet_balance"] == 79_000
+    assert asyncio.run(db.ledger_entries.count_documents({"user_id": "u1"})) == 3
+
+
+def test_processed_deposits_are_skipped(db):
+    setup(db, deposit("d1", 50_000))
+    approve(db, "d1")
+
+    results = approve(db, "d1", "missing")
+
+    assert [r["status"] for r in results] == ["skipped", "skipped"]
+    assert user(db)["wallet_balance"] == 60_000
+
+
+def test_reference_that_settled_another_deposit_is_refused(db):
+    asyncio.run(apply_indexes(db))
+    setup(db, deposit("d1", 50_000), deposit("d2", 50_000, minutes=1))
+    approve(db, "d1", stamps={"d1": {"statement_ref": "T1"}})
+
+    # A second upload carrying the same payment for another deposit
+    results = approve(db, "d2", stamps={"d2": {"statement_ref": "T1"}})
+
+    assert (results[0]["status"], results[0]["detail"]) == ("skipped", STAMP_TAKEN)
+    assert user(db)["wallet_balance"] == 60_000
+    d2 = deposits(db)["d2"]
+    assert (d2["status"], d2.get("statement_ref")) == ("pending", None)
+
+
+def test_failed_approval_returns_the_deposit_and_its_reference(db):
+    asyncio.run(apply_indexes(db))
+    setup(db, deposit("d1", 50_000, user_id="gone"))
+
+    results = approve(db, "d1", stamps={"d1": {"statement_ref": "T1"}})
+
+    assert results[0]["status"] == "failed"
+    d1 = deposits(db)["d1"]
+    assert (d1["status"], d1.get("statement_ref"), d1.get(CLAIM_FIELD)) == ("pending", None, None)
+
+
+def test_lapsed_approval_is_settled_from_the_credit_keys(db):
+    lapsed = {"token": "dead", "by": "admin", "expires_at": T0}
+    stamped = {**lapsed, "stamped": ["statement_ref"]}
+    setup(
+        db,
+        deposit("d1", 50_000, status="processing", **{CLAIM_FIELD: lapsed}),
+        deposit("d2", 20_000, status="processing", statement_ref="T2", **{CLAIM_FIELD: stamped}),
+        # The dead approval credited d1 but not d2
+        wallet_balance=60_000,
+        **{APPLIED_FIELD: [credit_key("d1")]},
+    )
+
+    assert asyncio.run(recover_lapsed_deposits(db)) == {"approved": 1, "returned": 1}
+
+    d1, d2 = deposits(db)["d1"], deposits(db)["d2"]
+    assert (d1["status"], bool(d1.get("recovered_at"))) == ("approved", True)
+    assert (d2["status"], d2.get("statement_ref")) == ("pending", None)
+    assert approve(db, "d2")[0]["status"] == "approved"
+    assert user(db)["wallet_balance"] == 80_000
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services import ledger_service
+from services.ledger_service import balance_at, ledger_replay
+from services.wallet_service import apply_balance_change
+
+T0 = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Ledger entries stamped one minute apart from T0; snapshots every 3 entries."""
+    ticks = iter(range(10_000))
+    monkeypatch.setattr(ledger_service, "_now", lambda: T0 + timedelta(minutes=next(ticks)))
+    monkeypatch.setattr(ledger_service, "SNAPSHOT_EVERY", 3)
+
+
+def play(db, *deltas):
+    """Apply wallet deltas to u1 (opening balance 1000), letting snapshot writes land."""
+
+    async def run():
+        await db.users.insert_one({"id": "u1", "wallet_balance": 1000, "locked_balance": 0, "bonus_balance": 0})
+        for n, delta in enumerate(deltas):
+            await apply_balance_change(db, "u1", {"wallet_balance": delta}, kind="bet", ref_id=f"b{n}")
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+
+def wallet_at(db, minutes):
+    result = asyncio.run(balance_at(db, "u1", T0 + timedelta(minutes=minutes, seconds=30)))
+    return result and result["balances"]["wallet_balance"]
+
+
+def test_balance_at_replays_entries_after_the_nearest_snapshot(db):
+    # Entry n is stamped at minute n; snapshots at seq 0 (opening) and seq 3
+    play(db, -100, +300, -50, -200, +25)
+
+    assert [wallet_at(db, m) for m in range(5)] == [900, 1200, 1150, 950, 975]
+    result = asyncio.run(balance_at(db, "u1", T0 + timedelta(minutes=4, seconds=30)))
+    assert (result["snapshot_seq"], result["replayed_entries"], result["seq"]) == (3, 2, 5)
+
+
+def test_balance_before_the_ledger_starts_is_unknown(db):
+    play(db, -100)
+
+    assert asyncio.run(balance_at(db, "u1", T0 - timedelta(minutes=1))) is None
+
+
+def test_failed_entry_write_is_replayed_once(db, before_first):
+    async def fail():
+        raise RuntimeError("primary stepped down")
+
+    before_first(db.ledger_entries, "insert_many", fail)
+    # The balance change commits even though its ledger entry does not
+    play(db, -100, +300)
+
+    assert ledger_replay.pending() == 1
+    assert asyncio.run(db.ledger_entries.count_documents({"user_id": "u1"})) == 1
+
+    asyncio.run(ledger_replay.replay(db))
+    # The same entry queued again (its first write had landed after all) is not duplicated
+    entry = asyncio.run(db.ledger_entries.find_one({"user_id": "u1", "seq": 1}, {"_id": 0}))
+    ledger_replay.enqueue(db, [entry])
+    asyncio.run(ledger_replay.replay(db))
+
+    assert ledger_replay.pending() == 0
+    assert asyncio.run(db.ledger_entries.count_documents({"user_id": "u1"})) == 2
+    assert [wallet_at(db, m) for m in range(2)] == [900, 1200]
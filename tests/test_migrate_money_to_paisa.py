@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+import migrate_money_to_paisa as migration
+from money import MONEY_MIGRATION_ID
+
+
+@pytest.fixture
+def run(db, monkeypatch):
+    """run(): one run of the migration script against `db`."""
+    monkeypatch.setenv("MONGO_URL", "mongodb://test")
+    monkeypatch.setenv("DB_NAME", db.name)
+    monkeypatch.setattr(migration, "AsyncIOMotorClient", lambda url, tz_aware: db.client)
+    return lambda batch_size=2: asyncio.run(migration.migrate(batch_size, 0))
+
+
+def seed(db):
+    async def go():
+        await db.users.insert_many(
+            [
+                # Floats from the models and integers set by hand are both rupees
+                {"id": "u1", "wallet_balance": 150.5, "locked_balance": 0.0, "bonus_balance": 12, "total_bets": 1000},
+                {"id": "u2", "wallet_balance": 0.1, "locked_balance": 0, "bonus_balance": 0.0},
+                {"id": "u3", "wallet_balance": 99.99, "locked_balance": 0, "bonus_balance": 0},
+            ]
+        )
+        await db.transactions.insert_one({"id": "t1", "amount": 50.25, "metadata": {"bonus_amount": 4}})
+        await db.ledger_entries.insert_one({"user_id": "u1", "seq": 1, "delta": {"wallet_balance": -10.5}})
+
+    asyncio.run(go())
+
+
+def users(db):
+    docs = asyncio.run(db.users.find({}, {"_id": 0}).sort("id", 1).to_list(None))
+    return [(u["wallet_balance"], u["bonus_balance"], u.get("money_unit")) for u in docs]
+
+
+def test_every_amount_is_converted_to_paisa(db, run):
+    seed(db)
+
+    run()
+
+    assert users(db) == [(15_050, 1_200, "paisa"), (10, 0, "paisa"), (9_999, 0, "paisa")]
+    assert asyncio.run(db.users.find_one({"id": "u1"}))["total_bets"] == 100_000
+    txn = asyncio.run(db.transactions.find_one({"id": "t1"}))
+    assert (txn["amount"], txn["metadata"]["bonus_amount"]) == (5_025, 400)
+    entry = asyncio.run(db.ledger_entries.find_one({"seq": 1}))
+    assert entry["delta"] == {"wallet_balance": -1_050}
+    assert asyncio.run(db.migrations.find_one({"id": MONEY_MIGRATION_ID}))["completed_at"]
+
+
+def test_interrupted_run_resumes_without_converting_twice(db, run, before_first):
+    seed(db)
+
+    async def crash():
+        # The first users batch landed; the process dies writing the second
+        raise RuntimeError("connection reset")
+
+    async def first_batch_then_crash():
+        before_first(db.users, "bulk_write", crash)
+
+    before_first(db.users, "bulk_write", first_batch_then_crash)
+    with pytest.raises(RuntimeError):
+        run()
+
+    assert users(db)[:2] == [(15_050, 1_200, "paisa"), (10, 0, "paisa")]
+    assert users(db)[2] == (99.99, 0, None)
+
+    run()
+
+    assert users(db) == [(15_050, 1_200, "paisa"), (10, 0, "paisa"), (9_999, 0, "paisa")]
+
+
+def test_completed_migration_never_runs_again(db, run):
+    seed(db)
+    run()
+    # Written by the paisa backend afterwards: no marker, and already in paisa
+    asyncio.run(db.users.insert_one({"id": "u4", "wallet_balance": 5_000, "locked_balance": 0, "bonus_balance": 0}))
+
+    run()
+
+    assert asyncio.run(db.users.find_one({"id": "u4"}))["wallet_balance"] == 5_000
+    assert users(db)[0] == (15_050, 1_200, "paisa")
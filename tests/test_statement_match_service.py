@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from services.statement_match_service import PendingDepositIndex, stream_records
+
+T0 = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+STATEMENT = (
+    "\ufeffTID,Sender,Amount,Note\r\n"
+    "T1,03001234567,500,plain\r\n"
+    '"T2",03001234567,"1,000","line one\r\nline two, with ""quotes"""\r\n'
+    "\r\n"
+    "T3,03007654321,250,Muhammad Ali محمد علی\n"
+    'T4,03007654321,750,"unterminated'
+).encode("utf-8")
+
+EXPECTED = [
+    (1, ["TID", "Sender", "Amount", "Note"]),
+    (2, ["T1", "03001234567", "500", "plain"]),
+    (3, ["T2", "03001234567", "1,000", 'line one\nline two, with "quotes"']),
+    (6, ["T3", "03007654321", "250", "Muhammad Ali محمد علی"]),
+    (7, ["T4", "03007654321", "750", "unterminated"]),
+]
+
+
+async def _chunks(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def _records(data, size):
+    return [r async for r in stream_records(_chunks(data, size))]
+
+
+def test_stream_records_whole_file():
+    assert asyncio.run(_records(STATEMENT, len(STATEMENT))) == EXPECTED
+
+
+def test_stream_records_any_chunk_boundary():
+    # Splits land inside quoted fields, between \r and \n and inside multi-byte characters
+    for size in range(1, 40):
+        assert asyncio.run(_records(STATEMENT, size)) == EXPECTED, size
+
+
+def deposit(id, minutes, number="03001234567", amount=50_000):
+    return {"id": id, "jazzcash_number": number, "amount": amount, "created_at": T0 + timedelta(minutes=minutes)}
+
+
+def index_of(*deposits, window=timedelta(minutes=30)):
+    index = PendingDepositIndex(window)
+    for d in deposits:
+        index.add(d)
+    return index
+
+
+def test_take_picks_the_closest_deposit_in_the_window():
+    index = index_of(deposit("early", -20), deposit("close", 5), deposit("late", 25))
+
+    assert index.take("03001234567", 50_000, T0)["id"] == "close"
+    assert index.take("03001234567", 50_000, T0)["id"] == "early"
+    assert index.take("03001234567", 50_000, T0)["id"] == "late"
+    assert index.take("03001234567", 50_000, T0) is None
+
+
+def test_take_ignores_deposits_outside_the_window():
+    index = index_of(deposit("before", -31), deposit("after", 31))
+
+    assert index.take("03001234567", 50_000, T0) is None
+
+
+def test_take_finds_deposits_in_neighbouring_buckets():
+    index = index_of(deposit("d", 29), window=timedelta(minutes=30))
+
+    assert index.take("03001234567", 50_000, T0 + timedelta(minutes=58))["id"] == "d"
+
+
+def test_take_matches_number_and_amount_exactly():
+    index = index_of(deposit("d", 0))
+
+    assert index.take("03001234567", 50_001, T0) is None
+    assert index.take("03007654321", 50_000, T0) is None
+    assert index.take("03001234567", 50_000, T0)["id"] == "d"
+
+
+def test_deposits_with_unusable_numbers_are_not_indexed():
+    index = index_of(deposit("d", 0, number="n/a"))
+
+    assert index.size == 0
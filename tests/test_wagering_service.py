@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.wagering_service import (
+    PENDING_FIELD,
+    STALE_PENDING,
+    SUMMARY_FIELD,
+    add_wagering_records,
+    apply_wagering_progress_many,
+    new_wagering_record,
+    wagering_status,
+)
+
+
+def record(source_id, principal, priority, multiplier=1.0, user_id="u1"):
+    return new_wagering_record(user_id, "deposit", source_id, principal, multiplier, priority)
+
+
+def setup(db, *records, user_ids=("u1",)):
+    async def run():
+        await db.users.insert_many([{"id": uid} for uid in user_ids])
+        by_user = {}
+        for r in records:
+            by_user.setdefault(r["user_id"], []).append(r)
+        for uid, recs in by_user.items():
+            await add_wagering_records(db, uid, recs)
+
+    asyncio.run(run())
+
+
+def stored_summary(db, user_id="u1"):
+    user = asyncio.run(db.users.find_one({"id": user_id}))
+    return {k: v for k, v in user[SUMMARY_FIELD].items() if k != "rev"}
+
+
+def wagering(db, user_id="u1"):
+    return {r["source_id"]: r for r in asyncio.run(db.wagering.find({"user_id": user_id}).to_list(None))}
+
+
+def test_new_records_are_summarized_by_priority(db):
+    setup(db, record("late", 1000, priority=2), record("first", 3000, priority=1))
+
+    assert stored_summary(db) == {
+        "active_count": 2,
+        "total_target": 4000,
+        "total_wagered": 0,
+        "remaining": 4000,
+        "next_id": wagering(db)["first"]["id"],
+        "next_priority": 1,
+    }
+    status = asyncio.run(wagering_status(db, "u1"))
+    assert status["can_withdraw"] is False
+    assert not asyncio.run(db.users.find_one({"id": "u1"})).get(PENDING_FIELD)
+
+
+def test_progress_completes_records_in_priority_order(db):
+    setup(db, record("a", 1000, priority=1), record("b", 3000, priority=2))
+
+    statuses = asyncio.run(apply_wagering_progress_many(db, [("u1", 1500), ("u1", 500)]))
+
+    records = wagering(db)
+    assert (records["a"]["status"], records["a"]["wagered_amount"]) == ("completed", 1000)
+    assert (records["b"]["status"], records["b"]["wagered_amount"]) == ("active", 1000)
+    assert stored_summary(db)["remaining"] == 2000
+    assert statuses["u1"]["remaining"] == 2000
+    assert statuses["u1"]["next_record_id"] == records["b"]["id"]
+
+
+def test_progress_retries_the_part_that_lost_a_race(db, before_first):
+    setup(db, record("a", 2000, priority=1), record("b", 5000, priority=2))
+
+    async def concurrent_bet():
+        # Another worker applies 500 to "a" between our read and our write
+        await db.wagering.update_one({"source_id": "a"}, {"$set": {"wagered_amount": 500, "version": "other"}})
+
+    before_first(db.wagering, "bulk_write", concurrent_bet)
+
+    statuses = asyncio.run(apply_wagering_progress_many(db, [("u1", 3000)]))
+
+    # First attempt: "b" lands 1000, "a" loses; the retry spreads the other 2000 over
+    # fresh state: 1500 completes "a", 500 more goes to "b"
+    records = wagering(db)
+    assert (records["a"]["status"], records["a"]["wagered_amount"]) == ("completed", 2000)
+    assert records["b"]["wagered_amount"] == 1500
+    assert stored_summary(db)["remaining"] == 3500
+    assert statuses["u1"]["total_wagered"] == 1500
+
+
+def test_summary_refresh_that_read_older_records_loses(db, before_first):
+    setup(db, record("a", 2000, priority=1))
+
+    async def concurrent_progress():
+        # Between our summary read and write, another worker completes "a" and lands its refresh
+        await db.wagering.update_one({"source_id": "a"}, {"$set": {"status": "completed", "wagered_amount": 2000}})
+        await db.users.update_one({"id": "u1"}, {"$set": {f"{SUMMARY_FIELD}.rev": "other"}})
+
+    before_first(db.users, "bulk_write", concurrent_progress)
+
+    asyncio.run(apply_wagering_progress_many(db, [("u1", 100)]))
+
+    assert stored_summary(db)["active_count"] == 0
+    assert stored_summary(db)["remaining"] == 0
+
+
+def test_failed_refresh_blocks_withdrawal_until_repaired(db, before_first):
+    setup(db, record("a", 2000, priority=1))
+
+    async def fail():
+        raise RuntimeError("primary stepped down")
+
+    # The records write lands, then the summary refresh fails
+    before_first(db.users, "bulk_write", fail)
+    with pytest.raises(RuntimeError):
+        asyncio.run(apply_wagering_progress_many(db, [("u1", 2000)]))
+
+    # The record completed, the summary still says 2000 to go, and the write is flagged
+    assert wagering(db)["a"]["status"] == "completed"
+    assert stored_summary(db)["remaining"] == 2000
+    assert asyncio.run(wagering_status(db, "u1"))["can_withdraw"] is False
+
+    # Once the flag is stale the next status read rebuilds the summary from the records
+    stale = datetime.now(timezone.utc) - STALE_PENDING - timedelta(seconds=1)
+    asyncio.run(db.users.update_one({"id": "u1"}, {"$set": {f"{PENDING_FIELD}.0.at": stale}}))
+    status = asyncio.run(wagering_status(db, "u1"))
+
+    assert status["can_withdraw"] is True
+    assert stored_summary(db)["remaining"] == 0
+    assert not asyncio.run(db.users.find_one({"id": "u1"}))[PENDING_FIELD]
+
+
+def test_users_without_a_summary_get_one(db):
+    asyncio.run(db.users.insert_one({"id": "u1"}))
+    asyncio.run(db.wagering.insert_one(record("a", 1000, priority=1)))
+
+    status = asyncio.run(wagering_status(db, "u1"))
+
+    assert status["remaining"] == 1000
+    assert stored_summary(db)["active_count"] == 1
+
+
+def test_progress_for_users_without_records_is_a_no_op(db, caplog):
+    setup(db)
+
+    with caplog.at_level(logging.WARNING):
+        statuses = asyncio.run(apply_wagering_progress_many(db, [("u1", 1000)]))
+
+    assert statuses["u1"]["can_withdraw"] is True
+    assert not caplog.records
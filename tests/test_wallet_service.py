@@ -0,0 +1,96 @@
+import asyncio
+
+from pymongo.errors import BulkWriteError
+
+from services.wallet_service import apply_balance_change, apply_balance_changes_many
+
+
+def setup(db, **balances):
+    async def run():
+        await db.users.insert_many(
+            [{"id": uid, "wallet_balance": amount, "locked_balance": 0, "bonus_balance": 0, "ledger_seq": 0}
+             for uid, amount in balances.items()]
+        )
+
+    asyncio.run(run())
+
+
+def wallet(db, user_id):
+    return asyncio.run(db.users.find_one({"id": user_id}))["wallet_balance"]
+
+
+def ledger(db, user_id):
+    entries = asyncio.run(db.ledger_entries.find({"user_id": user_id}).sort("seq", 1).to_list(None))
+    return [(e["seq"], e["kind"], e["ref_id"], e["balances_after"]["wallet_balance"]) for e in entries]
+
+
+def win(user_id, amount, bet_id):
+    return (user_id, {"wallet_balance": amount, "total_wins": amount}, "win", bet_id)
+
+
+def test_changes_are_applied_with_a_ledger_entry_each(db):
+    setup(db, u1=1000, u2=0)
+
+    changes = [win("u1", 500, "b1"), win("u2", 300, "b2"), win("u1", 200, "b3")]
+    failed = asyncio.run(apply_balance_changes_many(db, changes))
+
+    assert failed == []
+    assert (wallet(db, "u1"), wallet(db, "u2")) == (1700, 300)
+    assert ledger(db, "u1") == [(1, "win", "b1", 1500), (2, "win", "b3", 1700)]
+    assert ledger(db, "u2") == [(1, "win", "b2", 300)]
+
+
+def test_user_whose_balance_moved_is_settled_change_by_change(db, before_first):
+    setup(db, u1=1000, u2=0)
+
+    async def concurrent_bet():
+        # Lands between the batch's read and its write: u1's ledger_seq no longer matches
+        await apply_balance_change(db, "u1", {"wallet_balance": -400}, kind="bet", ref_id="other")
+
+    before_first(db.users, "bulk_write", concurrent_bet)
+
+    changes = [win("u1", 500, "b1"), win("u2", 300, "b2"), win("u1", 200, "b3")]
+    failed = asyncio.run(apply_balance_changes_many(db, changes))
+
+    assert failed == []
+    assert (wallet(db, "u1"), wallet(db, "u2")) == (1300, 300)
+    assert ledger(db, "u1") == [(1, "bet", "other", 600), (2, "win", "b1", 1100), (3, "win", "b3", 1300)]
+    assert ledger(db, "u2") == [(1, "win", "b2", 300)]
+
+
+def test_write_that_landed_but_reported_an_error_is_not_applied_again(db, monkeypatch):
+    setup(db, u1=1000)
+    cls = type(db.users)
+    original = cls.bulk_write
+
+    async def lands_then_fails(self, *args, **kwargs):
+        await original(self, *args, **kwargs)
+        raise BulkWriteError({"writeErrors": [], "writeConcernErrors": [{"errmsg": "timeout"}]})
+
+    monkeypatch.setattr(cls, "bulk_write", lands_then_fails)
+
+    failed = asyncio.run(apply_balance_changes_many(db, [win("u1", 500, "b1"), win("u1", 200, "b2")]))
+
+    assert failed == []
+    assert wallet(db, "u1") == 1700
+    assert [seq for seq, *_ in ledger(db, "u1")] == [1, 2]
+
+
+def test_changes_for_missing_users_are_reported(db):
+    setup(db, u1=1000)
+
+    failed = asyncio.run(apply_balance_changes_many(db, [win("u1", 500, "b1"), win("gone", 300, "b2")]))
+
+    assert failed == [("gone", "b2", "User not found")]
+    assert wallet(db, "u1") == 1500
+
+
+def test_keyed_change_applies_once(db):
+    setup(db, u1=1000)
+
+    first = asyncio.run(apply_balance_change(db, "u1", {"wallet_balance": 500}, kind="refund", once="refund:b1"))
+    again = asyncio.run(apply_balance_change(db, "u1", {"wallet_balance": 500}, kind="refund", once="refund:b1"))
+
+    assert first["wallet_balance"] == 1500
+    assert again is None
+    assert wallet(db, "u1") == 1500